@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+Delivery analytics.
+
+- parse_amount / parse_seconds: best-effort numbers out of the free-text /log_delivery fields;
+  typed_fields() adds them to a record (tip, duration_s, epoch) at ingestion.
+- DeliveryStats: per-day, per-user aggregates (count, tip total, duration total, by method)
+  kept in the store's "delivery_stats" kv collection (one row per day, so logging a delivery
+  only rewrites its day and the all-time row) and updated as deliveries are logged, so stats
+  and leaderboards never scan the delivery history. rebuild() recomputes them.
+- ColumnStore: the delivery history as fixed-width column files (analytics/*.bin) for
+  filter / group-by over user, pickup, method and time range. Uses NumPy (memory-mapped,
+  vectorized) when installed, the stdlib array module otherwise.
+
+CLI:  python analytics.py build              (rebuild the columns from the delivery history)
+      python analytics.py report --month 2025-06 --by pickup
+      python analytics.py export --out deliveries.csv [--since 2025-06-01] [--until ...] [--user ID]
+"""
+
+import os, re, sys, csv, time, array, argparse
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+
+from storage import StateStore, PersistWorker, DEFAULT_PATHS, make_backend, load_json, save_json
+
+try:
+    import numpy as np
+except ImportError:  # optional: queries fall back to plain loops over array.array columns
+    np = None
+
+STATS = "delivery_stats"  # store kv collection: {"YYYY-MM-DD" | "all": {user_id: aggregate}}
+ALL = "all"
+
+# "1,500" / "1,500.50": comma thousands; "2,50" / "1,5": decimal comma (only one or two digits after it)
+_NUM_RE = re.compile(r"-?(?:\d{1,3}(?:,\d{3})+(?!\d)(?:\.\d+)?|\d+(?:\.\d+|,\d{1,2}(?!\d))?)")
+_THOUSANDS_RE = re.compile(r"-?\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+_DUR_NUM = r"\d+(?:[.,]\d+)?"
+# a number or a range ("15-20", "15 to 20"), then an optional unit
+_DUR_RE = re.compile(rf"({_DUR_NUM})(?:\s*(?:-|–|to)\s*({_DUR_NUM}))?\s*(h|hr|hrs|hours?|m|min|mins|minutes?|s|sec|secs|seconds?)?(?![a-z])", re.I)
+_NO_TIP = {"", "no", "none", "n/a", "na", "nope", "0", "-"}
+
+def _num(s: str) -> float:
+    if _THOUSANDS_RE.fullmatch(s): return float(s.replace(",", ""))
+    return float(s.replace(",", "."))
+
+def parse_amount(text: Optional[str]) -> float:
+    """'$5', '5 robux', '2.50', '2,50', '$1,500' -> the first number; 'no' / empty -> 0."""
+    t = (text or "").strip().lower()
+    if t in _NO_TIP: return 0.0
+    m = _NUM_RE.search(t)
+    return _num(m.group(0)) if m else 0.0
+
+def parse_seconds(text: Optional[str]) -> int:
+    """'15m', '1h 5m', '20 minutes', '90s' -> seconds; '15-20 min' -> the midpoint.
+
+    Only number-and-unit pairs are added up; a bare number ('20') is minutes, and only
+    counts when the text has no units at all.
+    """
+    pairs = _DUR_RE.findall(text or "")
+    if not pairs: return 0
+    if any(unit for _, _, unit in pairs): pairs = [p for p in pairs if p[2]]
+    else: pairs = pairs[:1]
+    total = 0.0
+    for lo, hi, unit in pairs:
+        n = (_num(lo) + _num(hi)) / 2 if hi else _num(lo)
+        u = (unit or "m").lower()
+        total += n * (3600 if u.startswith("h") else 1 if u.startswith("s") else 60)
+    return int(round(total))
+
+def parse_minutes(text: Optional[str]) -> float:
+    return round(parse_seconds(text) / 60, 2)
+
+def to_epoch(ts: Optional[str]) -> int:
+    try:
+        dt = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return 0
+    return int((dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp())
+
+def typed_fields(rec: Dict[str, Any]) -> Dict[str, Any]:
+    """Numeric tip, duration in seconds and UTC epoch for a delivery (existing typed values win)."""
+    return {
+        "tip": float(rec["tip"]) if rec.get("tip") is not None else parse_amount(rec.get("tipped")),
+        "duration_s": int(rec["duration_s"]) if rec.get("duration_s") is not None else parse_seconds(rec.get("duration")),
+        "epoch": int(rec["epoch"]) if rec.get("epoch") else to_epoch(rec.get("ts")),
+    }
+
+def _empty() -> Dict[str, Any]:
+    return {"n": 0, "tips": 0.0, "minutes": 0.0, "methods": {}}
+
+def _add(agg: Dict[str, Any], other: Dict[str, Any]):
+    agg["n"] += other["n"]
+    agg["tips"] = round(agg["tips"] + other["tips"], 2)
+    agg["minutes"] = round(agg["minutes"] + other["minutes"], 2)
+    for m, c in other["methods"].items(): agg["methods"][m] = agg["methods"].get(m, 0) + c
+
+def _key(text: Optional[str]) -> str:
+    return (text or "").strip().lower()[:50] or "unknown"
+
+def _one(rec: Dict[str, Any]) -> Dict[str, Any]:
+    t = typed_fields(rec)
+    return {"n": 1, "tips": t["tip"], "minutes": round(t["duration_s"] / 60, 2), "methods": {_key(rec.get("method")): 1}}
+
+def day_of(rec: Dict[str, Any]) -> str:
+    return (rec.get("ts") or datetime.now(timezone.utc).isoformat())[:10]
+
+def period_days(period: str, now: Optional[datetime] = None) -> Optional[List[str]]:
+    """Day keys covered by a period ("today" / "week" / "month"); None for all time."""
+    if period == ALL: return None
+    span = {"today": 1, "week": 7, "month": 30}[period]
+    today = (now or datetime.now(timezone.utc)).date()
+    return [(today - timedelta(days=i)).isoformat() for i in range(span)]
+
+class DeliveryStats:
+    def __init__(self, store: StateStore):
+        self.store = store
+        self._rebuilding: Optional[List[Dict[str, Any]]] = None
+
+    def _bump(self, key: str, uid: str, one: Dict[str, Any]):
+        # copy-on-write: a flush in flight may be serialising the stored row on the writer thread
+        day = self.store.kv_get(STATS, key) or {}
+        old = day.get(uid)
+        agg = {**old, "methods": dict(old["methods"])} if old else _empty()
+        _add(agg, one)
+        self.store.kv_set(STATS, key, {**day, uid: agg})  # marks only this day (and "all") dirty
+
+    def add(self, rec: Dict[str, Any]):
+        """Fold one delivery into its day and the all-time totals. Call alongside store.add_delivery()."""
+        one, uid = _one(rec), str(rec["user"])
+        self._bump(day_of(rec), uid, one)
+        self._bump(ALL, uid, one)
+        if self._rebuilding is not None: self._rebuilding.append(rec)
+
+    def _sum(self, period: str, uid: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        days = period_days(period)
+        if days is None: return self.store.kv_get(STATS, ALL) or {}
+        out: Dict[str, Dict[str, Any]] = {}
+        for d in days:
+            for u, agg in (self.store.kv_get(STATS, d) or {}).items():
+                if uid is None or u == uid: _add(out.setdefault(u, _empty()), agg)
+        return out
+
+    def user(self, uid: int, period: str = "week") -> Dict[str, Any]:
+        return self._sum(period, str(uid)).get(str(uid)) or _empty()
+
+    def leaderboard(self, period: str = "week", by: str = "n", limit: int = 10) -> List[Tuple[int, Dict[str, Any]]]:
+        rows = sorted(self._sum(period).items(), key=lambda kv: (kv[1][by], kv[1]["n"]), reverse=True)
+        return [(int(u), agg) for u, agg in rows[:limit]]
+
+    # ------------------------------------------------------------------ rebuild
+    @staticmethod
+    def compute(records: Iterable[Dict[str, Any]], since: str = "") -> Tuple[Dict[str, Dict[str, Any]], set]:
+        """Blocking: aggregate a full delivery history. Returns ({day | "all": {uid: agg}}, (user, ts) seen at/after `since`)."""
+        out: Dict[str, Dict[str, Any]] = {}
+        seen = set()
+        for rec in records:
+            if "user" not in rec: continue
+            one, uid = _one(rec), str(rec["user"])
+            _add(out.setdefault(day_of(rec), {}).setdefault(uid, _empty()), one)
+            _add(out.setdefault(ALL, {}).setdefault(uid, _empty()), one)
+            if (rec.get("ts") or "") >= since: seen.add((uid, rec.get("ts")))
+        return out, seen
+
+    async def rebuild(self) -> int:
+        """Recompute every aggregate from the delivery history on the store's writer thread."""
+        self._rebuilding = []
+        since = datetime.now(timezone.utc).isoformat()
+        try:
+            agg, seen = await self.store.worker.call(lambda: self.compute(self.store.iter_deliveries(), since))
+            # deliveries logged while the history was being read may or may not be in it
+            late = [r for r in self._rebuilding if (str(r["user"]), r.get("ts")) not in seen]
+        finally:
+            self._rebuilding = None
+        for key in list(self.store.kv[STATS]):
+            if key not in agg: self.store.kv_del(STATS, key)
+        for key, rows in agg.items(): self.store.kv_set(STATS, key, rows)
+        for r in late: self.add(r)
+        return sum(a["n"] for a in agg.get(ALL, {}).values()) + len(late)
+
+# --------------------------------------------------------------------------------------
+# Columnar store
+# --------------------------------------------------------------------------------------
+# column -> array typecode; numpy reads the same bytes with the matching native dtype
+COLUMNS = {"epoch": "q", "user": "Q", "tip": "d", "duration_s": "q", "pickup": "I", "method": "I"}
+_NP_DTYPES = {"q": "=i8", "Q": "=u8", "d": "=f8", "I": "=u4"}
+CODED = ("pickup", "method")  # dictionary-encoded string columns (codes index strings.json)
+GROUPS = ("user", "pickup", "method", "day")
+
+class ColumnStore:
+    """
+    analytics/<column>.bin, one fixed-width value per delivery, appended in log order.
+    Row i of every column is the same delivery. pickup / method are stored as codes into
+    strings.json (lower-cased, trimmed). A torn append (crash between files) is repaired on
+    open by truncating every column to the shortest one.
+
+    Appends go through the persist worker when one is given (the bot); the CLI calls
+    write() directly.
+    """
+
+    def __init__(self, root: str, worker: Optional[PersistWorker] = None):
+        self.root = root
+        self.worker = worker
+        self._buf: List[Dict[str, Any]] = []
+        self._strings: Optional[Dict[str, List[str]]] = None
+        self._codes: Dict[str, Dict[str, int]] = {}
+
+    def path(self, col: str) -> str:
+        return os.path.join(self.root, f"{col}.bin")
+
+    def _load_strings(self):
+        if self._strings is not None: return
+        self._strings = load_json(os.path.join(self.root, "strings.json"), {c: [] for c in CODED})
+        self._codes = {c: {v: i for i, v in enumerate(self._strings.get(c, []))} for c in CODED}
+
+    def _code(self, col: str, value: Optional[str]) -> int:
+        v = _key(value)
+        code = self._codes[col].get(v)
+        if code is None:
+            code = self._codes[col][v] = len(self._strings[col])
+            self._strings[col].append(v)
+        return code
+
+    def rows(self) -> int:
+        sizes = [os.path.getsize(self.path(c)) // array.array(t).itemsize if os.path.exists(self.path(c)) else 0
+                 for c, t in COLUMNS.items()]
+        return min(sizes)
+
+    def repair(self) -> int:
+        n = self.rows()
+        for c, t in COLUMNS.items():
+            p = self.path(c)
+            if os.path.exists(p) and os.path.getsize(p) != n * array.array(t).itemsize:
+                with open(p, "r+b") as f: f.truncate(n * array.array(t).itemsize)
+        return n
+
+    # ------------------------------------------------------------------ writes
+    def add(self, rec: Dict[str, Any]):
+        """Queue one delivery (bot side); the worker appends batches."""
+        self._buf.append(rec)
+        if self.worker: self.worker.submit("analytics_columns", self._flush)
+
+    async def _flush(self):
+        recs, self._buf = self._buf, []
+        if recs: await self.worker.call(self.write, recs)
+
+    def write(self, recs: Iterable[Dict[str, Any]]) -> int:
+        """Blocking: append records to every column. Strings first, so codes always resolve."""
+        os.makedirs(self.root, exist_ok=True)
+        self._load_strings()
+        cols = {c: array.array(t) for c, t in COLUMNS.items()}
+        n_strings = sum(len(v) for v in self._strings.values())
+        for rec in recs:
+            if "user" not in rec: continue
+            t = typed_fields(rec)
+            cols["epoch"].append(t["epoch"]); cols["user"].append(int(rec["user"]))
+            cols["tip"].append(t["tip"]); cols["duration_s"].append(t["duration_s"])
+            for c in CODED: cols[c].append(self._code(c, rec.get(c)))
+        if sum(len(v) for v in self._strings.values()) != n_strings:
+            save_json(os.path.join(self.root, "strings.json"), self._strings)
+        for c, a in cols.items():
+            with open(self.path(c), "ab") as f: a.tofile(f)
+        return len(cols["epoch"])
+
+    def rebuild(self, records: Iterable[Dict[str, Any]], chunk: int = 20000) -> int:
+        """Blocking: replace the columns with `records` (the full delivery history, in log order)."""
+        os.makedirs(self.root, exist_ok=True)
+        for c in COLUMNS:
+            if os.path.exists(self.path(c)): os.remove(self.path(c))
+        self._strings = {c: [] for c in CODED}; self._codes = {c: {} for c in CODED}
+        save_json(os.path.join(self.root, "strings.json"), self._strings)
+        n, batch = 0, []
+        for rec in records:
+            batch.append(rec)
+            if len(batch) >= chunk: n += self.write(batch); batch = []
+        return n + self.write(batch)
+
+    # ------------------------------------------------------------------ reads
+    def columns(self) -> Dict[str, Any]:
+        """Every column as a numpy array (memory-mapped) or array.array, all the same length."""
+        n = self.repair()
+        out = {}
+        for c, t in COLUMNS.items():
+            if np is not None:
+                out[c] = np.memmap(self.path(c), dtype=_NP_DTYPES[t], mode="r", shape=(n,)) if n else np.zeros(0, _NP_DTYPES[t])
+            else:
+                a = array.array(t)
+                if n:
+                    with open(self.path(c), "rb") as f: a.fromfile(f, n)
+                out[c] = a
+        return out
+
+    def _lookup(self, col: str, value: Optional[str]) -> Optional[int]:
+        self._load_strings()
+        return self._codes[col].get(_key(value)) if value is not None else None
+
+    def label(self, group: str, key: int) -> str:
+        self._load_strings()
+        if group in CODED: return self._strings[group][key]
+        if group == "day": return datetime.fromtimestamp(int(key) * 86400, timezone.utc).date().isoformat()
+        return str(key)
+
+    def _mask(self, cols: Dict[str, Any], since: Optional[int], until: Optional[int],
+              user: Optional[int], pickup: Optional[str], method: Optional[str]):
+        """Row filter as a numpy bool array, or a list of row indexes without numpy. None = no rows match."""
+        codes = {c: self._lookup(c, v) for c, v in (("pickup", pickup), ("method", method))}
+        if any(v is not None and codes[c] is None for c, v in (("pickup", pickup), ("method", method))): return None
+        conds = [(cols["epoch"], ">=", since), (cols["epoch"], "<", until), (cols["user"], "==", user),
+                 (cols["pickup"], "==", codes["pickup"]), (cols["method"], "==", codes["method"])]
+        conds = [c for c in conds if c[2] is not None]
+        if np is not None:
+            m = np.ones(len(cols["epoch"]), dtype=bool)
+            for col, op, v in conds:
+                m &= (col >= v) if op == ">=" else (col < v) if op == "<" else (col == v)
+            return m
+        ops = {">=": lambda a, b: a >= b, "<": lambda a, b: a < b, "==": lambda a, b: a == b}
+        return [i for i in range(len(cols["epoch"])) if all(ops[op](col[i], v) for col, op, v in conds)]
+
+    def query(self, group: str = "user", since: Optional[int] = None, until: Optional[int] = None,
+              user: Optional[int] = None, pickup: Optional[str] = None, method: Optional[str] = None
+              ) -> List[Tuple[str, int, float, int]]:
+        """[(group label, deliveries, tip total, duration seconds total)] for matching rows, most deliveries first."""
+        cols = self.columns()
+        m = self._mask(cols, since, until, user, pickup, method)
+        if m is None: return []
+        if np is not None:
+            keys = (cols["epoch"][m] // 86400) if group == "day" else cols[group][m]
+            if not len(keys): return []
+            uniq, inv = np.unique(keys, return_inverse=True)
+            n = np.bincount(inv)
+            tips = np.bincount(inv, weights=cols["tip"][m])
+            dur = np.bincount(inv, weights=cols["duration_s"][m])
+            rows = [(int(k), int(c), round(float(t), 2), int(d)) for k, c, t, d in zip(uniq, n, tips, dur)]
+        else:
+            acc: Dict[int, List[float]] = {}
+            for i in m:
+                k = cols["epoch"][i] // 86400 if group == "day" else cols[group][i]
+                a = acc.setdefault(k, [0, 0.0, 0])
+                a[0] += 1; a[1] += cols["tip"][i]; a[2] += cols["duration_s"][i]
+            rows = [(k, a[0], round(a[1], 2), a[2]) for k, a in acc.items()]
+        rows.sort(key=lambda r: (-r[1], r[0]))
+        return [(self.label(group, k), c, t, d) for k, c, t, d in rows]
+
+    def export_csv(self, out, since: Optional[int] = None, until: Optional[int] = None,
+                   user: Optional[int] = None, pickup: Optional[str] = None, method: Optional[str] = None) -> int:
+        cols = self.columns()
+        m = self._mask(cols, since, until, user, pickup, method)
+        w = csv.writer(out)
+        w.writerow(["ts", "user", "tip", "duration_s", "pickup", "method"])
+        if m is None: return 0
+        idx = np.flatnonzero(m) if np is not None else m
+        self._load_strings()
+        pk, me = self._strings["pickup"], self._strings["method"]
+        for i in idx:
+            w.writerow([datetime.fromtimestamp(int(cols["epoch"][i]), timezone.utc).isoformat(), int(cols["user"][i]),
+                        float(cols["tip"][i]), int(cols["duration_s"][i]), pk[cols["pickup"][i]], me[cols["method"][i]]])
+        return len(idx)
+
+# --------------------------------------------------------------------------------------
+# CLI
+# --------------------------------------------------------------------------------------
+def _day_epoch(s: Optional[str]) -> Optional[int]:
+    return to_epoch(s) if s else None
+
+def _month_range(month: str) -> Tuple[int, int]:
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return int(start.timestamp()), int(end.timestamp())
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="analytics.py", description="Delivery analytics tools.")
+    ap.add_argument("--dir", default=os.getenv("ANALYTICS_DIR", "analytics"), help="column store directory (default: analytics)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="rebuild the column files from the delivery history")
+    b.add_argument("--root", default=".", help="directory holding the JSON files (default: .)")
+    b.add_argument("--backend", default=os.getenv("STORAGE_BACKEND", "json"), choices=("json", "sqlite"))
+    b.add_argument("--db", default=os.getenv("SQLITE_PATH", "bot.db"))
+    r = sub.add_parser("report", help="deliveries / tips / duration grouped by a column")
+    e = sub.add_parser("export", help="write matching deliveries as CSV")
+    for p in (r, e):
+        p.add_argument("--month", help="YYYY-MM (overrides --since/--until)")
+        p.add_argument("--since", help="ISO date/time, inclusive")
+        p.add_argument("--until", help="ISO date/time, exclusive")
+        p.add_argument("--user", type=int)
+        p.add_argument("--pickup")
+        p.add_argument("--method")
+    r.add_argument("--by", default="user", choices=GROUPS)
+    r.add_argument("--limit", type=int, default=25)
+    e.add_argument("--out", default="-", help="CSV path (default: stdout)")
+    args = ap.parse_args(argv)
+    cs = ColumnStore(args.dir)
+    t0 = time.perf_counter()
+    if args.cmd == "build":
+        src = make_backend(args.backend, {k: os.path.join(args.root, v) for k, v in DEFAULT_PATHS.items()}, args.db)
+        n = cs.rebuild(src.iter_deliveries())
+        print(f"{n} deliveries -> {args.dir}/ in {time.perf_counter() - t0:.2f}s")
+        return 0
+    since, until = _month_range(args.month) if args.month else (_day_epoch(args.since), _day_epoch(args.until))
+    filters = dict(since=since, until=until, user=args.user, pickup=args.pickup, method=args.method)
+    if args.cmd == "report":
+        rows = cs.query(args.by, **filters)
+        print(f"{args.by:<24} {'deliveries':>10} {'tips':>10} {'avg min':>8}")
+        for key, n, tips, dur in rows[:args.limit]:
+            print(f"{key[:24]:<24} {n:>10} {tips:>10g} {dur / n / 60:>8.1f}")
+        print(f"({len(rows)} groups, {sum(r[1] for r in rows)} deliveries, {(time.perf_counter() - t0) * 1000:.1f}ms)", file=sys.stderr)
+    elif args.cmd == "export":
+        out = sys.stdout if args.out == "-" else open(args.out, "w", newline="", encoding="utf-8")
+        try:
+            n = cs.export_csv(out, **filters)
+        finally:
+            if out is not sys.stdout: out.close()
+        print(f"exported {n} deliveries", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
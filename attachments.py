@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Attachment archive for ticket transcripts.
+
+Discord CDN links expire, so when a ticket closes its attachments are downloaded into a
+local blob store, attachments/<sha[:2]>/<sha256>, and the transcript references them by
+hash. Identical files (the same screenshot posted in several tickets) are stored once.
+
+Downloads share one pooled aiohttp session, at most `concurrency` at a time, and stop
+at `max_bytes` (the Content-Length is checked first when the CDN sends one). A URL that
+is already being fetched is not fetched twice. Bodies are hashed while they stream into
+a temp file next to the blobs, which is then renamed to its hash (or dropped if that
+blob already exists). All file work (writes, hashing, the rename) runs on the archive's
+own threads, in ~1 MiB batches, never on the event loop.
+"""
+
+import os, asyncio, hashlib, tempfile, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterable, Tuple, Callable
+from urllib.parse import urlsplit
+
+import aiohttp
+
+CHUNK = 64 * 1024
+WRITE_BATCH = 1024 * 1024  # bytes collected on the loop before one write on a thread
+_commit_lock = threading.Lock()  # the exists check and rename must not interleave across threads
+
+class _BlobWriter:
+    """One download's temp file. Blocking; only called on the archive's executor."""
+
+    def __init__(self, root: str):
+        os.makedirs(root, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=root, suffix=".part")
+        self.f = os.fdopen(fd, "wb")
+        self.h = hashlib.sha256()
+
+    def write(self, data: bytes):
+        self.h.update(data)
+        self.f.write(data)
+
+    def commit(self, path_for: Callable[[str], str]) -> Tuple[str, bool]:
+        """Move the file to its hash; (sha256, False) if that blob was already stored."""
+        self.f.close()
+        sha = self.h.hexdigest()
+        path = path_for(sha)
+        with _commit_lock:
+            if os.path.exists(path):
+                os.remove(self.tmp)
+                return sha, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.tmp, path)
+        return sha, True
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp): os.remove(self.tmp)
+
+def attachment_id(url: str) -> Optional[int]:
+    """The attachment snowflake in a CDN URL (/attachments/<channel>/<attachment>/<name>)."""
+    parts = urlsplit(url).path.strip("/").split("/")
+    try: return int(parts[-2]) if len(parts) >= 3 else None
+    except ValueError: return None
+
+def filename(url: str) -> str:
+    return urlsplit(url).path.rsplit("/", 1)[-1] or "file"
+
+class AttachmentArchive:
+    def __init__(self, root: str, concurrency: int = 4, max_bytes: int = 25 * 1024 * 1024, timeout: float = 60.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(concurrency)
+        self._concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="blobs")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"stored": 0, "deduped": 0, "too_large": 0, "failed": 0, "bytes": 0}
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._concurrency, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=10))
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed: await self._session.close()
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def fetch_all(self, urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Download every distinct URL; url -> {"sha256", "size"} or {"error", "status"}."""
+        todo = list(dict.fromkeys(u for u in urls if u))
+        results = await asyncio.gather(*(self.fetch(u) for u in todo))
+        return dict(zip(todo, results))
+
+    async def fetch(self, url: str) -> Dict[str, Any]:
+        fut = self._inflight.get(url)
+        if fut is None:
+            fut = self._inflight[url] = asyncio.ensure_future(self._fetch(url))
+            fut.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, url: str) -> Dict[str, Any]:
+        async with self._sem:
+            try:
+                async with self.session().get(url) as resp:
+                    if resp.status != 200:
+                        self.stats["failed"] += 1
+                        return {"error": f"http {resp.status}", "status": resp.status}
+                    if (resp.content_length or 0) > self.max_bytes:
+                        self.stats["too_large"] += 1
+                        return {"error": "too large", "size": resp.content_length}
+                    return await self._store(resp)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                self.stats["failed"] += 1
+                return {"error": f"{type(e).__name__}: {e}"}
+
+    async def _store(self, resp: aiohttp.ClientResponse) -> Dict[str, Any]:
+        run = functools.partial(asyncio.get_running_loop().run_in_executor, self._executor)
+        w = await run(_BlobWriter, self.root)
+        done = False
+        try:
+            size = 0
+            buf = bytearray()
+            async for chunk in resp.content.iter_chunked(CHUNK):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    self.stats["too_large"] += 1
+                    return {"error": "too large", "size": size}
+                buf += chunk
+                if len(buf) >= WRITE_BATCH:
+                    await run(w.write, bytes(buf)); buf.clear()
+            if buf: await run(w.write, bytes(buf))
+            sha, stored = await run(w.commit, self.path)
+            done = True
+        finally:
+            if not done: await run(w.abort)
+        if stored:
+            self.stats["stored"] += 1
+            self.stats["bytes"] += size
+        else:
+            self.stats["deduped"] += 1
+        return {"sha256": sha, "size": size}
+
+def describe(info: Optional[Dict[str, Any]]) -> str:
+    """Transcript suffix for an attachment: where its archived copy is, or why there is none."""
+    if not info: return ""
+    if "sha256" in info:
+        size = info["size"]
+        human = f"{size / 1048576:.1f} MB" if size >= 1048576 else f"{size / 1024:.1f} KB"
+        return f" (archived sha256:{info['sha256']}, {human})"
+    return f" (not archived: {info.get('error', 'unknown error')})"
@@ -0,0 +1,684 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks for the bot's hot paths.
+
+bot.py is imported into a scratch directory and its real handlers are driven against
+in-process fakes of Guild / TextChannel / Thread / Message / Member / Interaction
+(no token, no network). Fake REST calls can be given a latency with --api-latency.
+
+Scenarios (sizes from --scale; every timed call is one sample):
+  seed        N open tickets + N deliveries through the store, then a flush and a reload
+  create      create_ticket()
+  claim       TicketActionView.claim
+  log         /log_delivery
+  close       request_close() + the close job on --transcript-messages message tickets, both from
+              the local ticket log and by paging channel history
+  search      /transcript_search queries over the transcripts archived by the closes
+  restore     restore_guild() (the on_ready loop) over the N open tickets; checks that exactly
+              the seeded stale embeds are re-edited (exit 1 otherwise)
+
+Reports p50 / p90 / p99 / max latency per scenario and peak memory (tracemalloc peak
+with --tracemalloc, otherwise the process max RSS after the scenario).
+
+`stress` is a correctness check instead: it checks the tip / duration parsers, fires
+--tickets concurrent ticket panel selections, a quarter of them double-clicked (fake
+REST calls get random --jitter so their awaits interleave), waits for the ticket job
+queue to drain, races several claims per ticket, double-closes half of them
+(--fail-rate of channel deletes fail with a 503 and must be retried), resumes closes
+interrupted by a restart and logs deliveries while store flushes are in flight. It
+then asserts unique contiguous numbers, one followup per selection, no lost or
+duplicated records (also after a flush + reload), exactly one claim / transcript per
+ticket and no stats row changing while the writer thread serialises it.
+Exits 1 on any failure.
+
+  python bench.py --scale 10k --backend sqlite --iterations 200 --json out.json
+  python bench.py stress --tickets 500
+"""
+
+import os, sys, gc, json, time, random, hashlib, asyncio, argparse, resource, tempfile, importlib, importlib.util, itertools, tracemalloc
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+
+import discord
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+_ids = itertools.count(1_300_000_000_000_000_000)
+
+def snowflake() -> int:
+    return next(_ids)
+
+# --------------------------------------------------------------------------------------
+# Fakes
+# --------------------------------------------------------------------------------------
+class Api:
+    """Counts fake REST calls and applies the configured latency (plus random jitter) to each."""
+    latency = 0.0
+    jitter = 0.0
+    calls = 0
+
+    @classmethod
+    async def call(cls):
+        cls.calls += 1
+        await asyncio.sleep(cls.latency + (random.uniform(0, cls.jitter) if cls.jitter else 0))
+
+class Flaky:
+    """Makes a share of channel deletes fail with a 503, like a Discord outage blip."""
+    rate = 0.0
+    failed = 0
+
+    @classmethod
+    def maybe_fail(cls):
+        if cls.rate and random.random() < cls.rate:
+            cls.failed += 1
+            raise discord.DiscordServerError(_FakeResponse(503, "Service Unavailable"), "upstream connect error")
+
+class FakeRole:
+    def __init__(self, rid: int):
+        self.id = rid
+        self.mention = f"<@&{rid}>"
+
+class FakeMember:
+    def __init__(self, uid: int, name: str, roles: List[FakeRole]):
+        self.id = uid
+        self.name = self.display_name = name
+        self.mention = f"<@{uid}>"
+        self.roles = roles
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+class FakeMessage:
+    def __init__(self, channel, content: Optional[str] = None, author=None, embeds=None, created_at=None):
+        self.id = snowflake()
+        self.channel = channel
+        self.content = content or ""
+        self.author = author
+        self.embeds = list(embeds or [])
+        self.attachments: list = []
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.pinned = False
+
+    async def edit(self, *, content=None, embed=None, view=None, **kw):
+        await Api.call()
+        if content is not None: self.content = content
+        if embed is not None: self.embeds = [embed]
+        return self
+
+    async def pin(self, **kw):
+        await Api.call()
+        self.pinned = True
+
+    async def reply(self, content=None, **kw):
+        return await self.channel.send(content, **kw)
+
+    async def delete(self, **kw):
+        await Api.call()
+
+class _Messageable:
+    """send / history / get_partial_message shared by the fake channel and thread."""
+
+    def _init_messages(self):
+        self._messages: List[FakeMessage] = []
+        self._by_id: Dict[int, FakeMessage] = {}
+
+    async def send(self, content=None, *, embed=None, view=None, file=None, author=None, **kw):
+        await Api.call()
+        if file is not None: file.fp.read()  # the upload reads the whole transcript
+        m = FakeMessage(self, content, author or BOT_USER, [embed] if embed else None)
+        self._messages.append(m)
+        self._by_id[m.id] = m
+        return m
+
+    def seed(self, n: int, authors: List[FakeMember]):
+        """Append n history messages without API calls (spaced 1s apart, ending now)."""
+        start = datetime.now(timezone.utc) - timedelta(seconds=n)
+        for i in range(n):
+            m = FakeMessage(self, f"message {i} " + "lorem ipsum " * (i % 8), authors[i % len(authors)],
+                            created_at=start + timedelta(seconds=i))
+            self._messages.append(m)
+            self._by_id[m.id] = m
+
+    async def history(self, limit: Optional[int] = 100, oldest_first: bool = False, after=None, before=None):
+        msgs = self._messages if oldest_first else list(reversed(self._messages))
+        if after is not None: msgs = [m for m in msgs if m.id > after.id]
+        if before is not None: msgs = [m for m in msgs if m.id < before.id]
+        if limit is not None: msgs = msgs[:limit]
+        for i, m in enumerate(msgs):
+            if i % 100 == 0: await Api.call()  # one request per page of 100
+            yield m
+
+    def get_partial_message(self, mid: int):
+        return self._by_id.get(mid) or FakeMessage(self)
+
+    async def fetch_message(self, mid: int):
+        await Api.call()
+        m = self._by_id.get(mid)
+        if m is None: raise discord.NotFound(_FakeResponse(404), "Unknown Message")
+        return m
+
+class _FakeResponse:
+    def __init__(self, status: int, reason: str = "Not Found"):
+        self.status = status
+        self.reason = reason
+        self.headers: Dict[str, str] = {}
+
+class FakeCategory(discord.CategoryChannel):
+    def __init__(self, guild: "FakeGuild", cid: int, name: str):
+        self.id, self.name, self.guild = cid, name, guild
+        self.position = 0
+
+class FakeTextChannel(_Messageable, discord.TextChannel):
+    def __init__(self, guild: "FakeGuild", cid: int, name: str, category_id: Optional[int] = None, topic: Optional[str] = None):
+        self.id, self.name, self.guild = cid, name, guild
+        self.category_id = category_id
+        self.topic = topic
+        self.position = 0
+        self._init_messages()
+
+    async def delete(self, *, reason=None):
+        await Api.call()
+        Flaky.maybe_fail()
+        self.guild.remove_channel(self.id)
+
+    async def set_permissions(self, target, **kw):
+        await Api.call()
+
+    async def edit(self, **kw):
+        await Api.call()
+        return self
+
+class FakeThread(_Messageable, discord.Thread):
+    def __init__(self, guild: "FakeGuild", tid: int, name: str, parent_id: int, owner_id: int):
+        self.id, self.name, self.guild = tid, name, guild
+        self.parent_id = parent_id
+        self.owner_id = owner_id
+        self._init_messages()
+
+class FakeGuild:
+    """
+    Channels for seeded tickets are "known" ids that materialize on first get_channel,
+    so 100k open tickets don't need 100k channel objects up front.
+    """
+
+    def __init__(self, gid: int, role_ids: List[int], category_ids: List[int]):
+        self.id = gid
+        self.name = "Bench Guild"
+        self.default_role = FakeRole(gid)
+        self._roles = {rid: FakeRole(rid) for rid in role_ids}
+        self._channels: Dict[int, Any] = {cid: FakeCategory(self, cid, f"category-{cid}") for cid in category_ids}
+        self._known: set = set()
+        self._threads: Dict[int, FakeThread] = {}
+        self._members: Dict[int, FakeMember] = {}
+
+    def get_role(self, rid: int): return self._roles.get(rid)
+    def get_member(self, uid: int): return self._members.get(uid)
+    def get_thread(self, tid: int): return self._threads.get(tid)
+
+    def get_channel(self, cid: int):
+        ch = self._channels.get(cid)
+        if ch is None and cid in self._known:
+            ch = self._channels[cid] = FakeTextChannel(self, cid, f"channel-{cid}")
+            self._known.discard(cid)
+        return ch
+
+    def add_text_channel(self, cid: int, name: str) -> FakeTextChannel:
+        ch = self._channels[cid] = FakeTextChannel(self, cid, name)
+        return ch
+
+    def know(self, cid: int):
+        self._known.add(cid)
+
+    def remove_channel(self, cid: int):
+        self._channels.pop(cid, None)
+
+    def member(self, uid: int, name: str) -> FakeMember:
+        m = self._members[uid] = FakeMember(uid, name, list(self._roles.values()))
+        return m
+
+    def thread(self, parent_id: int, owner_id: int) -> FakeThread:
+        th = FakeThread(self, snowflake(), f"thread-{owner_id}", parent_id, owner_id)
+        self._threads[th.id] = th
+        return th
+
+    async def create_text_channel(self, name: str, *, category=None, overwrites=None, topic=None, **kw):
+        await Api.call()
+        ch = self.add_text_channel(snowflake(), name)
+        ch.category_id, ch.topic = getattr(category, "id", None), topic
+        return ch
+
+class FakeInteractionResponse:
+    def __init__(self):
+        self._done = False
+        self.sent: List[Any] = []
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content=None, **kw):
+        await Api.call()
+        self._done = True
+        self.sent.append(content)
+
+    async def defer(self, **kw):
+        await Api.call()
+        self._done = True
+
+    async def send_modal(self, modal):
+        await Api.call()
+        self._done = True
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent: List[Any] = []
+
+    async def send(self, content=None, **kw):
+        await Api.call()
+        self.sent.append(content)
+
+class FakeInteraction:
+    def __init__(self, guild: FakeGuild, user: FakeMember, channel):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = getattr(channel, "id", None)
+        self.response = FakeInteractionResponse()
+        self.followup = FakeFollowup()
+        self.extras: Dict[str, Any] = {}
+        self.command = None
+        self.type = discord.InteractionType.component
+
+BOT_USER = FakeMember(snowflake(), "Bench Bot", [])
+
+# --------------------------------------------------------------------------------------
+# Measurement
+# --------------------------------------------------------------------------------------
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples: return {}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {"n": len(s), "p50_ms": pick(0.50) * 1e3, "p90_ms": pick(0.90) * 1e3, "p99_ms": pick(0.99) * 1e3,
+            "max_ms": s[-1] * 1e3, "mean_ms": sum(s) / len(s) * 1e3}
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    async def measure(self, name: str, make: Callable[[int], Awaitable[Any]], n: int, after: Optional[Callable[[], Awaitable[Any]]] = None):
+        """Time make(0..n-1). A make() that returns a float reports that as its sample (to leave out its own setup)."""
+        gc.collect()
+        if self.args.tracemalloc: tracemalloc.reset_peak()
+        api0 = Api.calls
+        samples = []
+        t_all = time.perf_counter()
+        for i in range(n):
+            t0 = time.perf_counter()
+            timed = await make(i)
+            samples.append(timed if isinstance(timed, float) else time.perf_counter() - t0)
+        if after: await after()
+        wall = time.perf_counter() - t_all
+        row = percentiles(samples)
+        row["wall_s"] = wall
+        row["api_calls"] = Api.calls - api0
+        row["peak_mb"] = (tracemalloc.get_traced_memory()[1] if self.args.tracemalloc
+                          else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)) / 2**20
+        self.results[name] = row
+        print(f"{name:<18} {row['n']:>7} {row['p50_ms']:>9.3f} {row['p90_ms']:>9.3f} {row['p99_ms']:>9.3f} "
+              f"{row['max_ms']:>9.2f} {row['api_calls']:>8} {row['peak_mb']:>9.1f}", flush=True)
+
+def make_guild(bot) -> FakeGuild:
+    """A guild with every role / ticket category / log channel bot.py refers to; members hold all roles."""
+    role_ids = sorted({v for k, v in vars(bot).items() if k.startswith("ROLE_") and isinstance(v, int)}
+                      | {bot.ticket_meta(t)["ping_role"] for t in ("gs", "mc", "shr")})
+    cats = sorted({bot.ticket_meta(t)["cat"] for t in ("gs", "mc", "shr")})
+    guild = FakeGuild(bot.GUILD_ID or snowflake(), role_ids, cats)
+    for cid, name in ((bot.CHAN_TRANSCRIPTS, "transcripts"), (bot.CHAN_DELIVERY, "deliveries"), (bot.TICKET_PANEL_CHANNEL_ID, "tickets")):
+        guild.add_text_channel(cid, name)
+    bot.client.get_channel = guild.get_channel  # /log_delivery posts through client.get_channel
+    bot.store.start_flusher()
+    bot.audit.start()
+    return guild
+
+async def run(args) -> Dict[str, Any]:
+    bot = importlib.import_module("bot")
+    Api.latency = args.api_latency / 1000
+    n, iters = SCALES.get(args.scale) or int(args.scale), args.iterations
+    guild = make_guild(bot)
+    staff = guild.member(snowflake(), "staff")
+    drivers = [guild.member(snowflake(), f"driver{i}") for i in range(50)]
+    if args.tracemalloc: tracemalloc.start()
+    b = Bench(args)
+    rng = random.Random(1)
+    print(f"scale={n} backend={bot.store.backend.name} iterations={iters} transcript={args.transcript_messages} "
+          f"api_latency={args.api_latency}ms numpy={'yes' if importlib.util.find_spec('numpy') else 'no'}")
+    print(f"{'scenario':<18} {'n':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'api':>8} {'peak MB':>9}")
+
+    # ---- seed: N open tickets, N deliveries (batched so the per-call sample stays meaningful)
+    # tickets are stored as create_ticket leaves them, except that every 10th was claimed right
+    # before a restart (its debounced embed edit never went out) and every 10th + 5 predates
+    # status_rendered; restore must re-edit exactly the first group
+    batch = 1000
+    stale_seeded = 0
+    async def seed_tickets(i):
+        nonlocal stale_seeded
+        for j in range(i * batch, min(n, (i + 1) * batch)):
+            cid = snowflake()
+            guild.know(cid)
+            t = {"id": str(cid), "channel_id": cid, "guild_id": guild.id, "type": ("gs", "mc", "shr")[j % 3],
+                 "number": j + 1, "opener_id": drivers[j % len(drivers)].id, "handler_id": None, "status": "open",
+                 "subject": "", "message_id": snowflake()}
+            bot.mark_rendered(t)
+            if j % 10 == 0:
+                t["handler_id"] = staff.id
+                stale_seeded += 1
+            elif j % 10 == 5:
+                del t["status_rendered"]
+            bot.add_ticket(t)
+    await b.measure("seed_tickets/1k", seed_tickets, (n + batch - 1) // batch, after=bot.store.sync)
+    now = datetime.now(timezone.utc)
+    async def seed_deliveries(i):
+        for j in range(i * batch, min(n, (i + 1) * batch)):
+            rec = {"user": drivers[j % len(drivers)].id, "pickup": rng.choice(["Burger Shot", "Pizza This", "Taco Bomb"]),
+                   "items": "2x meal", "dropoff": "Vinewood", "tipped": rng.choice(["$5", "no", "$12"]),
+                   "duration": rng.choice(["15m", "30 minutes", "1h"]), "customer": "Jane", "method": rng.choice(["Ticket", "DM"]),
+                   "proof": "", "thread_id": 0, "ts": (now - timedelta(minutes=j)).isoformat()}
+            rec.update(bot.typed_fields(rec))
+            bot.store.add_delivery(rec)
+            bot.delivery_stats.add(rec)
+            bot.delivery_columns.add(rec)
+    await b.measure("seed_deliveries/1k", seed_deliveries, (n + batch - 1) // batch, after=bot.store.sync)
+    async def load(i):
+        bot.store.load()
+    await b.measure("store_load", load, 1)
+
+    # ---- create_ticket
+    created = []
+    async def create(i):
+        ch = await bot.create_ticket(guild, drivers[i % len(drivers)], ("gs", "mc", "shr")[i % 3])
+        created.append(bot.get_ticket_by_channel(ch.id))
+    await b.measure("create_ticket", create, iters)
+
+    # ---- claim (edits are debounced; drain them inside the scenario)
+    async def claim(i):
+        t = created[i % len(created)]
+        t["handler_id"] = None
+        view = bot.TicketActionView(t)
+        ch = guild.get_channel(t["channel_id"])
+        await view.claim.callback(FakeInteraction(guild, staff, ch))
+    await b.measure("claim", claim, iters, after=bot.edits.drain)
+
+    # ---- log_delivery
+    for d in drivers:
+        th = guild.thread(bot.CHAN_FORUM, d.id)
+        bot.store.set_link(d.id, {"user": d.id, "forum": bot.CHAN_FORUM, "thread_id": th.id, "thread_name": th.name})
+    async def log(i):
+        d = drivers[i % len(drivers)]
+        await bot.log_delivery.callback(FakeInteraction(guild, d, guild.get_channel(bot.CHAN_DELIVERY)),
+                                        pickup="Burger Shot", items="1x meal", dropoff="Rockford Hills", tipped="$7",
+                                        duration="20m", customer="Sam", method="Ticket")
+    await b.measure("log_delivery", log, iters)
+
+    # ---- close (request_close + the close job): the local ticket log vs paging history
+    closes = max(1, min(iters, args.close_iterations))
+    def close(tracked: bool):
+        async def one(i) -> float:
+            ch = await bot.create_ticket(guild, drivers[i % len(drivers)], "gs")
+            t = bot.get_ticket_by_channel(ch.id)
+            ch.seed(args.transcript_messages, drivers[:5])
+            if tracked:  # as if every message had arrived through on_message
+                for m in ch._messages: bot.tlog.append(ch.id, bot.message_record(m))
+                await bot.store.worker.flush()
+            else:
+                bot.tlog.drop(ch.id)
+            t0 = time.perf_counter()
+            await bot.request_close(guild, t, reason="bench", by=staff)
+            await bot.close_jobs.drain()
+            return time.perf_counter() - t0
+        return one
+    await b.measure("close/ticket_log", close(True), closes)
+    await b.measure("close/history", close(False), closes)
+
+    # ---- transcript_search: full-text / author queries over what the closes archived
+    queries = [("lorem", None), ("message 42", None), ("ipsum", drivers[1].id), ("", drivers[2].id), ("mess*", None)]
+    async def search(i):
+        q, author = queries[i % len(queries)]
+        await bot.store.worker.call(lambda: bot.transcript_archive.search(q, author))
+    await b.measure("transcript_search", search, iters)
+
+    # ---- restore (on_ready): every open ticket view re-registered, stale embeds re-edited
+    await bot.edits.drain()  # edits from the scenarios above have gone out, as they would before a clean restart
+    refreshed: List[int] = []
+    async def restore(i):
+        bot._restored_guilds.discard(guild.id)
+        bot.store.panel_set("message_id", snowflake())
+        t0 = time.perf_counter()
+        await bot.restore_guild(guild)
+        elapsed = time.perf_counter() - t0
+        refreshed.append(bot.last_restore["refreshed"])
+        await bot.edits.drain()  # untimed: the next "restart" sees what these edits recorded
+        return elapsed
+    await b.measure("restore_guild", restore, max(1, min(5, iters)))
+    expect = [stale_seeded] + [0] * (len(refreshed) - 1)
+    failures = [] if refreshed == expect else [f"restore refreshed {refreshed} embeds, expected {expect}"]
+    print(f"{'ok  ' if not failures else 'FAIL'} restore refreshed {refreshed} embeds (expected {expect})")
+
+    await bot.audit.aclose()
+    await bot.store.aclose()
+    return {"scale": n, "backend": bot.store.backend.name, "iterations": iters, "api_latency_ms": args.api_latency,
+            "transcript_messages": args.transcript_messages, "results": b.results, "failures": failures}
+
+# --------------------------------------------------------------------------------------
+# Stress check: concurrent ticket creation / claim / close
+# --------------------------------------------------------------------------------------
+# free-text /log_delivery fields -> (parse_amount, parse_seconds)
+AMOUNT_CASES = {"$5": 5.0, "2.50": 2.5, "2,50": 2.5, "1,5 robux": 1.5, "$1,500": 1500.0, "1,500.50": 1500.5,
+                "12,000 robux": 12000.0, "no": 0.0, "": 0.0}
+DURATION_CASES = {"15m": 900, "20": 1200, "1h 5m": 3900, "90s": 90, "1,5h": 5400, "15-20 min": 1050,
+                  "15 - 20 minutes": 1050, "1-2h": 5400, "about 20 min, 2 stops": 1200, "": 0}
+SHARED_PNG = b"\x89PNG\r\n\x1a\n" + b"the same screenshot in every ticket " * 500
+
+async def start_cdn() -> Tuple[Dict[str, Any], str]:
+    """Local stand-in for the attachment CDN: shared.png is identical everywhere, expired.png is gone, huge.mp4 is over the cap."""
+    from aiohttp import web
+    state: Dict[str, Any] = {"requests": 0}
+    async def get(request):
+        state["requests"] += 1
+        name = request.match_info["name"]
+        if name == "expired.png": return web.Response(status=404)
+        if name == "huge.mp4": return web.Response(body=b"\0" * (256 * 1024))
+        if name == "shared.png": return web.Response(body=SHARED_PNG, content_type="image/png")
+        return web.Response(body=f"evidence {request.match_info['aid']} {name}".encode(), content_type="image/png")
+    app = web.Application()
+    app.router.add_get("/attachments/{cid}/{aid}/{name}", get)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    state["runner"] = runner
+    return state, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+async def stress(args) -> int:
+    from discord.ui.select import selected_values  # how discord.py hands a Select its values per interaction
+    bot = importlib.import_module("bot")
+    Api.jitter = args.jitter / 1000
+    guild = make_guild(bot)
+    users = [guild.member(snowflake(), f"user{i}") for i in range(args.tickets)]
+    staff = [guild.member(snowflake(), f"staff{i}") for i in range(args.claimers)]
+    panel = guild.get_channel(bot.TICKET_PANEL_CHANNEL_ID)
+    dropdown = bot.TicketPanelView().children[0]
+    types = ("gs", "mc", "shr")
+    start = {t: int(bot.store.kv["counters"].get(t, 1)) for t in types}
+    failures: List[str] = []
+    def check(ok: bool, what: str):
+        print(f"{'ok  ' if ok else 'FAIL'} {what}")
+        if not ok: failures.append(what)
+
+    an = importlib.import_module("analytics")
+    bad = [f"{t!r} -> {an.parse_amount(t)}" for t, v in AMOUNT_CASES.items() if an.parse_amount(t) != v]
+    bad += [f"{t!r} -> {an.parse_seconds(t)}s" for t, v in DURATION_CASES.items() if an.parse_seconds(t) != v]
+    check(not bad, f"free-text tip / duration parsing ({len(AMOUNT_CASES) + len(DURATION_CASES)} cases){': ' + ', '.join(bad) if bad else ''}")
+
+    async def select(i: int):
+        selected_values.set({dropdown.custom_id: [types[i % 3]]})  # this task's context only
+        inter = FakeInteraction(guild, users[i % len(users)], panel)
+        await dropdown.callback(inter)
+        return inter
+    # every user selects once, the first quarter double-click (the repeat should be deduped while the first is queued)
+    n = args.tickets + args.tickets // 4
+    t0 = time.perf_counter()
+    inters = await asyncio.gather(*(select(i) for i in range(n)))
+    acked = time.perf_counter() - t0
+    await bot.ticket_jobs.drain()
+    print(f"{n} concurrent selections acked in {acked:.2f}s, tickets done in {time.perf_counter() - t0:.2f}s")
+    tickets = bot.store.open_tickets()
+    created = sum(1 for i in inters if i.followup.sent[-1:] and i.followup.sent[-1].startswith("Ticket created"))
+    deduped = sum(1 for i in inters if i.followup.sent == ["Your ticket is already being created."])
+    check(all(i.response.is_done() and len(i.followup.sent) == 1 for i in inters), "every selection deferred and answered once")
+    check(created + deduped == n, f"{created} created + {deduped} deduped for {n} selections")
+    check(len(tickets) == created, f"{len(tickets)} open tickets for {created} created")
+    per_user: Dict[int, int] = {}
+    for x in tickets: per_user[x["opener_id"]] = per_user.get(x["opener_id"], 0) + 1
+    check(len(per_user) == len(users), f"{len(per_user)} of {len(users)} users got a ticket")
+    for t in types:
+        nums = sorted(x["number"] for x in tickets if x["type"] == t)
+        check(nums == list(range(start[t], start[t] + len(nums))), f"{t}: {len(nums)} numbers unique and contiguous")
+    check(all(x.get("message_id") and guild.get_channel(x["channel_id"]) for x in tickets), "every ticket has its channel and pinned message")
+    check(len({x["channel_id"] for x in tickets}) == len(tickets), "no two tickets share a channel")
+
+    async def claim(t: dict, who: FakeMember):
+        inter = FakeInteraction(guild, who, guild.get_channel(t["channel_id"]))
+        await bot.TicketActionView(t).claim.callback(inter)
+        return inter.response.sent[-1] if inter.response.sent else ""
+    replies = await asyncio.gather(*(claim(t, s) for t in tickets for s in staff))
+    won = sum(1 for r in replies if r and r.endswith("claimed this ticket."))
+    check(won == len(tickets), f"{won} claims won for {len(tickets)} tickets ({len(replies)} attempts)")
+    check(all(bot.store.ticket(t["id"])["handler_id"] in {s.id for s in staff} for t in tickets), "every ticket has one handler")
+
+    to_close = tickets[: len(tickets) // 2]
+    trans = guild.get_channel(bot.CHAN_TRANSCRIPTS)
+    posted0 = len(trans._messages)
+    bot.CLOSE_RETRY_BASE_SECONDS = 0.01
+    cdn, base = await start_cdn()
+    bot.attachment_archive.max_bytes = 64 * 1024
+    for i, t in enumerate(to_close):  # one message per ticket in its local log, as if the opener had written it
+        files = [f"{base}/attachments/{t['channel_id']}/{snowflake()}/{name}" for name in ("shared.png", f"order-{t['number']}.png")]
+        if i == 0: files += [f"{base}/attachments/{t['channel_id']}/{snowflake()}/{name}" for name in ("expired.png", "huge.mp4")]
+        bot.tlog.append(t["channel_id"], {"op": "create", "id": snowflake(), "ts": datetime.now(timezone.utc).isoformat(),
+                                          "author": "opener", "author_id": t["opener_id"], "content": f"refund for order {t['number']}",
+                                          "attachments": files, "embeds": []})
+    Flaky.rate = args.fail_rate
+    closed = await asyncio.gather(*(bot.request_close(guild, t, reason=None, by=staff[0]) for t in to_close for _ in range(2)))
+    check(sum(closed) == len(to_close), f"{sum(closed)} closes queued for {len(to_close)} tickets closed twice each")
+    await bot.close_jobs.drain()
+    check(not bot.store.kv["close_jobs"], f"{len(bot.store.kv['close_jobs'])} close jobs left over")
+    check(len(trans._messages) - posted0 == len(to_close), f"{len(trans._messages) - posted0} transcripts posted")
+    check(all(guild.get_channel(t["channel_id"]) is None for t in to_close), f"every closed channel deleted ({Flaky.failed} deletes failed and were retried)")
+    Flaky.rate = 0.0
+    st = bot.attachment_archive.stats
+    blobs = sum(len(f) for _, _, f in os.walk(bot.ATTACHMENT_DIR))
+    check(st["stored"] == blobs == len(to_close) + 1 and st["deduped"] == len(to_close) - 1,
+          f"attachments: {st['stored']} stored ({blobs} blobs), {st['deduped']} deduped, {st['too_large']} too large, {st['failed']} failed")
+    check(st["too_large"] == 1 and cdn["requests"] == 2 * len(to_close) + 2, f"{cdn['requests']} CDN requests, oversized file skipped")
+    shared = hashlib.sha256(SHARED_PNG).hexdigest()
+    arc = bot.transcript_archive
+    hits = await bot.store.worker.call(lambda: arc.search(shared, limit=1000))
+    check(len(hits) == len(to_close), f"{len(hits)} transcripts reference the shared screenshot's blob")
+    indexed = await bot.store.worker.call(arc.indexed)
+    check(indexed == len(to_close), f"{indexed} transcripts archived and indexed")
+    hits = await bot.store.worker.call(lambda: arc.search("refund", to_close[0]["opener_id"], limit=1000))
+    check({h["ticket_id"] for h in hits} == {t["id"] for t in to_close if t["opener_id"] == to_close[0]["opener_id"]},
+          f"transcript search by word + author: {len(hits)} ticket(s)")
+    await bot.edits.drain()
+
+    await bot.store.sync()
+    bot.store.load()
+    reopened = {t["id"] for t in bot.store.open_tickets()}
+    expect_open = {t["id"] for t in tickets[len(to_close):]}
+    check(reopened == expect_open, f"after flush + reload: {len(reopened)} open tickets (expected {len(expect_open)})")
+    archived = [bot.store.find_ticket(t["id"]) for t in to_close]
+    check(all(a and a.get("status") == "closed" for a in archived), f"{len(to_close)} closed tickets in the archive")
+
+    # closes persisted right before a crash: the next start picks them up
+    interrupted = bot.store.open_tickets()[:10]
+    for t in interrupted: bot.queue_close(t, "bench restart", staff[0])
+    await bot.store.sync()
+    bot.store.load()
+    resumed = bot.resume_close_jobs(guild)
+    await bot.close_jobs.drain()
+    check(resumed == len(interrupted) and all(bot.store.ticket(t["id"]) is None and bot.store.find_ticket(t["id"]) for t in interrupted),
+          f"{resumed} interrupted closes resumed after reload")
+    # /log_delivery while flushes are in flight: the rows a flush hands the writer must not change under it
+    changed: List[str] = []
+    commit = bot.store.backend.commit
+    def watched_commit(batch, full):
+        rows = batch.get(an.STATS) or {}
+        before = json.dumps(rows, sort_keys=True)
+        time.sleep(0.02)  # a slow disk: the loop keeps logging deliveries meanwhile
+        if json.dumps(rows, sort_keys=True) != before: changed.extend(rows)
+        return commit(batch, full)
+    bot.store.backend.commit = watched_commit
+    for u in users[:20]:
+        th = guild.thread(bot.CHAN_FORUM, u.id)
+        bot.store.set_link(u.id, {"user": u.id, "forum": bot.CHAN_FORUM, "thread_id": th.id, "thread_name": th.name})
+    async def log(i: int):
+        await asyncio.sleep(i / 1000)  # spread over ~0.4s so flushes keep overlapping them
+        await bot.log_delivery.callback(FakeInteraction(guild, users[i % 20], guild.get_channel(bot.CHAN_DELIVERY)),
+                                        pickup="Burger Shot", items="1x meal", dropoff="Vinewood", tipped="$1,500",
+                                        duration="15-20 min", customer="Sam", method=f"method{i % 7}")
+        bot.store.schedule_flush()
+    logged0 = bot.delivery_stats.user(users[0].id, "all")["n"]
+    await asyncio.gather(*(log(i) for i in range(400)))
+    await bot.store.sync()
+    bot.store.backend.commit = commit
+    bot.store.load()
+    on_disk = bot.store.kv_get(an.STATS, an.ALL) or {}
+    check(not changed and sum(a["n"] for a in on_disk.values()) >= 400 and on_disk[str(users[0].id)]["n"] == logged0 + 20,
+          f"400 deliveries logged during flushes: {len(changed)} stats row(s) changed while being written")
+    for q in bot.job_queues: await q.aclose()
+    await bot.attachment_archive.aclose()
+    await cdn["runner"].cleanup()
+    await bot.audit.aclose()
+    await bot.store.aclose()
+    print("PASS" if not failures else f"FAILED: {len(failures)} check(s)")
+    return 1 if failures else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="bench.py", description="Offline benchmarks with fake Discord objects.")
+    ap.add_argument("mode", nargs="?", default="run", choices=("run", "stress"), help="benchmarks (default) or the concurrency stress check")
+    ap.add_argument("--tickets", type=int, default=300, help="stress: concurrent ticket selections (default 300)")
+    ap.add_argument("--claimers", type=int, default=3, help="stress: staff racing to claim each ticket (default 3)")
+    ap.add_argument("--jitter", type=float, default=20.0, help="stress: random 0..ms delay per fake REST call (default 20)")
+    ap.add_argument("--fail-rate", type=float, default=0.1, help="stress: share of channel deletes that fail with a 503 (default 0.1)")
+    ap.add_argument("--scale", default="1k", help="open tickets and deliveries to seed: 1k | 10k | 100k | <n> (default 1k)")
+    ap.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    ap.add_argument("--iterations", type=int, default=200, help="samples for create / claim / log (default 200)")
+    ap.add_argument("--close-iterations", type=int, default=20, help="tickets closed per transcript mode (default 20)")
+    ap.add_argument("--transcript-messages", type=int, default=5000, help="messages per closed ticket (default 5000)")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="ms added to every fake REST call (default 0)")
+    ap.add_argument("--tracemalloc", action="store_true", help="peak memory from tracemalloc (slower) instead of max RSS")
+    ap.add_argument("--workdir", help="scratch directory for the bot's files (default: a new temp dir)")
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args(argv)
+
+    out = os.path.abspath(args.json) if args.json else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bot-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)  # bot.py keeps its files in the working directory
+    sys.path.insert(0, REPO)
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ.setdefault("SQLITE_PATH", os.path.join(workdir, "bot.db"))
+    print(f"workdir: {workdir}")
+    if args.mode == "stress":
+        os.environ.setdefault("TICKET_JOB_QUEUE", str(args.tickets * 2))  # room for every selection, so counts are exact
+        return asyncio.run(stress(args))
+    report = asyncio.run(run(args))
+    if out:
+        with open(out, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"results -> {out}")
+    return 1 if report["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
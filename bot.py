@@ -9,16 +9,25 @@ Fixes:
 - On startup: restore ticket panel components + restore all open ticket views
 """
 
-import os, io, json, asyncio
-from typing import Optional, Literal, Dict, Any, List, Tuple
+import os, io, re, json, math, time, random, signal, atexit, asyncio, hashlib, weakref
+from collections import OrderedDict
+from typing import Optional, Literal, Dict, Any, List, Tuple, IO, Iterable, Awaitable, Callable
 from datetime import datetime, timezone, timedelta
 
+import aiohttp
 import discord
 from discord import app_commands, Interaction, Embed, ui
 from discord.ext import commands
 from aiohttp import web
 from dotenv import load_dotenv
 
+from storage import StateStore, AuditLog, make_backend, save_json
+from transcripts import TicketLog, TranscriptSpool, TranscriptArchive, ArchiveWriter
+from attachments import AttachmentArchive, attachment_id
+from analytics import DeliveryStats, ColumnStore, typed_fields
+from metrics import REGISTRY, track_loop_lag
+from profiling import Tracer, Trace, span, add_span, profile_for
+
 # --------------------------------------------------------------------------------------
 # ENV
 # --------------------------------------------------------------------------------------
@@ -58,6 +67,12 @@ ROLE_DEPLOY_HOST_ONLY      = 1420777206770171985
 ROLE_DELIVERY_REQ_PING     = 1420838579780714586  # ping + permission for delivery request buttons
 ROLE_CS_WELCOME_CAN_USE    = 1421102646366044221
 
+# Startup restore: max concurrent Discord calls for the transcript backfill (embed refreshes are paced by EDIT_CONCURRENCY)
+RESTORE_CONCURRENCY = 5
+# Status embed edits: updates to the same message within this window collapse into one edit
+EDIT_DEBOUNCE_SECONDS = 0.75
+EDIT_CONCURRENCY = 5
+
 # Staff for /sync cooldown
 STAFF_ROLE_ID = ROLE_SHR_STAFF
 
@@ -67,34 +82,49 @@ PROMO_INFRA_GIF = "https://cdn.discordapp.com/attachments/1371481729310785687/14
 DEPLOYMENT_GIF  = "https://cdn.discordapp.com/attachments/1420749680538816553/1420834953335275710/togif.gif"
 DIVIDER = "▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬"
 
+# Transcripts
+TRANSCRIPT_EMBED_MAX = 1800                # longer transcripts are uploaded as a file
+TRANSCRIPT_SPOOL_BYTES = 1024 * 1024       # spooled in memory up to this, then a temp file on disk
+TRANSCRIPT_GZIP = os.getenv("TRANSCRIPT_GZIP", "0") == "1"  # upload transcript-<id>.txt.gz instead of .txt
+# Attachments of a closing ticket are copied from the CDN (links expire) into ATTACHMENT_DIR, one file per distinct content
+ATTACHMENT_CONCURRENCY = int(os.getenv("ATTACHMENT_CONCURRENCY", "4"))
+ATTACHMENT_MAX_BYTES = int(float(os.getenv("ATTACHMENT_MAX_MB", "25")) * 1024 * 1024)  # larger files keep only their link
+
+# Metrics (GET /metrics on the web server; set METRICS_TOKEN to require "Authorization: Bearer <token>")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+SLOW_INTERACTION_SECONDS = float(os.getenv("SLOW_INTERACTION_SECONDS", "2.0"))  # slower handlers go to SLOW_LOG_FILE
+
+# Ticket creation runs after the interaction is acked: worker count and how many may wait
+TICKET_JOB_WORKERS = int(os.getenv("TICKET_JOB_WORKERS", "4"))
+TICKET_JOB_QUEUE = int(os.getenv("TICKET_JOB_QUEUE", "200"))
+# Ticket closes are persisted jobs run by this many workers; Discord 429 / 5xx and network errors are retried with backoff
+CLOSE_WORKERS = int(os.getenv("CLOSE_WORKERS", "3"))
+CLOSE_MAX_ATTEMPTS = 6
+CLOSE_RETRY_BASE_SECONDS = 2.0
+CLOSE_RETRY_MAX_SECONDS = 60.0
+
 # --------------------------------------------------------------------------------------
 # FILES
 # --------------------------------------------------------------------------------------
 LINKS_FILE = "links.json"              # [{user,thread_id,thread_name,forum}]
-DELIVERIES_FILE = "deliveries.json"
-TICKETS_FILE = "tickets.json"          # [{..., "message_id": int (pinned ticket embed)}]
+DELIVERIES_FILE = "deliveries.jsonl"   # append-only journal, compacted into DELIVERIES_SNAPSHOT
+DELIVERIES_SNAPSHOT = "deliveries.snapshot.jsonl.gz"
+DELIVERIES_LEGACY = "deliveries.json"  # old single-list format, migrated once on startup
+TICKETS_FILE = "tickets.json"          # open tickets only: [{..., "message_id": int (pinned ticket embed)}]
+ARCHIVE_DIR = "archive"                # closed tickets: monthly tickets-YYYY-MM.jsonl.gz + index.jsonl
 BLACKLIST_FILE = "blacklist.json"      # {user_id: [types]}
 COUNTERS_FILE = "ticket_counters.json" # {"gs":n,"mc":n,"shr":n}
-AUDIT_FILE = "audit.jsonl"
+AUDIT_FILE = "audit.jsonl"             # rotated daily / at 10 MB into audit-YYYY-MM-DD[.n].jsonl.gz
+SLOW_LOG_FILE = "slow_interactions.jsonl"  # handlers over SLOW_INTERACTION_SECONDS with their phase breakdown
 PERSIST_FILE = "panel.json"            # {"message_id": int}
-
-def load_json(path: str, default):
-    try:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return default
-
-def save_json(path: str, data) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+TRANSCRIPT_LIVE_DIR = "transcripts/live"  # <channel_id>.jsonl event log per open ticket
+TRANSCRIPT_ARCHIVE_DIR = "transcripts/archive"  # closed tickets' messages by SHA-256, indexed in transcripts/index.db
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "attachments")  # <sha[:2]>/<sha256> blobs referenced from transcripts
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")  # delivery column files (python analytics.py report/export)
 
 def ensure_files():
     defaults = {
         LINKS_FILE: [],
-        DELIVERIES_FILE: [],
         TICKETS_FILE: [],
         BLACKLIST_FILE: {},
         COUNTERS_FILE: {"gs": 1, "mc": 1, "shr": 1},
@@ -104,12 +134,104 @@ def ensure_files():
         if not os.path.exists(p): save_json(p, d)
 ensure_files()
 
+# single process-wide store: state is loaded once, reads hit in-memory indexes,
+# writes are batched by the flusher started in main().
+# STORAGE_BACKEND=json (default, the files above) or sqlite (SQLITE_PATH, see `python storage.py migrate`)
+store = StateStore(make_backend(os.getenv("STORAGE_BACKEND", "json"), paths={
+    "tickets": TICKETS_FILE, "blacklist": BLACKLIST_FILE, "counters": COUNTERS_FILE,
+    "links": LINKS_FILE, "panel": PERSIST_FILE, "archive": ARCHIVE_DIR,
+    "deliveries": DELIVERIES_FILE, "deliveries_snapshot": DELIVERIES_SNAPSHOT, "deliveries_legacy": DELIVERIES_LEGACY,
+}, sqlite_path=os.getenv("SQLITE_PATH", "bot.db")))
+atexit.register(store.flush)
+
+audit = AuditLog(AUDIT_FILE, store.worker)
+atexit.register(audit.flush_sync)
+slow_log = AuditLog(SLOW_LOG_FILE, store.worker)
+atexit.register(slow_log.flush_sync)
+
+tlog = TicketLog(TRANSCRIPT_LIVE_DIR, store.worker, store)
+transcript_archive = TranscriptArchive(TRANSCRIPT_ARCHIVE_DIR)
+attachment_archive = AttachmentArchive(ATTACHMENT_DIR, ATTACHMENT_CONCURRENCY, ATTACHMENT_MAX_BYTES)
+delivery_stats = DeliveryStats(store)
+delivery_columns = ColumnStore(ANALYTICS_DIR, store.worker)
+
 def audit_file(event: str, payload: Dict[str, Any]) -> None:
-    try:
-        with open(AUDIT_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps({"ts": datetime.now(timezone.utc).isoformat(), "event": event, **payload}) + "\n")
-    except Exception:
-        pass
+    # buffered in memory; never touches the disk on the caller's path
+    audit.log(event, payload)
+
+# --------------------------------------------------------------------------------------
+# METRICS (Prometheus text format, see metrics.py; scrape-time values are registered after the bot objects)
+# --------------------------------------------------------------------------------------
+M_INTERACTIONS = REGISTRY.counter("bot_interactions_total", "Interactions received, by type.", ("type",))
+M_CMD_SECONDS = REGISTRY.histogram("bot_command_duration_seconds", "App command handler time, by command and outcome.", ("command", "outcome"))
+M_CMD_FAILURES = REGISTRY.counter("bot_command_failures_total", "App commands that raised, by command.", ("command",))
+M_HTTP = REGISTRY.counter("discord_http_requests_total", "Discord REST requests, by method and status.", ("method", "status"))
+M_HTTP_SECONDS = REGISTRY.histogram("discord_http_request_duration_seconds", "Discord REST request time, by method.", ("method",))
+M_HTTP_429 = REGISTRY.counter("discord_http_ratelimited_total", "Discord REST 429 responses, by rate limit scope.", ("scope",))
+M_COMPONENT_SECONDS = REGISTRY.histogram("bot_component_duration_seconds", "Button / select / modal handler time, by handler and outcome.", ("handler", "outcome"))
+M_PHASE_SECONDS = REGISTRY.histogram("bot_handler_phase_seconds", "Handler time by phase (storage, discord_api, transcript, other).", ("handler", "phase"))
+M_IO_SECONDS = REGISTRY.histogram("bot_persist_io_seconds", "Blocking persistence calls on the writer thread, by function.", ("op",))
+M_JOB_WAIT = REGISTRY.histogram("bot_job_wait_seconds", "Time jobs waited in a queue before a worker started them.", ("queue",))
+M_JOB_RETRIES = REGISTRY.counter("bot_job_retries_total", "Job attempts that failed and were retried, by queue.", ("queue",))
+M_LOOP_LAG = REGISTRY.gauge("bot_event_loop_lag_last_seconds", "Most recent event loop lag sample.")
+M_LOOP_LAG_H = REGISTRY.histogram("bot_event_loop_lag_seconds", "Event loop lag (sleep overshoot, sampled every 0.5s).",
+                                  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+async def _http_start(session, ctx, params: aiohttp.TraceRequestStartParams):
+    ctx.t0 = time.perf_counter()
+
+async def _http_end(session, ctx, params: aiohttp.TraceRequestEndParams):
+    elapsed = time.perf_counter() - ctx.t0
+    M_HTTP.inc(method=params.method, status=params.response.status)
+    M_HTTP_SECONDS.observe(elapsed, method=params.method)
+    add_span("discord_api", elapsed)  # runs in the awaiting handler's task
+    if params.response.status == 429:
+        M_HTTP_429.inc(scope=params.response.headers.get("X-RateLimit-Scope", "unknown"))
+
+async def _http_error(session, ctx, params: aiohttp.TraceRequestExceptionParams):
+    M_HTTP.inc(method=params.method, status=type(params.exception).__name__)
+
+_http_trace = aiohttp.TraceConfig()
+_http_trace.on_request_start.append(_http_start)
+_http_trace.on_request_end.append(_http_end)
+_http_trace.on_request_exception.append(_http_error)
+
+def _trace_metrics(tr: Trace, outcome: str):
+    if tr.kind == "command": M_CMD_SECONDS.observe(tr.total, command=tr.name, outcome=outcome)
+    else: M_COMPONENT_SECONDS.observe(tr.total, handler=tr.name, outcome=outcome)
+    for phase, seconds in tr.breakdown().items(): M_PHASE_SECONDS.observe(seconds, handler=tr.name, phase=phase)
+
+def _trace_slow_log(tr: Trace, outcome: str):
+    if tr.total >= SLOW_INTERACTION_SECONDS:
+        slow_log.log("slow_interaction", {"kind": tr.kind, "handler": tr.name, "outcome": outcome,
+                                          "total": round(tr.total, 4), "phases": tr.breakdown(), **tr.meta})
+
+# app commands are traced by InstrumentedTree; View / modal / DynamicItem callbacks use @tracer.traced(name)
+tracer = Tracer([_trace_metrics, _trace_slow_log])
+
+def _command_name(interaction: Interaction) -> str:
+    return interaction.command.qualified_name if interaction.command else "unknown"
+
+def _observe_command(interaction: Interaction, outcome: str):
+    tr = interaction.extras.get("trace")
+    if tr is not None: tracer.end(tr, outcome, reset=False)
+
+class InstrumentedTree(app_commands.CommandTree):
+    """
+    Traces every app command: the trace starts in interaction_check (same task as the
+    command, so spans below it see it) and ends on completion / on_error.
+    """
+
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        if interaction.type is discord.InteractionType.application_command:
+            interaction.extras["trace"] = tracer.begin(_command_name(interaction), "command",
+                                                       user=interaction.user.id, channel=interaction.channel_id)
+        return True
+
+    async def on_error(self, interaction: Interaction, error: app_commands.AppCommandError):
+        _observe_command(interaction, "error")
+        M_CMD_FAILURES.inc(command=_command_name(interaction))
+        await super().on_error(interaction, error)
 
 # --------------------------------------------------------------------------------------
 # BOT
@@ -117,33 +239,32 @@ def audit_file(event: str, payload: Dict[str, Any]) -> None:
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
-client = commands.Bot(command_prefix="!", intents=intents)
+client = commands.Bot(command_prefix="!", intents=intents, tree_cls=InstrumentedTree, http_trace=_http_trace)
 GUILD_OBJ = discord.Object(id=GUILD_ID) if GUILD_ID else None
 
 def has_any_role(member: discord.Member, role_ids) -> bool:
     ids = set(role_ids if isinstance(role_ids, (list, tuple, set)) else [role_ids])
     return any(r.id in ids for r in member.roles)
 
+async def bounded_gather(coros: Iterable[Awaitable], limit: int) -> List[Any]:
+    """Run coroutines with at most `limit` in flight; exceptions are returned, not raised."""
+    sem = asyncio.Semaphore(limit)
+    async def _one(c):
+        async with sem:
+            return await c
+    return await asyncio.gather(*(_one(c) for c in coros), return_exceptions=True)
+
 # --------------------------------------------------------------------------------------
 # BLACKLIST HELPERS
 # --------------------------------------------------------------------------------------
 def bl_add(user_id: int, types: List[str]):
-    bl = load_json(BLACKLIST_FILE, {})
-    cur = set(bl.get(str(user_id), []))
-    cur |= {t.lower() for t in types}
-    bl[str(user_id)] = sorted(cur)
-    save_json(BLACKLIST_FILE, bl)
+    store.bl_set(user_id, set(store.bl_types(user_id)) | {t.lower() for t in types})
 
 def bl_remove(user_id: int, types: List[str]):
-    bl = load_json(BLACKLIST_FILE, {})
-    cur = set(bl.get(str(user_id), []))
-    cur -= {t.lower() for t in types}
-    bl[str(user_id)] = sorted(cur)
-    save_json(BLACKLIST_FILE, bl)
+    store.bl_set(user_id, set(store.bl_types(user_id)) - {t.lower() for t in types})
 
 def bl_has(user_id: int, ttype: str) -> bool:
-    bl = load_json(BLACKLIST_FILE, {})
-    return ttype.lower() in set(bl.get(str(user_id), []))
+    return ttype.lower() in store.bl_types(user_id)
 
 # --------------------------------------------------------------------------------------
 # TICKETS
@@ -162,32 +283,34 @@ def ticket_meta(ttype: str) -> Dict[str, Any]:
     raise ValueError("bad ticket type")
 
 def next_ticket_number(ttype: str) -> int:
-    counters = load_json(COUNTERS_FILE, {"gs": 1, "mc": 1, "shr": 1})
-    n = int(counters.get(ttype, 1))
-    counters[ttype] = n + 1
-    save_json(COUNTERS_FILE, counters)
-    return n
+    # allocated in one synchronous step on the loop (no await between read and increment),
+    # so concurrent create_ticket calls always get distinct numbers
+    return store.next_counter(ttype)
+
+_ticket_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def ticket_lock(tid) -> asyncio.Lock:
+    """
+    Serializes state changes to one ticket (create / claim / close) across their awaits.
+    Holders re-read the ticket from the store after acquiring it; the lock is dropped
+    once nobody holds or waits on it.
+    """
+    lock = _ticket_locks.get(str(tid))
+    if lock is None: lock = _ticket_locks[str(tid)] = asyncio.Lock()
+    return lock
 
 def get_ticket_by_channel(cid: int) -> Optional[dict]:
-    for t in load_json(TICKETS_FILE, []):
-        if t["channel_id"] == cid:
-            return t
-    return None
+    return store.ticket_by_channel(cid)
 
 def save_ticket(ticket: dict):
-    arr = load_json(TICKETS_FILE, [])
-    for i, t in enumerate(arr):
-        if t["id"] == ticket["id"]:
-            arr[i] = ticket
-            save_json(TICKETS_FILE, arr)
-            return
-    arr.append(ticket)
-    save_json(TICKETS_FILE, arr)
+    store.put_ticket(ticket)
 
 def add_ticket(ticket: dict):
-    arr = load_json(TICKETS_FILE, [])
-    arr.append(ticket)
-    save_json(TICKETS_FILE, arr)
+    store.put_ticket(ticket)
+
+def mark_rendered(ticket: dict):
+    """Record the Status the pinned embed now shows, so startup can skip tickets that are already current."""
+    ticket["status_rendered"] = status_text(ticket)
 
 def status_text(ticket: dict) -> str:
     h = ticket.get("handler_id")
@@ -196,28 +319,214 @@ def status_text(ticket: dict) -> str:
     ended = "Yes" if ticket.get("status") == "closed" else "No"
     return f"**Status**\nClaimed By: {who}\nOngoing: {ongoing}\nEnded: {ended}"
 
-def set_or_update_field(embed: Embed, name: str, value: str, inline: bool = False):
-    # replace existing field by name, or add new if missing
-    for i, f in enumerate(embed.fields):
-        if (f.name or "").strip() == name.strip():
-            embed.set_field_at(i, name=name, value=value, inline=inline)
-            return
-    embed.add_field(name=name, value=value, inline=inline)
+class MessageCache:
+    """Bounded LRU of bot-authored messages (the pinned ticket embeds, delivery requests)."""
+
+    def __init__(self, maxsize: int = 2000):
+        self.maxsize = maxsize
+        self._msgs: "OrderedDict[int, discord.Message]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def put(self, msg: discord.Message):
+        self._msgs[msg.id] = msg
+        self._msgs.move_to_end(msg.id)
+        while len(self._msgs) > self.maxsize: self._msgs.popitem(last=False)
+
+    def get(self, message_id: int) -> Optional[discord.Message]:
+        msg = self._msgs.get(message_id)
+        if msg is None:
+            self.stats["misses"] += 1
+            return None
+        self._msgs.move_to_end(message_id)
+        self.stats["hits"] += 1
+        return msg
+
+    def pop(self, message_id: int):
+        self._msgs.pop(message_id, None)
+
+bot_messages = MessageCache()
+
+# build() -> (embed, view) or None; called at edit time so it always renders the latest state
+EditBuilder = Callable[[], Optional[Tuple[Embed, Optional[ui.View]]]]
+
+class EmbedEditScheduler:
+    """
+    Per-message debounced status edits.
+
+    schedule() records the latest builder for a message and, if none is pending, starts
+    a timer; every schedule() for that message inside the window replaces the builder
+    (counted in stats["coalesced"]), so an add/claim/close burst costs one PATCH. Embeds
+    are rendered from local state, and the edit goes through the cached Message or a
+    PartialMessage, so no edit ever needs a GET. on_applied, if given, runs once the
+    edit has gone through (not when it fails).
+    """
+
+    def __init__(self, window: float, concurrency: int, messages: MessageCache):
+        self.window = window
+        self.messages = messages
+        self._sem = asyncio.Semaphore(concurrency)
+        self._pending: Dict[int, Tuple[discord.abc.Messageable, EditBuilder, Optional[Callable[[], None]]]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.stats = {"requested": 0, "coalesced": 0, "applied": 0, "failed": 0}
+
+    def schedule(self, channel: discord.abc.Messageable, message_id: int, build: EditBuilder,
+                 on_applied: Optional[Callable[[], None]] = None):
+        self.stats["requested"] += 1
+        if message_id in self._pending: self.stats["coalesced"] += 1
+        self._pending[message_id] = (channel, build, on_applied)
+        if message_id not in self._tasks:
+            self._tasks[message_id] = asyncio.create_task(self._run(message_id))
+
+    def cancel(self, message_id: int):
+        self._pending.pop(message_id, None)
+        self.messages.pop(message_id)
+
+    async def _run(self, mid: int):
+        try:
+            await asyncio.sleep(self.window)
+            job = self._pending.pop(mid, None)
+            if not job: return
+            channel, build, on_applied = job
+            out = build()
+            if out is None: return
+            emb, view = out
+            async with self._sem:
+                target = self.messages.get(mid) or channel.get_partial_message(mid)
+                new = await target.edit(embed=emb, view=view)
+            if new is not None: self.messages.put(new)
+            self.stats["applied"] += 1
+            if on_applied: on_applied()
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.messages.pop(mid)
+            print(f"[edits] message {mid} edit failed: {e}")
+        finally:
+            self._tasks.pop(mid, None)
+            if mid in self._pending:  # scheduled again after we took the job
+                self._tasks[mid] = asyncio.create_task(self._run(mid))
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+edits = EmbedEditScheduler(EDIT_DEBOUNCE_SECONDS, EDIT_CONCURRENCY, bot_messages)
+
+class JobQueueFull(Exception):
+    pass
+
+class JobQueue:
+    """
+    Bounded queue of slow interaction work, run by a fixed pool of worker tasks.
+
+    Handlers defer first (Discord's 3s ack window) and submit() the rest; the job reports
+    back through interaction.followup. submit() returns False if a job with the same key
+    (e.g. one user's ticket creation) is still queued or running, and raises JobQueueFull
+    when `maxsize` jobs are waiting. Each job runs in its own trace, named after the queue.
+    """
+
+    def __init__(self, name: str, workers: int, maxsize: int, on_wait: Optional[Callable[[float], None]] = None):
+        self.name = name
+        self.workers = workers
+        self.on_wait = on_wait  # seconds a job sat in the queue before a worker picked it up
+        self._queue: "asyncio.Queue[Tuple[str, Callable[[], Awaitable[Any]], float]]" = asyncio.Queue(maxsize)
+        self._keys: set = set()
+        self._tasks: List[asyncio.Task] = []
+        self.running = 0
+        self.stats = {"submitted": 0, "deduped": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def start(self):
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._run()))
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]]) -> bool:
+        if key in self._keys:
+            self.stats["deduped"] += 1
+            return False
+        try:
+            self._queue.put_nowait((key, job, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise JobQueueFull(self.name)
+        self._keys.add(key)
+        self.stats["submitted"] += 1
+        self.start()
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        while True:
+            key, job, queued_at = await self._queue.get()
+            if self.on_wait: self.on_wait(time.perf_counter() - queued_at)
+            self.running += 1
+            tr = tracer.begin(f"job:{self.name}", "job")
+            outcome = "error"
+            try:
+                await job()
+                outcome = "ok"
+                self.stats["completed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"[jobs] {self.name} job {key} failed: {e}")
+            finally:
+                tracer.end(tr, outcome)
+                self.running -= 1
+                self._keys.discard(key)
+                self._queue.task_done()
+
+    async def drain(self):
+        await self._queue.join()
+
+    async def aclose(self, timeout: float = 10.0):
+        """Let queued jobs finish (up to `timeout`), then stop the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"[jobs] {self.name}: {self.depth() + self.running} jobs unfinished at shutdown")
+        for t in self._tasks: t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+ticket_jobs = JobQueue("create_ticket", TICKET_JOB_WORKERS, TICKET_JOB_QUEUE,
+                       on_wait=lambda s: M_JOB_WAIT.observe(s, queue="create_ticket"))
+# unbounded: every queued close is already persisted (see request_close), the queue only paces them
+close_jobs = JobQueue("close_ticket", CLOSE_WORKERS, 0, on_wait=lambda s: M_JOB_WAIT.observe(s, queue="close_ticket"))
+job_queues = (ticket_jobs, close_jobs)
+
+async def submit_ticket_job(interaction: Interaction, ttype: str, subject: Optional[str] = None):
+    """Ack now, create the ticket in the background, answer through the followup webhook."""
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    guild, user = interaction.guild, interaction.user
+    async def job():
+        try:
+            ch = await create_ticket(guild, user, ttype=ttype, subject=subject)
+        except Exception:
+            await interaction.followup.send("Couldn't create your ticket, please try again.", ephemeral=True)
+            raise
+        await interaction.followup.send(f"Ticket created: {ch.mention}", ephemeral=True)
+    try:
+        queued = ticket_jobs.submit(f"create_ticket:{user.id}", job)
+    except JobQueueFull:
+        await interaction.followup.send("The bot is busy right now, please try again in a minute.", ephemeral=True); return
+    if not queued:
+        await interaction.followup.send("Your ticket is already being created.", ephemeral=True)
 
 async def edit_ticket_embed_status(channel: discord.TextChannel, ticket: dict):
-    """Edit the pinned ticket embed message to reflect current status."""
-    msg_id = ticket.get("message_id")
-    if not msg_id:
+    """Schedule an edit of the pinned ticket embed to reflect current status (coalesced, see EmbedEditScheduler)."""
+    if not ticket.get("message_id"):
         return
-    try:
-        msg = await channel.fetch_message(msg_id)
-        if not msg.embeds:
-            return
-        emb = msg.embeds[0]
-        set_or_update_field(emb, "Status", status_text(ticket), inline=False)
-        await msg.edit(embed=emb, view=TicketActionView(ticket))
-    except Exception:
-        pass
+    def build():
+        if ticket.get("status") != "open": return None  # closed meanwhile; the channel is going away
+        mark_rendered(ticket)
+        save_ticket(ticket)
+        return render_ticket_embed(ticket), TicketActionView(ticket)
+    edits.schedule(channel, ticket["message_id"], build)
+
+async def _reply_close(interaction: Interaction, queued: bool):
+    if queued: await interaction.followup.send("Closing this ticket…")
+    else: await interaction.followup.send("This ticket is already closed or being closed.", ephemeral=True)
 
 class ConfirmCloseView(ui.View):
     def __init__(self, opener_id: int, handler_id: Optional[int], ticket_id: str):
@@ -227,6 +536,7 @@ class ConfirmCloseView(ui.View):
         self.ticket_id = ticket_id
 
     @ui.button(label="Yes, close", style=discord.ButtonStyle.danger, custom_id="close_yes")
+    @tracer.traced("close_yes")
     async def yes(self, interaction: Interaction, button: ui.Button):
         t = get_ticket_by_channel(interaction.channel.id)
         if not t or t["id"] != self.ticket_id:
@@ -235,9 +545,10 @@ class ConfirmCloseView(ui.View):
         if interaction.user.id not in {t["opener_id"], t.get("handler_id")} and not has_any_role(interaction.user, [needed_role]):
             await interaction.response.send_message("You cannot close this ticket.", ephemeral=True); return
         await interaction.response.defer()
-        await close_and_transcript(interaction.guild, interaction.channel, t, reason=None, by=interaction.user)
+        await _reply_close(interaction, await request_close(interaction.guild, t, reason=None, by=interaction.user))
 
     @ui.button(label="No, cancel", style=discord.ButtonStyle.secondary, custom_id="close_no")
+    @tracer.traced("close_no")
     async def no(self, interaction: Interaction, button: ui.Button):
         await interaction.response.send_message("Close cancelled.", ephemeral=True)
         self.stop()
@@ -247,12 +558,13 @@ class ReasonModal(ui.Modal, title="Close with Reason"):
     def __init__(self, ticket: dict):
         super().__init__(timeout=180)
         self.ticket = ticket
+    @tracer.traced("close_reason_modal")
     async def on_submit(self, interaction: Interaction):
         needed_role = ticket_meta(self.ticket["type"])["ping_role"]
         if interaction.user.id not in {self.ticket["opener_id"], self.ticket.get("handler_id")} and not has_any_role(interaction.user, [needed_role]):
             await interaction.response.send_message("You cannot close this ticket.", ephemeral=True); return
         await interaction.response.defer()
-        await close_and_transcript(interaction.guild, interaction.channel, self.ticket, reason=str(self.reason), by=interaction.user)
+        await _reply_close(interaction, await request_close(interaction.guild, self.ticket, reason=str(self.reason), by=interaction.user))
 
 class TicketActionView(ui.View):
     def __init__(self, ticket: dict):
@@ -260,14 +572,21 @@ class TicketActionView(ui.View):
         self.ticket = ticket
 
     @ui.button(label="Claim", style=discord.ButtonStyle.success, custom_id="ticket_claim")
+    @tracer.traced("ticket_claim")
     async def claim(self, interaction: Interaction, button: ui.Button):
         meta = ticket_meta(self.ticket["type"])
         if not has_any_role(interaction.user, [meta["ping_role"]]):
             await interaction.response.send_message("Only the pinged role can claim.", ephemeral=True); return
-        if self.ticket.get("handler_id"):
-            await interaction.response.send_message("Already claimed.", ephemeral=True); return
-        self.ticket["handler_id"] = interaction.user.id
-        save_ticket(self.ticket)
+        async with ticket_lock(self.ticket["id"]):
+            t = store.ticket(self.ticket["id"])
+            if not t or t.get("status") != "open":
+                await interaction.response.send_message("This ticket is closed.", ephemeral=True); return
+            if t.get("handler_id"):
+                await interaction.response.send_message("Already claimed.", ephemeral=True); return
+            t["handler_id"] = interaction.user.id
+            save_ticket(t)
+        self.ticket = t
+        audit_file("ticket_claim", {"ticket_id": self.ticket["id"], "type": self.ticket["type"], "by": interaction.user.id})
         # disable button and update pinned embed's Status field
         button.disabled = True
         await edit_ticket_embed_status(interaction.channel, self.ticket)
@@ -277,6 +596,7 @@ class TicketActionView(ui.View):
         await interaction.response.send_message(f"{interaction.user.mention} claimed this ticket.", ephemeral=False)
 
     @ui.button(label="Close", style=discord.ButtonStyle.danger, custom_id="ticket_close")
+    @tracer.traced("ticket_close")
     async def close_btn(self, interaction: Interaction, button: ui.Button):
         t = self.ticket
         meta = ticket_meta(t["type"])
@@ -286,6 +606,7 @@ class TicketActionView(ui.View):
         await interaction.response.send_message("Are you sure you want to close the ticket?", view=view, ephemeral=False)
 
     @ui.button(label="Close w/ Reason", style=discord.ButtonStyle.secondary, custom_id="ticket_close_reason")
+    @tracer.traced("ticket_close_reason")
     async def close_reason(self, interaction: Interaction, button: ui.Button):
         t = self.ticket
         meta = ticket_meta(t["type"])
@@ -293,8 +614,8 @@ class TicketActionView(ui.View):
             await interaction.response.send_message("You cannot close this ticket.", ephemeral=True); return
         await interaction.response.send_modal(ReasonModal(t))
 
-async def transcript_text(channel: discord.TextChannel, ticket: dict) -> str:
-    lines = [
+def transcript_header(channel: discord.TextChannel, ticket: dict) -> List[str]:
+    return [
         f"Ticket: {ticket.get('type','?').upper()} #{ticket.get('number','?')} ({channel.name})",
         f"Channel ID: {channel.id}",
         f"Opened by: {ticket.get('opener_id')}",
@@ -303,47 +624,203 @@ async def transcript_text(channel: discord.TextChannel, ticket: dict) -> str:
         f"Generated: {datetime.now(timezone.utc).isoformat()}",
         "-" * 60,
     ]
-    async for m in channel.history(limit=2000, oldest_first=True):
-        t = m.created_at.replace(tzinfo=timezone.utc).isoformat() if m.created_at else "?"
-        author = f"{m.author} ({m.author.id})"
-        content = (m.content or "").replace("\r", "")
-        if content.strip(): lines.append(f"[{t}] {author}: {content}")
-        for a in m.attachments: lines.append(f"[{t}] {author} [attachment]: {a.url}")
-        for e in m.embeds: lines.append(f"[{t}] {author} [embed]: {(e.title or '').strip()} {(e.description or '').strip()}".strip())
-    return "\n".join(lines)
-
-async def close_and_transcript(guild: discord.Guild, channel: discord.TextChannel, ticket: dict, reason: Optional[str], by: discord.abc.User):
-    text = await transcript_text(channel, ticket)
-    trans = guild.get_channel(CHAN_TRANSCRIPTS)
-    if trans:
-        if len(text) <= 1800:
-            emb = Embed(title="Ticket Closed", color=discord.Color.dark_grey())
-            emb.add_field(name="Channel", value=f"{channel.name} (`{channel.id}`)", inline=False)
-            emb.add_field(name="Type", value=ticket.get("type","?").upper(), inline=True)
-            emb.add_field(name="Number", value=str(ticket.get("number","?")), inline=True)
-            emb.add_field(name="Closed By", value=f"{by} (`{by.id}`)", inline=False)
-            if reason: emb.add_field(name="Reason", value=reason, inline=False)
-            emb.description = f"```txt\n{text}\n```"
-            await trans.send(embed=emb)
+
+def message_record(m: discord.Message) -> Dict[str, Any]:
+    return {
+        "op": "create", "id": m.id,
+        "ts": m.created_at.replace(tzinfo=timezone.utc).isoformat() if m.created_at else "?",
+        "author": str(m.author), "author_id": m.author.id, "content": m.content or "",
+        "attachments": [a.url for a in m.attachments],
+        "embeds": [f"{(e.title or '').strip()} {(e.description or '').strip()}".strip() for e in m.embeds],
+    }
+
+def new_transcript_spool(archive: Optional[ArchiveWriter] = None, files: Optional[Dict[str, Dict[str, Any]]] = None) -> TranscriptSpool:
+    return TranscriptSpool(compress=TRANSCRIPT_GZIP, spool_bytes=TRANSCRIPT_SPOOL_BYTES, preview_max=TRANSCRIPT_EMBED_MAX,
+                           archive=archive, files=files)
+
+async def archive_attachments(channel: discord.TextChannel, refs: List[Tuple[int, str]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Copy a ticket's attachments into the blob store: url -> {"sha256", "size"} or {"error"}.
+    Links logged days ago may have expired; those messages are fetched once for fresh links.
+    """
+    if not refs: return {}
+    files = await attachment_archive.fetch_all(u for _, u in refs)
+    stale = {mid for mid, u in refs if files[u].get("status") in (403, 404)}
+    async def refresh(mid: int):
+        msg = await channel.fetch_message(mid)
+        fresh = {a.id: a.url for a in msg.attachments}
+        for m, u in refs:
+            if m == mid and attachment_id(u) in fresh and "sha256" not in files[u]:
+                files[u] = await attachment_archive.fetch(fresh[attachment_id(u)])
+    await bounded_gather((refresh(mid) for mid in stale), ATTACHMENT_CONCURRENCY)
+    return files
+
+def archive_meta(ticket: dict, job: dict, channel: discord.TextChannel) -> Dict[str, Any]:
+    # closed_at is the request time, so a retried close archives byte-identical content
+    return {"ticket_id": ticket["id"], "type": ticket.get("type"), "number": ticket.get("number"), "channel": channel.name,
+            "opener_id": ticket.get("opener_id"), "handler_id": ticket.get("handler_id"), "closed_by": job["by_id"],
+            "reason": job.get("reason"), "closed_at": job.get("queued_at")}
+
+async def stream_transcript(channel: discord.TextChannel, ticket: dict, archive: Optional[ArchiveWriter] = None) -> Tuple[IO[bytes], Optional[str]]:
+    """
+    Page through the channel's entire history into a spooled temp file (optionally gzip).
+    Returns (file rewound to 0, full text if it fits in an embed else None). Memory stays
+    bounded by TRANSCRIPT_SPOOL_BYTES plus one history page, however long the ticket is.
+    Each page's attachments are archived before it is written out (history links are fresh).
+    Pages are buffered on the loop; the spool / archive writes run on the persist worker.
+    Only used for tickets whose local log (TicketLog) is not complete.
+    """
+    out = new_transcript_spool(archive, {})
+    header: Optional[List[str]] = transcript_header(channel, ticket)
+    page: List[Dict[str, Any]] = []
+    async def flush_page():
+        nonlocal header
+        out.files.update(await attachment_archive.fetch_all(u for rec in page for u in rec["attachments"]))
+        await store.worker.call(out.write, page, header)
+        header = None
+    async for m in channel.history(limit=None, oldest_first=True):
+        page.append(message_record(m))
+        if len(page) >= 100:
+            await flush_page(); page = []
+    await flush_page()
+    return await store.worker.call(out.finish)
+
+CLOSE_JOBS = "close_jobs"  # kv collection: ticket id -> close job, on disk before the close starts
+
+def queue_close(ticket: dict, reason: Optional[str], by: discord.abc.User) -> Optional[dict]:
+    """
+    Record a close job for `ticket`. Returns None if the ticket is already closed or a
+    close is pending (e.g. a double click); a job that failed for good is re-armed.
+    No awaits, so the check and the write can't interleave with another request.
+    """
+    tid = ticket["id"]
+    live = store.ticket(tid)
+    if live is None or live.get("status") == "closed": return None
+    job = store.kv_get(CLOSE_JOBS, tid)
+    if job is not None and not job.get("failed"): return None
+    if job is None:
+        job = {"ticket_id": tid, "guild_id": live.get("guild_id"), "channel_id": live["channel_id"], "posted": False}
+    job.update({"reason": reason, "by_id": by.id, "by": str(by), "attempts": 0, "failed": False,
+                "queued_at": datetime.now(timezone.utc).isoformat()})
+    store.kv_set(CLOSE_JOBS, tid, job)
+    return job
+
+def submit_close(guild: discord.Guild, tid: str):
+    close_jobs.submit(f"close:{tid}", lambda: run_close_job(guild, tid))
+
+async def request_close(guild: discord.Guild, ticket: dict, reason: Optional[str], by: discord.abc.User) -> bool:
+    """Persist a close job and hand it to the close workers. False if the ticket is already closed or closing."""
+    job = queue_close(ticket, reason, by)
+    if job is None: return False
+    await store.sync()
+    submit_close(guild, job["ticket_id"])
+    return True
+
+def _retry_delay(e: Exception, attempt: int) -> Optional[float]:
+    """Backoff before the next attempt, or None if `e` is not worth retrying (only 429 / 5xx / network errors are)."""
+    if isinstance(e, discord.HTTPException):
+        if e.status != 429 and e.status < 500: return None
+    elif not isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError, OSError)):
+        return None
+    delay = min(CLOSE_RETRY_MAX_SECONDS, CLOSE_RETRY_BASE_SECONDS * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+    retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
+    try: return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError: return delay
+
+async def run_close_job(guild: discord.Guild, tid: str):
+    for attempt in range(1, CLOSE_MAX_ATTEMPTS + 1):
+        job = store.kv_get(CLOSE_JOBS, tid)
+        if job is None: return
+        job["attempts"] = job.get("attempts", 0) + 1
+        try:
+            await close_ticket(guild, job)
+        except Exception as e:
+            job["error"] = f"{type(e).__name__}: {e}"
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == CLOSE_MAX_ATTEMPTS:
+                job["failed"] = True
+                store.kv_set(CLOSE_JOBS, tid, job)
+                audit_file("ticket_close_failed", {"ticket_id": tid, "attempts": job["attempts"], "error": job["error"]})
+                raise
+            store.kv_set(CLOSE_JOBS, tid, job)
+            M_JOB_RETRIES.inc(queue=close_jobs.name)
+            print(f"[close] ticket {tid} attempt {attempt} failed ({job['error']}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
         else:
-            await trans.send("Transcript too long — uploading as file.")
-            await trans.send(file=discord.File(io.BytesIO(text.encode("utf-8")), filename=f"transcript-{channel.id}.txt"))
-    ticket["status"] = "closed"
-    save_ticket(ticket)
-    try:
-        await channel.delete(reason=reason or "Ticket closed")
-    except Exception:
-        pass
+            store.kv_del(CLOSE_JOBS, tid)
+            return
+
+async def close_ticket(guild: discord.Guild, job: dict):
+    """
+    Transcript, archive and delete a ticket. Progress is kept in the job, so a retry or a
+    resumed job after a restart skips the steps that already happened.
+    """
+    tid = job["ticket_id"]
+    async with ticket_lock(tid):
+        ticket = store.ticket(tid)
+        channel = guild.get_channel(job["channel_id"])
+        if ticket is not None and channel is not None and not job.get("posted"):
+            archive = await store.worker.call(transcript_archive.writer, archive_meta(ticket, job, channel))
+            try:
+                with span("transcript"):
+                    if tlog.tracked(channel.id):
+                        # already on disk from on_message: zero history API calls
+                        files = await archive_attachments(channel, await tlog.attachments(channel.id))
+                        spool, text = await tlog.finalize(channel.id, transcript_header(channel, ticket), new_transcript_spool(archive, files))
+                    else:
+                        spool, text = await stream_transcript(channel, ticket, archive)
+                    # stored and searchable before anything is posted, whatever happens to the Discord side
+                    job["archive_sha"] = await store.worker.call(transcript_archive.commit, archive)
+            except BaseException:
+                await store.worker.call(archive.abort)
+                raise
+            trans = guild.get_channel(CHAN_TRANSCRIPTS)
+            try:
+                if trans:
+                    if text is not None:
+                        emb = Embed(title="Ticket Closed", color=discord.Color.dark_grey())
+                        emb.add_field(name="Channel", value=f"{channel.name} (`{channel.id}`)", inline=False)
+                        emb.add_field(name="Type", value=ticket.get("type","?").upper(), inline=True)
+                        emb.add_field(name="Number", value=str(ticket.get("number","?")), inline=True)
+                        emb.add_field(name="Closed By", value=f"{job['by']} (`{job['by_id']}`)", inline=False)
+                        if job.get("reason"): emb.add_field(name="Reason", value=job["reason"], inline=False)
+                        emb.description = f"```txt\n{text}\n```"
+                        await trans.send(embed=emb)
+                    else:
+                        await trans.send("Transcript too long — uploading as file.")
+                        fname = f"transcript-{channel.id}.txt" + (".gz" if TRANSCRIPT_GZIP else "")
+                        await trans.send(file=discord.File(spool, filename=fname))
+            finally:
+                spool.close()
+            job["posted"] = True
+            store.kv_set(CLOSE_JOBS, tid, job)
+        if ticket is not None:
+            with span("storage"):
+                ticket["status"] = "closed"
+                ticket["closed_at"] = datetime.now(timezone.utc).isoformat()
+                store.archive_ticket(ticket)
+                tlog.drop(job["channel_id"])
+                if ticket.get("message_id"): edits.cancel(ticket["message_id"])
+                audit_file("ticket_close", {"ticket_id": tid, "type": ticket.get("type"), "by": job["by_id"], "reason": job.get("reason")})
+        if channel is not None:
+            try:
+                await channel.delete(reason=job.get("reason") or "Ticket closed")
+            except discord.NotFound:
+                pass
 
-def base_ticket_embed(ttype: str, opener: discord.Member, subject: Optional[str], status_block: str) -> Embed:
+def base_ticket_embed(ttype: str, opener_mention: str, subject: Optional[str], status_block: str) -> Embed:
     meta = ticket_meta(ttype)
     e = Embed(title=f"{meta['label']} Ticket", description=meta["bio"], color=discord.Color.red())
-    e.add_field(name="Opened by", value=opener.mention, inline=False)
+    e.add_field(name="Opened by", value=opener_mention, inline=False)
     if subject: e.add_field(name="Subject", value=subject, inline=False)
     e.add_field(name="Status", value=status_block, inline=False)
     e.set_footer(text="Use the buttons to claim or close this ticket.")
     return e
 
+def render_ticket_embed(ticket: dict) -> Embed:
+    """The pinned ticket embed, rebuilt purely from ticket state (identical to what create_ticket posts)."""
+    return base_ticket_embed(ticket["type"], f"<@{ticket['opener_id']}>", ticket.get("subject") or None, status_text(ticket))
+
 def pick_category(guild: discord.Guild, ttype: str) -> discord.CategoryChannel:
     cat_id = ticket_meta(ttype)["cat"]
     cat = guild.get_channel(cat_id)
@@ -387,20 +864,26 @@ async def create_ticket(guild: discord.Guild, opener: discord.Member, ttype: Lit
         "subject": subject or "",
         "message_id": None,
     }
-    add_ticket(ticket)
-
-    emb = base_ticket_embed(ttype, opener, subject, status_text(ticket))
-    view = TicketActionView(ticket)
-    header_ping = f"-# <@&{meta['ping_role']}>"
-    msg = await ch.send(content=header_ping, embed=emb, view=view,
-                        allowed_mentions=discord.AllowedMentions(roles=True, users=True))
-    try:
-        await msg.pin()
-    except Exception:
-        pass
-    # store the pinned message id
-    ticket["message_id"] = msg.id
-    save_ticket(ticket)
+    async with ticket_lock(ticket["id"]):  # a close can't run before the pinned message id is stored
+        with span("storage"):
+            add_ticket(ticket)
+            tlog.begin(ch.id)
+            audit_file("ticket_open", {"ticket_id": ticket["id"], "type": ttype, "number": num, "by": opener.id})
+
+        emb = render_ticket_embed(ticket)
+        view = TicketActionView(ticket)
+        header_ping = f"-# <@&{meta['ping_role']}>"
+        msg = await ch.send(content=header_ping, embed=emb, view=view,
+                            allowed_mentions=discord.AllowedMentions(roles=True, users=True))
+        bot_messages.put(msg)
+        try:
+            await msg.pin()
+        except Exception:
+            pass
+        # store the pinned message id
+        ticket["message_id"] = msg.id
+        mark_rendered(ticket)
+        save_ticket(ticket)
     return ch
 
 # Ticket Panel (persistent)
@@ -413,12 +896,12 @@ class TicketDropdown(ui.Select):
         ]
         super().__init__(placeholder="Select a ticket type…", min_values=1, max_values=1, options=opts, custom_id="ticket_dropdown_main")
 
+    @tracer.traced("ticket_dropdown")
     async def callback(self, interaction: Interaction):
         ttype = self.values[0]
         if bl_has(interaction.user.id, ttype):
             await interaction.response.send_message("You are blacklisted from this ticket type.", ephemeral=True); return
-        await create_ticket(interaction.guild, interaction.user, ttype=ttype)
-        await interaction.response.send_message("Ticket created.", ephemeral=True)
+        await submit_ticket_job(interaction, ttype)
 
 class TicketPanelView(ui.View):
     def __init__(self):
@@ -426,10 +909,9 @@ class TicketPanelView(ui.View):
         self.add_item(TicketDropdown())
 
 async def ensure_ticket_panel(guild: discord.Guild):
-    panel_data = load_json(PERSIST_FILE, {})
     ch = guild.get_channel(TICKET_PANEL_CHANNEL_ID)
     if not isinstance(ch, discord.TextChannel): return
-    msg_id = panel_data.get("message_id")
+    msg_id = store.panel_get("message_id")
     view = TicketPanelView()
     if msg_id:
         try:
@@ -450,7 +932,7 @@ async def ensure_ticket_panel(guild: discord.Guild):
         color=discord.Color.red()
     )
     msg = await ch.send(embed=embed, view=view)
-    save_json(PERSIST_FILE, {"message_id": msg.id})
+    store.panel_set("message_id", msg.id)
 
 # Commands for tickets
 @client.tree.command(guild=GUILD_OBJ, name="ticket_embed", description="Post/refresh the ticket panel (staff only).")
@@ -470,8 +952,7 @@ async def ticket_open(interaction: Interaction, ticket_type: app_commands.Choice
     ttype = ticket_type.value
     if bl_has(interaction.user.id, ttype):
         await interaction.response.send_message("You are blacklisted from this ticket type.", ephemeral=True); return
-    await create_ticket(interaction.guild, interaction.user, ttype=ttype, subject=subject)
-    await interaction.response.send_message("Ticket created.", ephemeral=True)
+    await submit_ticket_job(interaction, ttype, subject)
 
 @client.tree.command(guild=GUILD_OBJ, name="ticket_close", description="Close this ticket (asks for confirmation).")
 async def ticket_close(interaction: Interaction):
@@ -484,6 +965,67 @@ async def ticket_close(interaction: Interaction):
     view = ConfirmCloseView(t["opener_id"], t.get("handler_id"), t["id"])
     await interaction.response.send_message("Are you sure you want to close the ticket?", view=view, ephemeral=False)
 
+@app_commands.choices(ticket_type=[
+    app_commands.Choice(name="General Support", value="gs"),
+    app_commands.Choice(name="Misconduct", value="mc"),
+    app_commands.Choice(name="Senior High Ranking", value="shr"),
+])
+@app_commands.describe(ticket_type="Only tickets of this type", older_than_hours="Only tickets opened at least this long ago",
+                       unclaimed_only="Skip tickets someone has claimed", reason="Close reason (shown in the transcripts)")
+@client.tree.command(guild=GUILD_OBJ, name="ticket_close_bulk", description="Close every open ticket matching the filters (staff only).")
+async def ticket_close_bulk(interaction: Interaction, ticket_type: Optional[app_commands.Choice[str]] = None,
+                            older_than_hours: Optional[app_commands.Range[int, 0, 8760]] = None,
+                            unclaimed_only: bool = False, reason: Optional[str] = None):
+    if not has_any_role(interaction.user, [STAFF_ROLE_ID]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours) if older_than_hours is not None else None
+    jobs = []
+    for t in store.open_tickets():
+        if t.get("guild_id") not in (None, interaction.guild.id): continue
+        if ticket_type and t["type"] != ticket_type.value: continue
+        if unclaimed_only and t.get("handler_id"): continue
+        if cutoff and discord.utils.snowflake_time(t["channel_id"]) > cutoff: continue
+        job = queue_close(t, reason or "Bulk close", interaction.user)
+        if job: jobs.append(job)
+    if jobs:
+        await store.sync()  # one write for the whole batch, before any of them runs
+        for job in jobs: submit_close(interaction.guild, job["ticket_id"])
+    audit_file("ticket_close_bulk", {"by": interaction.user.id, "queued": len(jobs), "type": ticket_type.value if ticket_type else None,
+                                     "older_than_hours": older_than_hours, "unclaimed_only": unclaimed_only, "reason": reason})
+    await interaction.followup.send(f"Queued {len(jobs)} ticket(s) for closing; {CLOSE_WORKERS} are closed at a time.", ephemeral=True)
+
+@app_commands.choices(ticket_type=[
+    app_commands.Choice(name="General Support", value="gs"),
+    app_commands.Choice(name="Misconduct", value="mc"),
+    app_commands.Choice(name="Senior High Ranking", value="shr"),
+])
+@app_commands.describe(query="Words to find, all must match (word* matches a prefix)", user="Only messages written by this user",
+                       ticket_type="Only tickets of this type", days="Only tickets closed in the last N days")
+@client.tree.command(guild=GUILD_OBJ, name="transcript_search", description="Search closed ticket transcripts (staff only).")
+async def transcript_search(interaction: Interaction, query: Optional[str] = None, user: Optional[discord.User] = None,
+                            ticket_type: Optional[app_commands.Choice[str]] = None, days: Optional[app_commands.Range[int, 1, 3650]] = None):
+    if not has_any_role(interaction.user, [STAFF_ROLE_ID]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    if not (query or "").strip() and user is None:
+        await interaction.response.send_message("Give a query, a user, or both.", ephemeral=True); return
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d") if days else None
+    await interaction.response.defer(ephemeral=True, thinking=True)  # the query waits behind any flush on the writer thread
+    t0 = time.perf_counter()
+    hits = await store.worker.call(lambda: transcript_archive.search(query or "", user.id if user else None,
+                                                                      ticket_type.value if ticket_type else None, since))
+    took = (time.perf_counter() - t0) * 1000
+    if not hits:
+        await interaction.followup.send(f"No transcripts match. ({took:.0f} ms)", ephemeral=True); return
+    lines = []
+    for h in hits:
+        head = f"**{(h['type'] or '?').upper()} #{h['number']}** · `{h['ticket_id']}` · {(h['closed_at'] or '?')[:10]} · "
+        head += f"{h['hits']} match(es)" if h["snippet"] else f"{h['hits']} of {h['messages']} messages"
+        lines.append(head + (f"\n> {h['snippet'][:200]}" if h["snippet"] else ""))
+    emb = Embed(title="Transcript search", description="\n".join(lines)[:4000], color=discord.Color.dark_grey())
+    emb.set_footer(text=f"{len(hits)} ticket(s) · {took:.0f} ms")
+    await interaction.followup.send(embed=emb, ephemeral=True)
+
 @client.tree.command(guild=GUILD_OBJ, name="ticket_close_request", description="Handler requests close; opener must approve.")
 async def ticket_close_request(interaction: Interaction):
     t = get_ticket_by_channel(interaction.channel.id)
@@ -496,11 +1038,13 @@ async def ticket_close_request(interaction: Interaction):
     if not opener:
         await interaction.response.send_message("Opener not found.", ephemeral=True); return
     view = ui.View(timeout=300)
+    @tracer.traced("close_request_approve")
     async def approve(inter: Interaction):
         if inter.user.id != t["opener_id"]:
             await inter.response.send_message("Only the ticket opener can approve.", ephemeral=True); return
         await inter.response.defer()
-        await close_and_transcript(inter.guild, inter.channel, t, reason="Approved by opener", by=inter.user)
+        await _reply_close(inter, await request_close(inter.guild, t, reason="Approved by opener", by=inter.user))
+    @tracer.traced("close_request_decline")
     async def decline(inter: Interaction):
         if inter.user.id != t["opener_id"]:
             await inter.response.send_message("Only the ticket opener can respond.", ephemeral=True); return
@@ -519,6 +1063,7 @@ async def ticket_add(interaction: Interaction, user: discord.Member):
     if interaction.user.id != t.get("handler_id"):
         await interaction.response.send_message("Only the handler can add users.", ephemeral=True); return
     await interaction.channel.set_permissions(user, view_channel=True, send_messages=True, read_message_history=True, attach_files=True, embed_links=True)
+    audit_file("ticket_add_user", {"ticket_id": t["id"], "user": user.id, "by": interaction.user.id})
     await edit_ticket_embed_status(interaction.channel, t)
     await interaction.response.send_message(f"Added {user.mention} to the ticket.", ephemeral=False)
 
@@ -530,9 +1075,62 @@ async def ticket_remove(interaction: Interaction, user: discord.Member):
     if interaction.user.id != t.get("handler_id"):
         await interaction.response.send_message("Only the handler can remove users.", ephemeral=True); return
     await interaction.channel.set_permissions(user, overwrite=None)
+    audit_file("ticket_remove_user", {"ticket_id": t["id"], "user": user.id, "by": interaction.user.id})
     await interaction.response.send_message(f"Removed {user.mention} from the ticket.", ephemeral=False)
 
+@client.tree.command(guild=GUILD_OBJ, name="ticket_history", description="List a user's tickets, including archived ones (SHR only).")
+async def ticket_history(interaction: Interaction, user: discord.Member):
+    if not has_any_role(interaction.user, [ROLE_SHR_STAFF]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True, thinking=True)  # archive reads queue behind flushes on the writer thread
+    rows = await store.worker.call(store.ticket_history, user.id)
+    if not rows:
+        await interaction.followup.send(f"No tickets found for {user.mention}.", ephemeral=True); return
+    rows.sort(key=lambda t: int(t["id"]), reverse=True)
+    lines = [f"`{t['type'].upper()} #{t.get('number','?')}` · {t.get('status')} · id `{t['id']}`" for t in rows[:15]]
+    more = f"\n…and {len(rows) - 15} more." if len(rows) > 15 else ""
+    await interaction.followup.send(f"Tickets for {user.mention}:\n" + "\n".join(lines) + more, ephemeral=True)
+
 # Ticket Blacklist (log to CHAN_TICKET_BL_LOG; unblacklist replies to last msg)
+# The last log message per (kind, user) is indexed in the store ("bl_log": "ticket:<uid>" -> message id),
+# so revocations reply directly instead of scanning the channel's history.
+_BL_LOG_TITLES = {"Ticket Blacklist": "ticket", "Driver Blacklist": "driver"}
+_BL_USER_RE = re.compile(r"\(`(\d+)`\)")
+
+def bl_log_key(kind: str, user_id: int) -> str:
+    return f"{kind}:{user_id}"
+
+async def reply_to_bl_log(guild: discord.Guild, kind: str, user_id: int, text: str):
+    mid = store.kv_get("bl_log", bl_log_key(kind, user_id))
+    ch = guild.get_channel(CHAN_TICKET_BL_LOG)
+    if not mid or not ch: return
+    try:
+        await ch.get_partial_message(mid).reply(text)
+    except discord.NotFound:
+        store.kv_del("bl_log", bl_log_key(kind, user_id))
+    except Exception:
+        pass
+
+async def index_blacklist_log(guild: discord.Guild):
+    """One-time backfill: index every blacklist log post already in CHAN_TICKET_BL_LOG (newest wins)."""
+    if store.kv_get("meta", "bl_log_indexed"): return
+    ch = guild.get_channel(CHAN_TICKET_BL_LOG)
+    if not isinstance(ch, discord.TextChannel): return
+    n = 0
+    try:
+        async for m in ch.history(limit=None):  # newest first
+            if m.author.id != client.user.id or not m.embeds: continue
+            kind = _BL_LOG_TITLES.get((m.embeds[0].title or "").strip())
+            hit = kind and _BL_USER_RE.search("".join((f.value or "") for f in m.embeds[0].fields))
+            if not hit: continue
+            key = bl_log_key(kind, int(hit.group(1)))
+            if store.kv_get("bl_log", key) is None:  # posts indexed live during the backfill are newer
+                store.kv_set("bl_log", key, m.id); n += 1
+    except Exception as e:
+        print(f"[bl_log] backfill failed: {e}"); return
+    store.kv_set("meta", "bl_log_indexed", True)
+    print(f"[bl_log] indexed {n} blacklist log posts")
+
 @client.tree.command(guild=GUILD_OBJ, name="ticket_blacklist", description="Blacklist a user from ticket types (SHR only).")
 async def ticket_blacklist(interaction: Interaction, user: discord.Member, types: str):
     if not has_any_role(interaction.user, [ROLE_SHR_STAFF]):
@@ -542,11 +1140,14 @@ async def ticket_blacklist(interaction: Interaction, user: discord.Member, types
     tlist = [t.strip().lower() for t in types.split(",") if t.strip()]
     if "all" in tlist: tlist = ["gs","mc","shr"]
     bl_add(user.id, tlist)
+    audit_file("ticket_blacklist", {"user": user.id, "types": tlist, "by": interaction.user.id})
     emb = Embed(title="Ticket Blacklist", color=discord.Color.dark_red())
     emb.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=False)
     emb.add_field(name="Types", value=", ".join(tlist), inline=False)
     ch = interaction.guild.get_channel(CHAN_TICKET_BL_LOG)
-    if ch: await ch.send(embed=emb, content=user.mention, allowed_mentions=discord.AllowedMentions(users=True))
+    if ch:
+        msg = await ch.send(embed=emb, content=user.mention, allowed_mentions=discord.AllowedMentions(users=True))
+        store.kv_set("bl_log", bl_log_key("ticket", user.id), msg.id)
     await interaction.response.send_message(f"Blacklisted {user.mention} from: {', '.join(tlist)}.", ephemeral=True)
 
 @client.tree.command(guild=GUILD_OBJ, name="ticket_unblacklist", description="Remove blacklist for a user (SHR only).")
@@ -556,18 +1157,9 @@ async def ticket_unblacklist(interaction: Interaction, user: discord.Member, typ
     tlist = [t.strip().lower() for t in types.split(",") if t.strip()]
     if "all" in tlist: tlist = ["gs","mc","shr"]
     bl_remove(user.id, tlist)
+    audit_file("ticket_unblacklist", {"user": user.id, "types": tlist, "by": interaction.user.id})
     await interaction.response.send_message(f"Unblacklisted {user.mention} on: {', '.join(tlist)}.", ephemeral=True)
-    ch = interaction.guild.get_channel(CHAN_TICKET_BL_LOG)
-    if ch:
-        try:
-            async for m in ch.history(limit=100):
-                if m.author.id == client.user.id and m.embeds:
-                    e = m.embeds[0]
-                    if "Ticket Blacklist" in (e.title or "") and str(user.id) in "".join((f.value or "") for f in e.fields):
-                        await m.reply(f"Blacklist revoked by {interaction.user.mention}.")
-                        break
-        except Exception:
-            pass
+    await reply_to_bl_log(interaction.guild, "ticket", user.id, f"Blacklist revoked by {interaction.user.mention}.")
 
 # Driver blacklist (log-only)
 @client.tree.command(guild=GUILD_OBJ, name="driver_blacklist", description="Log a driver blacklist (SHR only).")
@@ -575,43 +1167,94 @@ async def driver_blacklist(interaction: Interaction, user: discord.Member, reaso
     if not has_any_role(interaction.user, [ROLE_SHR_STAFF]):
         await interaction.response.send_message("No permission.", ephemeral=True); return
     ch = interaction.guild.get_channel(CHAN_TICKET_BL_LOG)
+    audit_file("driver_blacklist", {"user": user.id, "reason": reason, "by": interaction.user.id})
     emb = Embed(title="Driver Blacklist", color=discord.Color.dark_red())
     emb.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=False)
     emb.add_field(name="Reason", value=reason, inline=False)
-    if ch: await ch.send(embed=emb, content=user.mention, allowed_mentions=discord.AllowedMentions(users=True))
+    if ch:
+        msg = await ch.send(embed=emb, content=user.mention, allowed_mentions=discord.AllowedMentions(users=True))
+        store.kv_set("bl_log", bl_log_key("driver", user.id), msg.id)
     await interaction.response.send_message("Driver blacklist logged.", ephemeral=True)
 
 @client.tree.command(guild=GUILD_OBJ, name="driver_unblacklist", description="Revoke a driver blacklist (SHR only).")
 async def driver_unblacklist(interaction: Interaction, user: discord.Member):
     if not has_any_role(interaction.user, [ROLE_SHR_STAFF]):
         await interaction.response.send_message("No permission.", ephemeral=True); return
-    ch = interaction.guild.get_channel(CHAN_TICKET_BL_LOG)
-    if ch:
-        try:
-            async for m in ch.history(limit=100):
-                if m.author.id == client.user.id and m.embeds:
-                    e = m.embeds[0]
-                    if "Driver Blacklist" in (e.title or "") and str(user.id) in "".join((f.value or "") for f in e.fields):
-                        await m.reply(f"Driver blacklist revoked by {interaction.user.mention}.")
-                        break
-        except Exception:
-            pass
+    audit_file("driver_unblacklist", {"user": user.id, "by": interaction.user.id})
+    await reply_to_bl_log(interaction.guild, "driver", user.id, f"Driver blacklist revoked by {interaction.user.mention}.")
     await interaction.response.send_message("Driver blacklist revocation noted.", ephemeral=True)
 
 # --------------------------------------------------------------------------------------
 # LINK / UNLINK
 # --------------------------------------------------------------------------------------
+class ForumThreadIndex:
+    """
+    owner_id -> threads of CHAN_FORUM. Built once per process from the active threads plus
+    every page of archived threads, then kept current by the thread events below.
+    Thread ownership never changes, so updates only refresh the cached Thread object.
+    """
+
+    def __init__(self, forum_id: int):
+        self.forum_id = forum_id
+        self.by_id: Dict[int, discord.Thread] = {}
+        self.by_owner: Dict[int, set] = {}
+        self._build: Optional[asyncio.Task] = None
+
+    def put(self, th: discord.Thread):
+        if th.parent_id != self.forum_id or th.owner_id is None: return
+        self.by_id[th.id] = th
+        self.by_owner.setdefault(th.owner_id, set()).add(th.id)
+
+    def remove(self, thread_id: int):
+        th = self.by_id.pop(thread_id, None)
+        if th is None: return
+        ids = self.by_owner.get(th.owner_id, set())
+        ids.discard(thread_id)
+        if not ids: self.by_owner.pop(th.owner_id, None)
+
+    def thread_for(self, owner_id: int) -> Optional[discord.Thread]:
+        """Owner's thread, preferring an active one, then the newest."""
+        ths = [self.by_id[i] for i in self.by_owner.get(owner_id, ())]
+        return max(ths, key=lambda th: (not th.archived, th.id), default=None)
+
+    async def _scan(self, forum: discord.ForumChannel):
+        t0, n = time.perf_counter(), 0
+        for th in forum.threads: self.put(th)
+        try:
+            async for th in forum.archived_threads(limit=None):
+                if th.id not in self.by_id: self.put(th)  # live events may have put a fresher copy
+                n += 1
+        except Exception as e:
+            print(f"[forum] archived thread scan failed after {n}: {e}")
+            self._build = None  # retried on the next ready / lookup
+            return
+        print(f"[forum] indexed {len(self.by_id)} threads ({n} archived) in {time.perf_counter() - t0:.2f}s")
+
+    def build(self, guild: discord.Guild) -> Optional[asyncio.Task]:
+        forum = guild.get_channel(self.forum_id)
+        if not isinstance(forum, discord.ForumChannel): return None
+        if self._build is None: self._build = asyncio.create_task(self._scan(forum))
+        return self._build
+
+forum_index = ForumThreadIndex(CHAN_FORUM)
+
 async def find_user_forum_thread(guild: discord.Guild, user_id: int) -> Optional[discord.Thread]:
-    forum = guild.get_channel(CHAN_FORUM)
-    if not isinstance(forum, discord.ForumChannel): return None
-    for th in forum.threads:
-        if getattr(th, "owner_id", None) == user_id: return th
-    try:
-        async for th, _ in forum.public_archived_threads(limit=100):
-            if getattr(th, "owner_id", None) == user_id: return th
-    except Exception:
-        pass
-    return None
+    task = forum_index.build(guild)
+    if task: await asyncio.shield(task)
+    return forum_index.thread_for(user_id)
+
+@client.listen("on_thread_create")
+async def _forum_thread_create(th: discord.Thread):
+    forum_index.put(th)
+
+@client.listen("on_thread_update")
+async def _forum_thread_update(before: discord.Thread, after: discord.Thread):
+    forum_index.put(after)
+
+@client.listen("on_raw_thread_delete")
+async def _forum_thread_delete(payload: discord.RawThreadDeleteEvent):
+    # raw: archived threads are not in the guild cache, so on_thread_delete would miss them
+    if payload.parent_id == CHAN_FORUM: forum_index.remove(payload.thread_id)
 
 @client.tree.command(guild=GUILD_OBJ, name="link", description="Link your forum thread automatically.")
 async def link(interaction: Interaction):
@@ -621,21 +1264,15 @@ async def link(interaction: Interaction):
     th = await find_user_forum_thread(interaction.guild, interaction.user.id)
     if not th:
         await interaction.followup.send("Could not find a forum thread you created in the forum.", ephemeral=True); return
-    links = load_json(LINKS_FILE, [])
-    links = [l for l in links if l.get("user") != interaction.user.id]
-    links.append({"user": interaction.user.id, "forum": CHAN_FORUM, "thread_id": th.id, "thread_name": th.name})
-    save_json(LINKS_FILE, links)
+    store.set_link(interaction.user.id, {"user": interaction.user.id, "forum": CHAN_FORUM, "thread_id": th.id, "thread_name": th.name})
     await interaction.followup.send(f"Linked to **{th.name}** (`{th.id}`)", ephemeral=True)
 
 @client.tree.command(guild=GUILD_OBJ, name="unlink", description="Unlink your forum thread.")
 async def unlink(interaction: Interaction):
     if not has_any_role(interaction.user, [ROLE_EMPLOYEE_CORE]):
         await interaction.response.send_message("No permission.", ephemeral=True); return
-    links = load_json(LINKS_FILE, [])
-    new = [l for l in links if l.get("user") != interaction.user.id]
-    if len(new) == len(links):
+    if not store.drop_link(interaction.user.id):
         await interaction.response.send_message("You have no linked thread.", ephemeral=True); return
-    save_json(LINKS_FILE, new)
     await interaction.response.send_message("Unlinked.", ephemeral=True)
 
 # --------------------------------------------------------------------------------------
@@ -647,8 +1284,7 @@ async def log_delivery(interaction: Interaction,
                        customer: str, method: str, proof: Optional[str] = None):
     if not has_any_role(interaction.user, [ROLE_EMPLOYEE_CORE]):
         await interaction.response.send_message("No permission.", ephemeral=True); return
-    links = load_json(LINKS_FILE, [])
-    user_link = next((l for l in links if l["user"] == interaction.user.id), None)
+    user_link = store.link(interaction.user.id)
     if not user_link:
         await interaction.response.send_message("No auto-detect here. A lead must add your link to links.json.", ephemeral=True); return
 
@@ -667,18 +1303,57 @@ async def log_delivery(interaction: Interaction,
     chan = client.get_channel(CHAN_DELIVERY)
     if chan: await chan.send(embed=emb)
     # user's forum thread
-    th = interaction.guild.get_thread(user_link["thread_id"])
-    if isinstance(th, discord.Thread): await th.send(embed=emb)
+    th = interaction.guild.get_thread(user_link["thread_id"]) or forum_index.by_id.get(user_link["thread_id"])
+    if isinstance(th, discord.Thread): await th.send(embed=emb)  # posting unarchives an archived thread
 
-    deliveries = load_json(DELIVERIES_FILE, [])
-    deliveries.append({
+    rec = {
         "user": interaction.user.id, "pickup": pickup, "items": items, "dropoff": dropoff,
         "tipped": tipped, "duration": duration, "customer": customer, "method": method,
         "proof": proof or "", "thread_id": user_link["thread_id"], "ts": datetime.now(timezone.utc).isoformat()
-    })
-    save_json(DELIVERIES_FILE, deliveries)
+    }
+    rec.update(typed_fields(rec))  # raw strings are kept as typed in; tip / duration_s / epoch are the parsed values
+    store.add_delivery(rec)
+    delivery_stats.add(rec)
+    delivery_columns.add(rec)
     await interaction.response.send_message("Delivery logged.", ephemeral=True)
 
+# DELIVERY STATS (answered from per-day aggregates, see analytics.py)
+StatsPeriod = Literal["today", "week", "month", "all"]
+_PERIOD_LABEL = {"today": "Today", "week": "Last 7 days", "month": "Last 30 days", "all": "All time"}
+
+@client.tree.command(guild=GUILD_OBJ, name="delivery_stats", description="Delivery totals for you or another driver.")
+async def delivery_stats_cmd(interaction: Interaction, user: Optional[discord.Member] = None, period: StatsPeriod = "week"):
+    if not has_any_role(interaction.user, [ROLE_EMPLOYEE_CORE]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    user = user or interaction.user
+    agg = delivery_stats.user(user.id, period)
+    emb = Embed(title=f"Delivery Stats — {user.display_name}", description=_PERIOD_LABEL[period], color=discord.Color.green())
+    emb.add_field(name="Deliveries", value=str(agg["n"]), inline=True)
+    emb.add_field(name="Tips", value=f"{agg['tips']:g}", inline=True)
+    emb.add_field(name="Avg Duration", value=f"{agg['minutes'] / agg['n']:.1f} min" if agg["n"] else "—", inline=True)
+    methods = sorted(agg["methods"].items(), key=lambda kv: kv[1], reverse=True)
+    emb.add_field(name="By Method", value="\n".join(f"{m}: {c}" for m, c in methods[:10]) or "—", inline=False)
+    await interaction.response.send_message(embed=emb, ephemeral=True)
+
+@client.tree.command(guild=GUILD_OBJ, name="delivery_leaderboard", description="Top drivers by deliveries or tips.")
+async def delivery_leaderboard(interaction: Interaction, period: StatsPeriod = "week", by: Literal["deliveries", "tips"] = "deliveries"):
+    if not has_any_role(interaction.user, [ROLE_EMPLOYEE_CORE]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    rows = delivery_stats.leaderboard(period, by="n" if by == "deliveries" else "tips")
+    lines = [f"**{i}.** <@{uid}> — {agg['n']} deliveries, {agg['tips']:g} tips" for i, (uid, agg) in enumerate(rows, 1)]
+    emb = Embed(title=f"Delivery Leaderboard — {_PERIOD_LABEL[period]}", description="\n".join(lines) or "No deliveries yet.", color=discord.Color.gold())
+    await interaction.response.send_message(embed=emb, allowed_mentions=discord.AllowedMentions.none())
+
+@client.tree.command(guild=GUILD_OBJ, name="delivery_stats_rebuild", description="Recompute delivery stats from the full history (SHR only).")
+async def delivery_stats_rebuild(interaction: Interaction):
+    if not has_any_role(interaction.user, [ROLE_SHR_STAFF]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True)
+    t0 = time.perf_counter()
+    n = await delivery_stats.rebuild()
+    audit_file("delivery_stats_rebuild", {"by": interaction.user.id, "deliveries": n})
+    await interaction.followup.send(f"Rebuilt stats from {n} deliveries in {time.perf_counter() - t0:.2f}s.", ephemeral=True)
+
 # INCIDENT (no pings)
 @client.tree.command(guild=GUILD_OBJ, name="log_incident", description="Log an incident (no pings).")
 async def log_incident(interaction: Interaction, location: str, incident_type: str, reason: str):
@@ -693,62 +1368,98 @@ async def log_incident(interaction: Interaction, location: str, incident_type: s
     await interaction.response.send_message("Incident logged.", ephemeral=True)
 
 # Delivery Request (status updates on same embed)
-class DeliveryReqView(ui.View):
-    def __init__(self, ping_role_id: int, message_id: Optional[int] = None):
-        super().__init__(timeout=None)
-        self.ping_role_id = ping_role_id
-        self.claimed_by: Optional[int] = None
-        self.message_id = message_id
-
-    async def _edit_status(self, inter: Interaction, ended: bool = False):
-        try:
-            msg = await inter.channel.fetch_message(self.message_id) if self.message_id else None
-            if not msg or not msg.embeds: return
-            emb = msg.embeds[0]
-            claimed = f"<@{self.claimed_by}>" if self.claimed_by else "Unclaimed"
-            ongoing = "No" if ended else ("Yes" if self.claimed_by else "No")
-            ended_s = "Yes" if ended else "No"
-            set_or_update_field(emb, "Status", f"Claimed By: {claimed}\nOngoing: {ongoing}\nEnded: {ended_s}", inline=False)
-            await msg.edit(embed=emb, view=self)
-        except Exception:
-            pass
-
-    @ui.button(label="Claim Request", style=discord.ButtonStyle.success, custom_id="dr_claim")
-    async def claim(self, inter: Interaction, btn: ui.Button):
-        if not has_any_role(inter.user, [self.ping_role_id]):
-            await inter.response.send_message("Only the pinged role can claim.", ephemeral=True); return
-        if self.claimed_by:
-            await inter.response.send_message("Already claimed.", ephemeral=True); return
-        self.claimed_by = inter.user.id
-        btn.disabled = True
-        await self._edit_status(inter, ended=False)
-        await inter.response.send_message(f"Claimed by {inter.user.mention}.", ephemeral=False)
-
-    @ui.button(label="End Delivery", style=discord.ButtonStyle.danger, custom_id="dr_end")
-    async def end(self, inter: Interaction, btn: ui.Button):
-        if not has_any_role(inter.user, [self.ping_role_id]) or self.claimed_by != inter.user.id:
-            await inter.response.send_message("Only the claimer can end.", ephemeral=True); return
-        btn.disabled = True
-        await self._edit_status(inter, ended=True)
-        await inter.response.send_message("Delivery ended. Thank you!", ephemeral=False)
+# Buttons carry the request id in their custom_id ("dr:claim:42") and are resolved by one
+# registered DynamicItem, so no View object is kept per posted request and the buttons keep
+# working across restarts. Claim/end state lives in the store ("delivery_requests").
+def delivery_status_text(req: dict) -> str:
+    claimed = f"<@{req['claimed_by']}>" if req.get("claimed_by") else "Unclaimed"
+    ongoing = "No" if req.get("ended") else ("Yes" if req.get("claimed_by") else "No")
+    ended_s = "Yes" if req.get("ended") else "No"
+    return f"Claimed By: {claimed}\nOngoing: {ongoing}\nEnded: {ended_s}"
+
+def render_delivery_embed(req: dict) -> Embed:
+    emb = Embed(title="Delivery Request", color=discord.Color.blurple())
+    emb.add_field(name="In-Game Name", value=req.get("in_game_name") or "—", inline=True)
+    emb.add_field(name="Location", value=req.get("location") or "—", inline=True)
+    emb.add_field(name="Restaurant", value=req.get("restaurant") or "—", inline=True)
+    emb.add_field(name="Items/Food", value=req.get("items") or "—", inline=False)
+    emb.add_field(name="Status", value=delivery_status_text(req), inline=False)
+    emb.set_footer(text="Use the buttons below to claim or end.")
+    return emb
+
+class DeliveryReqButton(ui.DynamicItem[ui.Button], template=r"dr:(?P<action>claim|end):(?P<rid>[0-9]+)"):
+    def __init__(self, action: str, rid: int, disabled: bool = False):
+        label, style = ("Claim Request", discord.ButtonStyle.success) if action == "claim" else ("End Delivery", discord.ButtonStyle.danger)
+        super().__init__(ui.Button(label=label, style=style, custom_id=f"dr:{action}:{rid}", disabled=disabled))
+        self.action = action
+        self.rid = rid
+
+    @classmethod
+    async def from_custom_id(cls, interaction: Interaction, item: ui.Button, match):
+        return cls(match["action"], int(match["rid"]))
+
+    @tracer.traced("delivery_request_button")
+    async def callback(self, inter: Interaction):
+        req = store.kv_get("delivery_requests", self.rid)
+        if not req:
+            await inter.response.send_message("This delivery request no longer exists.", ephemeral=True); return
+        if req.get("ended"):
+            # still stored only because the edit disabling these buttons hasn't gone through: try it again
+            await edit_delivery_status(inter.channel, req)
+            await inter.response.send_message("Already ended.", ephemeral=True); return
+        if self.action == "claim":
+            if not has_any_role(inter.user, [req["ping_role"]]):
+                await inter.response.send_message("Only the pinged role can claim.", ephemeral=True); return
+            if req.get("claimed_by"):
+                await inter.response.send_message("Already claimed.", ephemeral=True); return
+            req["claimed_by"] = inter.user.id
+            store.kv_set("delivery_requests", self.rid, req)
+            await edit_delivery_status(inter.channel, req)
+            await inter.response.send_message(f"Claimed by {inter.user.mention}.", ephemeral=False)
+        else:
+            if not has_any_role(inter.user, [req["ping_role"]]) or req.get("claimed_by") != inter.user.id:
+                await inter.response.send_message("Only the claimer can end.", ephemeral=True); return
+            req["ended"] = True
+            store.kv_set("delivery_requests", self.rid, req)
+            await edit_delivery_status(inter.channel, req)
+            audit_file("delivery_request_end", {"request_id": self.rid, "by": inter.user.id})
+            await inter.response.send_message("Delivery ended. Thank you!", ephemeral=False)
+
+client.add_dynamic_items(DeliveryReqButton)
+
+def delivery_req_view(req: dict) -> ui.View:
+    view = ui.View(timeout=None)
+    view.add_item(DeliveryReqButton("claim", req["id"], disabled=bool(req.get("claimed_by"))))
+    view.add_item(DeliveryReqButton("end", req["id"], disabled=bool(req.get("ended"))))
+    view.stop()  # render-only: a finished view is not stored per message; clicks go through the dynamic item
+    return view
+
+async def edit_delivery_status(channel: discord.abc.Messageable, req: dict):
+    if not req.get("message_id"): return
+    def build():
+        return render_delivery_embed(req), delivery_req_view(req)
+    def applied():
+        # once both buttons show as disabled, an ended request no longer needs to be kept
+        if req.get("ended"): store.kv_del("delivery_requests", req["id"])
+    edits.schedule(channel, req["message_id"], build, applied)
 
 @client.tree.command(guild=GUILD_OBJ, name="delivery_request", description="Post a delivery request (lead role only).")
 async def delivery_request(interaction: Interaction, in_game_name: str, delivery_location: str, restaurant: str, items_food: str):
     if not has_any_role(interaction.user, [ROLE_EMPLOYEE_CORE]):  # you asked to use this shared role
         await interaction.response.send_message("No permission.", ephemeral=True); return
-    emb = Embed(title="Delivery Request", color=discord.Color.blurple())
-    emb.add_field(name="In-Game Name", value=in_game_name, inline=True)
-    emb.add_field(name="Location", value=delivery_location, inline=True)
-    emb.add_field(name="Restaurant", value=restaurant, inline=True)
-    emb.add_field(name="Items/Food", value=items_food, inline=False)
-    emb.add_field(name="Status", value="Claimed By: Unclaimed\nOngoing: No\nEnded: No", inline=False)
-    emb.set_footer(text="Use the buttons below to claim or end.")
-
+    rid = store.next_counter("delivery_request")
+    req = {
+        "id": rid, "channel_id": CHAN_DELIVERY_REQUESTS, "message_id": None, "ping_role": ROLE_DELIVERY_REQ_PING,
+        "claimed_by": None, "ended": False, "requested_by": interaction.user.id,
+        "in_game_name": in_game_name, "location": delivery_location, "restaurant": restaurant, "items": items_food,
+        "ts": datetime.now(timezone.utc).isoformat(),
+    }
     ch = interaction.guild.get_channel(CHAN_DELIVERY_REQUESTS)
-    view = DeliveryReqView(ROLE_DELIVERY_REQ_PING)
-    msg = await ch.send(content=f"<@&{ROLE_DELIVERY_REQ_PING}>", embed=emb, view=view,
+    msg = await ch.send(content=f"<@&{ROLE_DELIVERY_REQ_PING}>", embed=render_delivery_embed(req), view=delivery_req_view(req),
                         allowed_mentions=discord.AllowedMentions(roles=True))
-    view.message_id = msg.id
+    req["message_id"] = msg.id
+    bot_messages.put(msg)
+    store.kv_set("delivery_requests", rid, req)
     try:
         await msg.create_thread(name=f"Delivery Discussion • {in_game_name}")
     except Exception:
@@ -778,6 +1489,7 @@ async def promote(interaction: Interaction, employee: discord.Member, old_rank:
     embed.timestamp = datetime.now(timezone.utc)
     chan = client.get_channel(CHAN_PROMOTE)
     await chan.send(content=employee.mention, embed=embed, allowed_mentions=discord.AllowedMentions(users=True))
+    audit_file("promotion", {"user": employee.id, "old_rank": old_rank, "new_rank": new_rank, "reason": reason, "by": interaction.user.id})
     await interaction.response.send_message("Promotion logged.", ephemeral=True)
 
 @client.tree.command(guild=GUILD_OBJ, name="infraction", description="Issue an infraction")
@@ -803,6 +1515,7 @@ async def infraction(interaction: Interaction, employee: discord.Member, reason:
     embed.timestamp = datetime.now(timezone.utc)
     chan = client.get_channel(CHAN_INFRACT)
     await chan.send(content=employee.mention, embed=embed, allowed_mentions=discord.AllowedMentions(users=True))
+    audit_file("infraction", {"user": employee.id, "type": infraction_type, "appealable": appealable, "reason": reason, "by": interaction.user.id})
     await interaction.response.send_message("Infraction logged.", ephemeral=True)
 
 # --------------------------------------------------------------------------------------
@@ -844,6 +1557,24 @@ async def customer_service_welcome(interaction: Interaction, user: discord.Membe
 # --------------------------------------------------------------------------------------
 _last_sync_by_user: dict[int, datetime] = {}
 
+def command_tree_hash() -> str:
+    """Stable hash of everything tree.sync would upload (names, options, choices, descriptions) for the synced scope."""
+    def payload(c) -> Dict[str, Any]:
+        try: return c.to_dict(client.tree)   # discord.py >= 2.4
+        except TypeError: return c.to_dict()
+    cmds = client.tree.get_commands(guild=GUILD_OBJ) if GUILD_OBJ else client.tree.get_commands()
+    body = {"scope": GUILD_ID or "global", "commands": sorted((payload(c) for c in cmds), key=lambda d: (d.get("type", 1), d["name"]))}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+async def sync_tree(force: bool = False) -> Optional[int]:
+    """Sync only when the command tree changed since the last successful sync (or when forced). Returns #commands synced, None if skipped."""
+    h = command_tree_hash()
+    if not force and store.kv_get("meta", "tree_hash") == h:
+        return None
+    cmds = await client.tree.sync(guild=GUILD_OBJ) if GUILD_OBJ else await client.tree.sync()
+    store.kv_set("meta", "tree_hash", h)
+    return len(cmds)
+
 @client.tree.command(name="sync", description="Force sync slash commands (staff only, 5 min cooldown)")
 async def sync_cmd(interaction: Interaction):
     if not has_any_role(interaction.user, [STAFF_ROLE_ID]):
@@ -855,11 +1586,74 @@ async def sync_cmd(interaction: Interaction):
         await interaction.response.send_message(f"On cooldown. Try again in ~{remain}s.", ephemeral=True); return
     _last_sync_by_user[interaction.user.id] = now
     try:
-        cmds = await client.tree.sync(guild=GUILD_OBJ) if GUILD_OBJ else await client.tree.sync()
-        await interaction.response.send_message(f"Synced {len(cmds)} commands.", ephemeral=True)
+        n = await sync_tree(force=True)
+        await interaction.response.send_message(f"Synced {n} commands.", ephemeral=True)
     except Exception as e:
         await interaction.response.send_message(f"Sync failed: `{e}`", ephemeral=True)
 
+@client.tree.command(guild=GUILD_OBJ, name="profile", description="Capture a cProfile of the live bot (staff only).")
+async def profile_cmd(interaction: Interaction, seconds: app_commands.Range[int, 1, 120] = 15,
+                      sort: Literal["cumulative", "tottime", "ncalls"] = "cumulative"):
+    if not has_any_role(interaction.user, [STAFF_ROLE_ID]):
+        await interaction.response.send_message("No permission.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True)
+    try:
+        report = await profile_for(seconds, sort=sort)
+    except (RuntimeError, ValueError) as e:  # one capture at a time / another profiler active
+        await interaction.followup.send(f"Profile failed: `{e}`", ephemeral=True); return
+    audit_file("profile", {"by": interaction.user.id, "seconds": seconds})
+    fname = f"profile-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.txt"
+    await interaction.followup.send(f"{seconds}s profile of the event loop, sorted by {sort}.",
+                                    file=discord.File(io.BytesIO(report.encode("utf-8")), filename=fname), ephemeral=True)
+
+# --------------------------------------------------------------------------------------
+# TICKET MESSAGE LOG (incremental transcripts)
+# --------------------------------------------------------------------------------------
+# raw edit/delete events fire for uncached messages too, unlike on_message_edit/on_message_delete
+@client.listen("on_message")
+async def _tlog_message(message: discord.Message):
+    if store.ticket_by_channel(message.channel.id):
+        tlog.append(message.channel.id, message_record(message))
+
+@client.listen("on_raw_message_edit")
+async def _tlog_edit(payload: discord.RawMessageUpdateEvent):
+    if "content" in payload.data and store.ticket_by_channel(payload.channel_id):
+        tlog.append(payload.channel_id, {"op": "edit", "id": payload.message_id, "content": payload.data.get("content") or ""})
+
+@client.listen("on_raw_message_delete")
+async def _tlog_delete(payload: discord.RawMessageDeleteEvent):
+    if store.ticket_by_channel(payload.channel_id):
+        tlog.append(payload.channel_id, {"op": "delete", "id": payload.message_id})
+
+_backfilling: set = set()  # channel ids with a backfill in flight (on_ready can fire again before one ends)
+
+def needs_backfill(ch: discord.TextChannel) -> bool:
+    """False if the log already covers the channel's last message (READY sends last_message_id), so no history call is needed."""
+    if ch.id in _backfilling: return False
+    after = tlog.cursor(ch.id)
+    return not (after and ch.last_message_id and after >= ch.last_message_id)
+
+async def backfill_ticket_log(ch: discord.TextChannel):
+    """Log messages that arrived while the bot was offline (edits/deletes in that window are not recoverable)."""
+    _backfilling.add(ch.id)
+    after = tlog.cursor(ch.id)
+    last = None
+    try:
+        async for m in ch.history(limit=None, after=discord.Object(after) if after else None, oldest_first=True):
+            tlog.append(ch.id, message_record(m))
+            last = m.id
+    except Exception as e:
+        print(f"[tlog] backfill {ch.id} failed: {e}")
+        return
+    finally:
+        _backfilling.discard(ch.id)
+    tlog.mark_synced(ch.id, last)
+
+async def backfill_ticket_logs(guild: discord.Guild):
+    chans = [guild.get_channel(t["channel_id"]) for t in store.open_tickets()]
+    todo = [ch for ch in chans if isinstance(ch, discord.TextChannel) and needs_backfill(ch)]
+    await bounded_gather((backfill_ticket_log(ch) for ch in todo), RESTORE_CONCURRENCY)
+
 # --------------------------------------------------------------------------------------
 # READY & STARTUP (restore panel + ticket views)
 # --------------------------------------------------------------------------------------
@@ -867,38 +1661,143 @@ async def sync_cmd(interaction: Interaction):
 async def on_ready():
     print(f"Bot ready as {client.user}")
     try:
-        await client.tree.sync(guild=GUILD_OBJ) if GUILD_OBJ else await client.tree.sync()
+        n = await sync_tree()
+        print("Command tree unchanged; sync skipped." if n is None else f"Synced {n} commands.")
     except Exception as e:
         print("Sync failed:", e)
-    # Ensure ticket panel exists & is interactive
     for g in client.guilds:
         if GUILD_ID and g.id != GUILD_ID:
             continue
-        await ensure_ticket_panel(g)
-        # Restore open ticket views & fix Status field
-        tickets = load_json(TICKETS_FILE, [])
-        for t in tickets:
-            if t.get("status") != "open": continue
-            ch = g.get_channel(t["channel_id"])
-            if not isinstance(ch, discord.TextChannel): continue
-            try:
-                msg = await ch.fetch_message(t.get("message_id")) if t.get("message_id") else None
-                if msg and msg.embeds:
-                    emb = msg.embeds[0]
-                    set_or_update_field(emb, "Status", status_text(t), inline=False)
-                    await msg.edit(embed=emb, view=TicketActionView(t))
-            except Exception:
-                pass
+        await restore_guild(g)
+        # every (re)connect: pick up ticket messages missed while disconnected (channels already current are skipped)
+        asyncio.create_task(backfill_ticket_logs(g))
+
+_restored_guilds: set = set()
+last_restore: Dict[str, Any] = {}
+
+def reconcile_deleted_tickets(guild: discord.Guild) -> int:
+    """Archive open tickets whose channel was deleted while the bot was down (guild cache is complete in on_ready)."""
+    gone = [t for t in store.open_tickets() if t.get("guild_id") in (None, guild.id) and guild.get_channel(t["channel_id"]) is None]
+    now = datetime.now(timezone.utc).isoformat()
+    for t in gone:
+        t["status"] = "closed"
+        t["closed_at"] = now
+        t["close_reason"] = "channel deleted while bot offline"
+        store.archive_ticket(t)
+        tlog.drop(t["channel_id"])
+    if gone: audit_file("ticket_reconcile", {"guild_id": guild.id, "archived": [t["id"] for t in gone]})
+    return len(gone)
+
+def resume_close_jobs(guild: discord.Guild) -> int:
+    """Re-queue close jobs left over from the last run (interrupted, or given up on after retries)."""
+    n = 0
+    for tid, job in list(store.kv[CLOSE_JOBS].items()):
+        if job.get("guild_id") not in (None, guild.id): continue
+        job["failed"] = False
+        job["attempts"] = 0
+        submit_close(guild, tid)
+        n += 1
+    return n
+
+async def refresh_ticket_embed(g: discord.Guild, t: dict):
+    ch = g.get_channel(t["channel_id"])
+    if isinstance(ch, discord.TextChannel): await edit_ticket_embed_status(ch, t)  # paced by edits' concurrency cap
+
+async def restore_guild(g: discord.Guild):
+    """
+    Make every persistent component interactive again without fetching messages:
+    views are bound to their stored message ids with add_view. Only embeds whose
+    Status is stale are re-edited; the edit scheduler sends them EDIT_CONCURRENCY at a
+    time. Runs once per process; gateway reconnects fire on_ready again but the views
+    are still registered.
+    """
+    if g.id in _restored_guilds: return
+    _restored_guilds.add(g.id)
+    t0 = time.perf_counter()
+    panel_id = store.panel_get("message_id")
+    if panel_id: client.add_view(TicketPanelView(), message_id=panel_id)
+    else: await ensure_ticket_panel(g)
+    reconciled = reconcile_deleted_tickets(g)
+    resumed = resume_close_jobs(g)
+    asyncio.create_task(index_blacklist_log(g))
+    forum_index.build(g)
+    views, stale = 0, []
+    for t in store.open_tickets():
+        if t.get("guild_id") not in (None, g.id) or not t.get("message_id"): continue
+        client.add_view(TicketActionView(t), message_id=t["message_id"])
+        views += 1
+        if "status_rendered" not in t:
+            # from before status_rendered existed: its embed was edited in place on every change, so it is current
+            mark_rendered(t)
+            save_ticket(t)
+        elif t["status_rendered"] != status_text(t):
+            stale.append(t)
+    t_views = time.perf_counter() - t0
+    for t in stale: await refresh_ticket_embed(g, t)
+    last_restore.update({"guild_id": g.id, "views": views, "refreshed": len(stale), "reconciled": reconciled, "resumed": resumed,
+                         "views_seconds": round(t_views, 4), "total_seconds": round(time.perf_counter() - t0, 4)})
+    print(f"[restore] {views} ticket views in {t_views*1000:.1f}ms; {len(stale)} embeds refreshed, "
+          f"{reconciled} deleted tickets archived, {resumed} closes resumed; total {last_restore['total_seconds']:.2f}s")
 
 # --------------------------------------------------------------------------------------
 # WEB SERVER FOR RENDER
 # --------------------------------------------------------------------------------------
 async def _health(request): return web.Response(text="ok")
 
+@client.listen("on_interaction")
+async def _count_interaction(interaction: Interaction):
+    M_INTERACTIONS.inc(type=interaction.type.name)
+
+@client.listen("on_app_command_completion")
+async def _command_done(interaction: Interaction, command):
+    _observe_command(interaction, "ok")
+
+def _persist_io(op: str, seconds: float):
+    M_IO_SECONDS.observe(seconds, op=op)
+    add_span("storage", seconds)  # writer thread runs in the caller's context
+
+store.worker.on_io = _persist_io
+REGISTRY.collect("discord_gateway_latency_seconds", "Gateway heartbeat latency.",
+                 lambda: client.latency if math.isfinite(client.latency) else None)
+REGISTRY.collect("bot_open_tickets", "Open tickets in the store.", lambda: len(store.open_tickets()))
+REGISTRY.collect("bot_cache_requests_total", "Bot message cache lookups, by cache and result.", lambda: {
+    ("messages", "hit"): bot_messages.stats["hits"], ("messages", "miss"): bot_messages.stats["misses"]},
+    kind="counter", labelnames=("cache", "result"))
+REGISTRY.collect("bot_cache_hit_ratio", "Hit ratio since start, by cache.", lambda: {
+    ("messages",): bot_messages.stats["hits"] / max(1, bot_messages.stats["hits"] + bot_messages.stats["misses"])},
+    labelnames=("cache",))
+REGISTRY.collect("bot_forum_threads_indexed", "Threads in the forum owner index.", lambda: len(forum_index.by_id))
+REGISTRY.collect("bot_persist_queue_depth", "Jobs waiting for the persist worker.", store.worker.depth)
+REGISTRY.collect("bot_persist_dirty_rows", "Changed rows not yet flushed.", lambda: sum(len(v) for v in store.dirty.values()))
+REGISTRY.collect("bot_persist_jobs_total", "Persist worker jobs, by result.",
+                 lambda: {(k,): v for k, v in store.worker.stats.items()}, kind="counter", labelnames=("result",))
+REGISTRY.collect("bot_audit_events_total", "Audit log events, by result.",
+                 lambda: {(k,): v for k, v in audit.stats.items()}, kind="counter", labelnames=("result",))
+REGISTRY.collect("bot_job_queue_depth", "Jobs waiting for a worker, by queue.", lambda: {(q.name,): q.depth() for q in job_queues}, labelnames=("queue",))
+REGISTRY.collect("bot_jobs_running", "Jobs being run, by queue.", lambda: {(q.name,): q.running for q in job_queues}, labelnames=("queue",))
+REGISTRY.collect("bot_jobs_total", "Queued jobs, by queue and result.",
+                 lambda: {(q.name, k): v for q in job_queues for k, v in q.stats.items()}, kind="counter", labelnames=("queue", "result"))
+REGISTRY.collect("bot_close_jobs_stored", "Persisted close jobs, by state.", lambda: {
+    ("failed",): sum(1 for j in store.kv[CLOSE_JOBS].values() if j.get("failed")),
+    ("pending",): sum(1 for j in store.kv[CLOSE_JOBS].values() if not j.get("failed"))}, labelnames=("state",))
+REGISTRY.collect("bot_attachments_total", "Ticket attachments archived, by result (stored, deduped, too_large, failed).",
+                 lambda: {(k,): v for k, v in attachment_archive.stats.items() if k != "bytes"}, kind="counter", labelnames=("result",))
+REGISTRY.collect("bot_attachment_bytes_stored_total", "Bytes written to the attachment blob store.",
+                 lambda: attachment_archive.stats["bytes"], kind="counter")
+REGISTRY.collect("bot_embed_edits_total", "Embed edit scheduler, by result.",
+                 lambda: {(k,): v for k, v in edits.stats.items()}, kind="counter", labelnames=("result",))
+
+async def _metrics(request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return web.Response(status=401, text="unauthorized")
+    return web.Response(body=REGISTRY.render().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
 async def start_web_server():
     app = web.Application()
     app.router.add_get("/", _health)
     app.router.add_get("/health", _health)
+    app.router.add_get("/metrics", _metrics)
     port = int(os.getenv("PORT", "10000"))
     runner = web.AppRunner(app)
     await runner.setup()
@@ -909,9 +1808,46 @@ async def start_web_server():
 # --------------------------------------------------------------------------------------
 # MAIN
 # --------------------------------------------------------------------------------------
+async def _shutdown():
+    for q in job_queues: await q.aclose()  # unfinished closes stay in the store and resume on the next start
+    await attachment_archive.aclose()
+    await audit.aclose()
+    await slow_log.aclose()
+    await store.sync()
+    await client.close()
+
+def _on_sigterm():
+    # Render sends SIGTERM on every deploy: persist pending writes before the container goes away
+    asyncio.create_task(_shutdown())
+
 async def main():
+    store.start_flusher()
+    audit.start()
+    slow_log.start()
+    if not os.path.isdir(ANALYTICS_DIR):  # first run with the column store: seed it from the history
+        n = await store.worker.call(lambda: delivery_columns.rebuild(store.iter_deliveries()))
+        print(f"[analytics] built columns for {n} deliveries")
+    if os.path.isdir(TRANSCRIPT_ARCHIVE_DIR) and not os.path.exists(transcript_archive.index_path):
+        n = await store.worker.call(transcript_archive.rebuild)
+        print(f"[transcripts] indexed {n} archived transcripts")
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, _on_sigterm)
+    except (NotImplementedError, RuntimeError):
+        # no loop signal handlers (Windows): don't flush from the handler, which would race the writer thread;
+        # hand the same shutdown to the loop (call_soon_threadsafe also wakes it)
+        signal.signal(signal.SIGTERM, lambda *_: loop.call_soon_threadsafe(_on_sigterm))
     asyncio.create_task(start_web_server())
-    await client.start(DISCORD_TOKEN)
+    asyncio.create_task(track_loop_lag(M_LOOP_LAG, M_LOOP_LAG_H))
+    for q in job_queues: q.start()
+    try:
+        await client.start(DISCORD_TOKEN)
+    finally:
+        for q in job_queues: await q.aclose()
+        await attachment_archive.aclose()
+        await audit.aclose()
+        await slow_log.aclose()
+        await store.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
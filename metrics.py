@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal Prometheus metrics (text exposition format 0.0.4), no client library needed.
+
+Counter / Gauge / Histogram hold labelled values updated in place; observe() and inc()
+may be called from the persist thread, so updates take a lock. Values that already
+live elsewhere (cache hit counts, worker stats, client.latency) are exported with
+registry.collect(), whose callback runs only when /metrics is scraped.
+"""
+
+import math, time, asyncio, threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable, Union
+
+LabelValues = Tuple[str, ...]
+Sample = Union[float, Dict[LabelValues, float]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _esc(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(v: float) -> str:
+    if math.isinf(v): return "+Inf" if v > 0 else "-Inf"
+    if math.isnan(v): return "NaN"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+def _labels(names: Iterable[str], values: Iterable[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra: parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        k = self._key(labels)
+        with self._lock: self.values[k] = self.values.get(k, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(self.values.items())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock: self.values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[LabelValues, List[float]] = {}  # [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        k = self._key(labels)
+        with self._lock:
+            row = self.values.get(k)
+            if row is None: row = self.values[k] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, b in enumerate(self.buckets):
+                if value <= b: row[i] += 1; break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        out = self.header()
+        for k, row in sorted(self.values.items()):
+            acc = 0
+            for b, c in zip(self.buckets + (math.inf,), row):
+                acc += c
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_fmt(row[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {acc}")
+        return out
+
+class _Collected(_Metric):
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Sample], labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            v = self.fn()
+        except Exception:
+            return []
+        rows = v.items() if isinstance(v, dict) else [((), v)]
+        body = [f"{self.name}{_labels(self.labelnames, k)} {_fmt(x)}" for k, x in rows if x is not None]
+        return self.header() + body if body else []
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _add(self, m: _Metric):
+        if m.name in self.metrics: raise ValueError(f"metric {m.name} already registered")
+        self.metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def collect(self, name: str, help: str, fn: Callable[[], Sample], kind: str = "gauge", labelnames: Tuple[str, ...] = ()):
+        """Export a value computed at scrape time: fn() -> number, or {label values tuple: number}."""
+        return self._add(_Collected(name, help, kind, fn, labelnames))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self.metrics.values(): lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+async def track_loop_lag(gauge: Gauge, hist: Optional[Histogram] = None, interval: float = 0.5):
+    """Sleep `interval` in a loop; any overshoot is time the event loop was blocked."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - t0 - interval)
+        gauge.set(lag)
+        if hist: hist.observe(lag)
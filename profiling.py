@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Per-interaction timing spans and live-process profiling.
+
+A Trace covers one handler run (an app command or a component callback) and lives in a
+context variable, so code anywhere below the handler can charge time to a phase with
+span("storage") / add_span("discord_api", seconds) without passing it around.
+Phases don't nest: while a span() is open, time reported inside it belongs to that span.
+Time not covered by a phase is reported as "other".
+
+Tracer.end() hands the breakdown to its sinks (the bot feeds a metrics histogram and a
+slow-interaction log). profile_for() runs cProfile over the event loop thread for a
+fixed window and returns the pstats report.
+"""
+
+import io, time, asyncio, cProfile, pstats, functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Callable
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+class Trace:
+    __slots__ = ("name", "kind", "t0", "total", "spans", "meta", "active", "_token")
+
+    def __init__(self, name: str, kind: str, meta: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.t0 = time.perf_counter()
+        self.total: Optional[float] = None
+        self.spans: Dict[str, float] = {}
+        self.meta = meta or {}
+        self.active: Optional[str] = None  # phase of the open span(), if any
+        self._token = None
+
+    def add(self, phase: str, seconds: float):
+        self.spans[phase] = self.spans.get(phase, 0.0) + seconds
+
+    def breakdown(self) -> Dict[str, float]:
+        total = self.total if self.total is not None else time.perf_counter() - self.t0
+        out = {k: round(v, 4) for k, v in self.spans.items()}
+        out["other"] = round(max(0.0, total - sum(self.spans.values())), 4)
+        return out
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+def add_span(phase: str, seconds: float):
+    """Charge `seconds` to `phase` of the running trace (no-op outside one). Safe from worker threads
+    that run in a copy of the handler's context."""
+    tr = _current.get()
+    if tr is not None and tr.active is None: tr.add(phase, seconds)
+
+@contextmanager
+def span(phase: str):
+    tr = _current.get()
+    if tr is None or tr.active is not None:
+        yield
+        return
+    tr.active = phase
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.active = None
+        tr.add(phase, time.perf_counter() - t0)
+
+Sink = Callable[[Trace, str], None]
+
+class Tracer:
+    def __init__(self, sinks: Optional[List[Sink]] = None):
+        self.sinks: List[Sink] = sinks or []
+
+    def begin(self, name: str, kind: str, **meta) -> Trace:
+        tr = Trace(name, kind, meta)
+        tr._token = _current.set(tr)
+        return tr
+
+    def end(self, tr: Trace, outcome: str = "ok", reset: bool = True):
+        if tr.total is not None: return  # already ended (completion and error hooks can both fire)
+        tr.total = time.perf_counter() - tr.t0
+        if reset and tr._token is not None:
+            try: _current.reset(tr._token)
+            except ValueError: pass  # ended from another context (e.g. a dispatched event)
+        for sink in self.sinks:
+            try: sink(tr, outcome)
+            except Exception as e: print(f"[trace] sink failed: {e}")
+
+    def traced(self, name: str, kind: str = "component"):
+        """Decorator for async callbacks (View buttons / selects, DynamicItem.callback)."""
+        def deco(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                tr = self.begin(name, kind)
+                outcome = "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                finally:
+                    self.end(tr, outcome)
+            return wrapper
+        return deco
+
+_profiling = asyncio.Lock()
+
+async def profile_for(seconds: float, sort: str = "cumulative", limit: int = 40) -> str:
+    """cProfile everything the event loop runs for `seconds`; one capture at a time."""
+    if _profiling.locked(): raise RuntimeError("a profile is already running")
+    async with _profiling:
+        prof = cProfile.Profile()
+        prof.enable()  # profiles this thread, i.e. every task and callback on the loop
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            prof.disable()
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,881 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide state store.
+
+State is loaded once at startup; reads are served from in-memory dicts (tickets
+indexed by id / channel / opener) and dirty rows are written back in batches
+through a pluggable backend (STORAGE_BACKEND=json|sqlite):
+
+- JsonBackend: the original *.json files, rewritten atomically (temp file + rename).
+  tickets.json only holds open tickets; closed ones go to monthly gzip segments
+  under archive/ (TicketArchive). Deliveries are an append-only journal (DeliveryJournal).
+  Large, date-keyed kv collections (SHARDED_COLLECTIONS) are a directory with one file
+  per key, so a flush only rewrites the keys it touched.
+- SqliteBackend: one WAL-mode database with indexed tables; every flush is a single
+  transaction of row-level upserts.
+
+No disk I/O runs on the event loop: flushes snapshot dirty rows on the loop and hand
+the write to PersistWorker, a single writer thread fed by a coalescing job queue.
+
+AuditLog buffers audit events in memory and appends them in batches through the same
+worker, rotating audit.jsonl daily / by size into gzip segments.
+
+CLI:  python storage.py migrate --db bot.db     (copy the JSON files into SQLite)
+"""
+
+import os, sys, json, gzip, time, shutil, sqlite3, asyncio, argparse, functools, itertools, contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Set, Iterator, Iterable, Callable, Awaitable
+
+DEFAULT_PATHS = {
+    "tickets": "tickets.json", "blacklist": "blacklist.json", "counters": "ticket_counters.json",
+    "links": "links.json", "panel": "panel.json", "archive": "archive",
+    "deliveries": "deliveries.jsonl", "deliveries_snapshot": "deliveries.snapshot.jsonl.gz",
+    "deliveries_legacy": "deliveries.json", "transcript_cursors": "transcript_cursors.json",
+    "meta": "meta.json", "delivery_requests": "delivery_requests.json",
+    "bl_log": "blacklist_log_index.json",
+    "delivery_stats": "delivery_stats", "close_jobs": "close_jobs.json",
+}
+# simple key -> JSON value collections (one file each for JsonBackend, rows in `kv` for SqliteBackend)
+KV_COLLECTIONS = ("counters", "panel", "transcript_cursors", "meta", "delivery_requests", "bl_log", "delivery_stats", "close_jobs")
+# kv collections JsonBackend keeps as <dir>/<key>.json (keys must be filename-safe)
+SHARDED_COLLECTIONS = ("delivery_stats",)
+
+def load_json(path: str, default):
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return default
+
+def save_json(path: str, data) -> None:
+    # write to a temp file next to the target, then rename over it (atomic on POSIX + NTFS)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_shards(path: str) -> Dict[str, Any]:
+    """A sharded kv collection: <path>/<key>.json, over the single <path>.json it replaced."""
+    out = load_json(f"{path}.json", {})
+    if os.path.isdir(path):
+        for fn in os.listdir(path):
+            if fn.endswith(".json"): out[fn[:-5]] = load_json(os.path.join(path, fn), None)
+    return {k: v for k, v in out.items() if v is not None}
+
+class TicketArchive:
+    """
+    Append-only cold storage for closed tickets.
+
+    archive/tickets-YYYY-MM.jsonl.gz   one gzip member per flush, one ticket per line
+    archive/index.jsonl                index journal, one {"id", "seg", "opener"} line per ticket
+                                       (appended per flush, never rewritten)
+    archive/index.json                 the older whole-file index, still read under the journal
+
+    The index is replayed into {"by_id": {tid: segment}, "by_opener": {uid: [tid, ...]}} on
+    the first lookup, so startup never touches history.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self.legacy_index_path = os.path.join(root, "index.json")
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @staticmethod
+    def _remember(idx: Dict[str, Dict[str, Any]], tid: str, seg: str, opener: str):
+        if tid not in idx["by_id"]: idx["by_opener"].setdefault(opener, []).append(tid)
+        idx["by_id"][tid] = seg
+
+    @property
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            idx = load_json(self.legacy_index_path, {"by_id": {}, "by_opener": {}})
+            idx.setdefault("by_id", {}); idx.setdefault("by_opener", {})
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            e = json.loads(line)
+                        except ValueError:
+                            continue  # torn line from a crash mid-append
+                        self._remember(idx, e["id"], e["seg"], e["opener"])
+            self._index = idx
+        return self._index
+
+    def segment_for(self, t: dict) -> str:
+        ts = t.get("closed_at")
+        try:
+            dt = datetime.fromisoformat(ts) if ts else datetime.now(timezone.utc)
+        except ValueError:
+            dt = datetime.now(timezone.utc)
+        return f"tickets-{dt:%Y-%m}.jsonl.gz"
+
+    def append(self, tickets: List[dict]):
+        idx = self.index
+        fresh = [t for t in tickets if str(t["id"]) not in idx["by_id"]]
+        if not fresh: return
+        os.makedirs(self.root, exist_ok=True)
+        by_seg: Dict[str, List[dict]] = {}
+        for t in fresh:
+            by_seg.setdefault(self.segment_for(t), []).append(t)
+        entries = []
+        for seg, rows in by_seg.items():
+            # "ab" adds a new gzip member; gzip.open reads concatenated members transparently
+            with gzip.open(os.path.join(self.root, seg), "ab") as f:
+                f.write("".join(json.dumps(t, ensure_ascii=False, separators=(",", ":")) + "\n" for t in rows).encode("utf-8"))
+            entries += [{"id": str(t["id"]), "seg": seg, "opener": str(t["opener_id"])} for t in rows]
+        # segments are durable before the index names them
+        with open(self.index_path, "a+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            torn = end > 0 and f.seek(end - 1) >= 0 and f.read(1) != b"\n"  # a crash cut the last line short
+            f.write((("\n" if torn else "") + "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries)).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        for e in entries: self._remember(idx, e["id"], e["seg"], e["opener"])
+
+    def _scan(self, seg: str) -> Iterator[dict]:
+        path = os.path.join(self.root, seg)
+        if not os.path.exists(path): return
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+
+    def get(self, tid: str) -> Optional[dict]:
+        seg = self.index["by_id"].get(str(tid))
+        if not seg: return None
+        return next((t for t in self._scan(seg) if str(t["id"]) == str(tid)), None)
+
+    def by_opener(self, uid: int) -> List[dict]:
+        ids = self.index["by_opener"].get(str(uid), [])
+        by_seg: Dict[str, Set[str]] = {}
+        for tid in ids:
+            seg = self.index["by_id"].get(tid)
+            if seg: by_seg.setdefault(seg, set()).add(tid)
+        out = []
+        for seg in sorted(by_seg):
+            out.extend(t for t in self._scan(seg) if str(t["id"]) in by_seg[seg])
+        return out
+
+    def __iter__(self) -> Iterator[dict]:
+        if not os.path.isdir(self.root): return
+        for seg in sorted(f for f in os.listdir(self.root) if f.startswith("tickets-") and f.endswith(".jsonl.gz")):
+            yield from self._scan(seg)
+
+class DeliveryJournal:
+    """
+    Append-only delivery log.
+
+    deliveries.jsonl            journal, one compact JSON record per line (appended per flush)
+    deliveries.snapshot.jsonl.gz  compacted history; compaction gzips the journal onto it as a
+                                new member and truncates the journal, so it never rewrites history
+    """
+
+    def __init__(self, journal: str, snapshot: str, compact_every: int = 500):
+        self.journal = journal
+        self.snapshot = snapshot
+        self.compact_every = compact_every
+        self._journal_lines = self._count_lines(journal)
+
+    @staticmethod
+    def _count_lines(path: str) -> int:
+        if not os.path.exists(path): return 0
+        with open(path, "rb") as f:
+            return sum(1 for _ in f)
+
+    def append(self, records: List[dict]):
+        if not records: return
+        with open(self.journal, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_lines += len(records)
+        if self._journal_lines >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        if not os.path.exists(self.journal) or os.path.getsize(self.journal) == 0: return
+        with open(self.journal, "rb") as src, gzip.open(self.snapshot, "ab") as dst:
+            for chunk in iter(lambda: src.read(1 << 16), b""):
+                dst.write(chunk)
+        # snapshot is durable before the journal is dropped; a crash in between only duplicates
+        with open(self.journal, "w", encoding="utf-8"):
+            pass
+        self._journal_lines = 0
+
+    def __iter__(self) -> Iterator[dict]:
+        if os.path.exists(self.snapshot):
+            with gzip.open(self.snapshot, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip(): yield json.loads(line)
+        if os.path.exists(self.journal):
+            with open(self.journal, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip(): yield json.loads(line)
+
+    def migrate_legacy(self, legacy_path: str) -> int:
+        """One-shot import of the old deliveries.json list. The source is renamed to *.migrated."""
+        if not os.path.exists(legacy_path): return 0
+        rows = load_json(legacy_path, [])
+        if rows:
+            with gzip.open(self.snapshot, "ab") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in rows).encode("utf-8"))
+        os.replace(legacy_path, legacy_path + ".migrated")
+        return len(rows)
+
+class PersistWorker:
+    """
+    Single writer for all blocking persistence work.
+
+    submit(key, job) queues an async job; submitting a key that is already queued
+    replaces the queued job instead of adding another (so ten "flush tickets" requests
+    made during one write become one write). Jobs run one at a time and do their
+    blocking part through call(), which runs on one dedicated thread, so file and
+    SQLite access is serialized without locks. `await flush()` waits for the queue
+    to drain.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist")
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._pending: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"submitted": 0, "coalesced": 0, "completed": 0, "failed": 0}
+        self.on_io: Optional[Callable[[str, float], None]] = None  # (fn name, seconds), called on the writer thread
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]]):
+        self.stats["submitted"] += 1
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+        else:
+            self._queue.put_nowait(key)
+        self._pending[key] = job
+
+    async def call(self, fn: Callable, *args):
+        """Run a blocking callable on the writer thread."""
+        if self.on_io is not None:
+            # the caller's context goes along (like asyncio.to_thread) so on_io can attribute the time
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(contextvars.copy_context().run, self._timed(fn), *args))
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _timed(self, fn: Callable) -> Callable:
+        name = getattr(fn, "__qualname__", type(fn).__name__).split(".<locals>")[0]
+        def run(*args):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.on_io(name, time.perf_counter() - t0)
+        return run
+
+    async def _run(self):
+        while True:
+            key = await self._queue.get()
+            job = self._pending.pop(key, None)
+            try:
+                if job: await job()
+                self.stats["completed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"[persist] job {key} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def flush(self):
+        if self._task and not self._task.done():
+            await self._queue.join()
+
+    async def aclose(self):
+        await self.flush()
+        if self._task: self._task.cancel()
+        self._executor.shutdown(wait=True)
+
+class AuditLog:
+    """
+    Buffered, rotating JSONL event writer (audit.jsonl, slow_interactions.jsonl).
+
+    log() only appends to a bounded in-memory buffer (events beyond max_buffer are
+    counted in `dropped`). The buffer is written through the PersistWorker once it
+    holds flush_lines events or every flush_interval seconds. Before a write the
+    file is rotated if it was started on an earlier UTC day or has grown past
+    rotate_bytes; rotated segments are gzipped to audit-YYYY-MM-DD[.n].jsonl.gz.
+    """
+
+    def __init__(self, path: str, worker: PersistWorker, max_buffer: int = 10_000, flush_lines: int = 200,
+                 flush_interval: float = 5.0, rotate_bytes: int = 10 * 1024 * 1024):
+        self.path = path
+        self.worker = worker
+        self._key = f"audit:{path}"  # worker coalescing key; one per log file
+        self.max_buffer = max_buffer
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.buf: "deque[str]" = deque()
+        self.stats = {"logged": 0, "written": 0, "dropped": 0, "rotations": 0, "write_errors": 0}
+        self._day = self._file_day()
+        self._task: Optional[asyncio.Task] = None
+
+    def _file_day(self) -> Optional[str]:
+        try:
+            return datetime.fromtimestamp(os.path.getmtime(self.path), timezone.utc).strftime("%Y-%m-%d")
+        except OSError:
+            return None
+
+    def log(self, event: str, payload: Dict[str, Any]):
+        if len(self.buf) >= self.max_buffer:
+            self.stats["dropped"] += 1
+            return
+        self.buf.append(json.dumps({"ts": datetime.now(timezone.utc).isoformat(), "event": event, **payload},
+                                   ensure_ascii=False, default=str) + "\n")
+        self.stats["logged"] += 1
+        if len(self.buf) >= self.flush_lines:
+            self.worker.submit(self._key, self._flush)
+
+    def _take(self) -> List[str]:
+        lines = list(self.buf); self.buf.clear()
+        return lines
+
+    def _requeue(self, lines: List[str]):
+        room = max(0, self.max_buffer - len(self.buf))
+        self.stats["dropped"] += max(0, len(lines) - room)
+        self.buf.extendleft(reversed(lines[:room]))
+
+    async def _flush(self):
+        lines = self._take()
+        if not lines: return
+        try:
+            await self.worker.call(self._write, lines)
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            self._requeue(lines)
+            print(f"[audit] write failed, {len(lines)} events re-queued: {e}")
+
+    def _rotate(self):
+        day = self._day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        base = os.path.splitext(self.path)[0]
+        dst, n = f"{base}-{day}.jsonl.gz", 1
+        while os.path.exists(dst):
+            dst = f"{base}-{day}.{n}.jsonl.gz"; n += 1
+        with open(self.path, "rb") as src, gzip.open(dst, "wb") as out:
+            shutil.copyfileobj(src, out)
+        os.remove(self.path)
+        self.stats["rotations"] += 1
+
+    def _write(self, lines: List[str]):
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        if os.path.exists(self.path) and (self._day != today or os.path.getsize(self.path) >= self.rotate_bytes):
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+        self._day = today
+        self.stats["written"] += len(lines)
+
+    def start(self):
+        async def _loop():
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                if self.buf: self.worker.submit(self._key, self._flush)
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(_loop())
+
+    async def aclose(self):
+        if self._task: self._task.cancel()
+        if self.buf: self.worker.submit(self._key, self._flush)
+        await self.worker.flush()
+
+    def flush_sync(self):
+        """Last-chance write at interpreter exit (no loop, worker idle)."""
+        lines = self._take()
+        if lines:
+            try: self._write(lines)
+            except Exception as e: print(f"[audit] final write failed, {len(lines)} events lost: {e}")
+
+class JsonBackend:
+    name = "json"
+    needs_full = True  # commit() rewrites whole files, so it needs a snapshot of each dirty collection
+    sharded = SHARDED_COLLECTIONS  # ...except these, written key by key from the batch
+
+    def __init__(self, paths: Dict[str, str]):
+        self.paths = paths
+        self.archive = TicketArchive(paths["archive"])
+        self.deliveries = DeliveryJournal(paths["deliveries"], paths["deliveries_snapshot"])
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if "deliveries_legacy" in self.paths:
+            n = self.deliveries.migrate_legacy(self.paths["deliveries_legacy"])
+            if n: print(f"[store] migrated {n} deliveries into {self.paths['deliveries_snapshot']}")
+        for name in self.sharded:
+            legacy = f"{self.paths[name]}.json"
+            if os.path.exists(legacy):
+                # older versions kept the whole collection in one file: split it once
+                self._commit_shards(name, load_json(legacy, {}))
+                os.remove(legacy)
+        live, closed = {}, []
+        for t in load_json(self.paths["tickets"], []):
+            if t.get("status") == "open": live[str(t["id"])] = t
+            else: closed.append(t)
+        if closed:
+            # older tickets.json kept closed tickets forever: move them to the archive once
+            self.archive.append(closed)
+            save_json(self.paths["tickets"], list(live.values()))
+        data = {
+            "tickets": live,
+            "blacklist": load_json(self.paths["blacklist"], {}),
+            "links": {str(l["user"]): l for l in load_json(self.paths["links"], []) if "user" in l},
+        }
+        for name in KV_COLLECTIONS:
+            data[name] = load_shards(self.paths[name]) if name in self.sharded else load_json(self.paths[name], {})
+        return data
+
+    def _commit_shards(self, name: str, rows: Dict[str, Any]):
+        root = self.paths[name]
+        os.makedirs(root, exist_ok=True)
+        for key, value in rows.items():
+            path = os.path.join(root, f"{key}.json")
+            if value is not None: save_json(path, value)
+            elif os.path.exists(path): os.remove(path)
+
+    def commit(self, batch: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]]):
+        # whole-file format: any dirty key means the collection's file is rewritten
+        for name in batch:
+            if name in self.sharded:
+                self._commit_shards(name, batch[name])
+                continue
+            rows = current[name]
+            save_json(self.paths[name], list(rows.values()) if name in ("tickets", "links") else rows)
+
+    def archive_tickets(self, tickets: List[dict]):
+        self.archive.append(tickets)
+
+    def archived(self, tid: str) -> Optional[dict]:
+        return self.archive.get(tid)
+
+    def archived_by_opener(self, uid: int) -> List[dict]:
+        return self.archive.by_opener(uid)
+
+    def append_deliveries(self, records: List[dict]):
+        self.deliveries.append(records)
+
+    def iter_deliveries(self) -> Iterator[dict]:
+        yield from self.deliveries
+
+    def close(self):
+        pass
+
+class SqliteBackend:
+    name = "sqlite"
+    needs_full = False
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tickets (
+        id TEXT PRIMARY KEY, channel_id INTEGER, guild_id INTEGER, type TEXT, number INTEGER,
+        opener_id INTEGER, handler_id INTEGER, status TEXT, closed_at TEXT, data TEXT NOT NULL);
+    CREATE INDEX IF NOT EXISTS ix_tickets_channel ON tickets(channel_id);
+    CREATE INDEX IF NOT EXISTS ix_tickets_opener ON tickets(opener_id);
+    CREATE INDEX IF NOT EXISTS ix_tickets_status ON tickets(status);
+    CREATE TABLE IF NOT EXISTS deliveries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ts TEXT, data TEXT NOT NULL);
+    CREATE INDEX IF NOT EXISTS ix_deliveries_user_ts ON deliveries(user_id, ts);
+    CREATE INDEX IF NOT EXISTS ix_deliveries_ts ON deliveries(ts);
+    CREATE TABLE IF NOT EXISTS blacklist (user_id INTEGER, type TEXT, PRIMARY KEY (user_id, type)) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS links (user_id INTEGER PRIMARY KEY, thread_id INTEGER, data TEXT NOT NULL);
+    CREATE INDEX IF NOT EXISTS ix_links_thread ON links(thread_id);
+    CREATE TABLE IF NOT EXISTS kv (collection TEXT, key TEXT, value TEXT, PRIMARY KEY (collection, key)) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # one connection; all access goes through the PersistWorker thread (or happens before it starts)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _dump(v) -> str:
+        return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        q = self.db.execute
+        data: Dict[str, Dict[str, Any]] = {
+            "tickets": {r[0]: json.loads(r[1]) for r in q("SELECT id, data FROM tickets WHERE status = 'open'")},
+            "blacklist": {},
+            "links": {str(r[0]): json.loads(r[1]) for r in q("SELECT user_id, data FROM links")},
+        }
+        for uid, ttype in q("SELECT user_id, type FROM blacklist ORDER BY user_id, type"):
+            data["blacklist"].setdefault(str(uid), []).append(ttype)
+        for name in KV_COLLECTIONS:
+            data[name] = {k: json.loads(v) for k, v in q("SELECT key, value FROM kv WHERE collection = ?", (name,))}
+        return data
+
+    def _upsert_tickets(self, tickets: Iterable[dict]):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO tickets (id, channel_id, guild_id, type, number, opener_id, handler_id, status, closed_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(t["id"]), t.get("channel_id"), t.get("guild_id"), t.get("type"), t.get("number"), t.get("opener_id"),
+              t.get("handler_id"), t.get("status"), t.get("closed_at"), self._dump(t)) for t in tickets])
+
+    def commit(self, batch: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]]):
+        db = self.db
+        db.execute("BEGIN")
+        try:
+            for name, rows in batch.items():
+                if name == "tickets":
+                    # None = left the live set; archive_tickets() already recorded the closed row
+                    self._upsert_tickets(v for v in rows.values() if v is not None)
+                elif name == "blacklist":
+                    for uid, types in rows.items():
+                        db.execute("DELETE FROM blacklist WHERE user_id = ?", (int(uid),))
+                        db.executemany("INSERT INTO blacklist (user_id, type) VALUES (?, ?)", [(int(uid), t) for t in types or []])
+                elif name == "links":
+                    for uid, rec in rows.items():
+                        if rec is None: db.execute("DELETE FROM links WHERE user_id = ?", (int(uid),))
+                        else: db.execute("INSERT OR REPLACE INTO links (user_id, thread_id, data) VALUES (?, ?, ?)",
+                                         (int(uid), rec.get("thread_id"), self._dump(rec)))
+                else:
+                    for k, v in rows.items():
+                        if v is None: db.execute("DELETE FROM kv WHERE collection = ? AND key = ?", (name, k))
+                        else: db.execute("INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)", (name, k, self._dump(v)))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def archive_tickets(self, tickets: List[dict]):
+        with self.db:
+            self._upsert_tickets(tickets)
+
+    def archived(self, tid: str) -> Optional[dict]:
+        r = self.db.execute("SELECT data FROM tickets WHERE id = ? AND status != 'open'", (str(tid),)).fetchone()
+        return json.loads(r[0]) if r else None
+
+    def archived_by_opener(self, uid: int) -> List[dict]:
+        rows = self.db.execute("SELECT data FROM tickets WHERE opener_id = ? AND status != 'open' ORDER BY id", (int(uid),))
+        return [json.loads(r[0]) for r in rows]
+
+    def append_deliveries(self, records: List[dict]):
+        with self.db:
+            self.db.executemany("INSERT INTO deliveries (user_id, ts, data) VALUES (?, ?, ?)",
+                                [(r.get("user"), r.get("ts"), self._dump(r)) for r in records])
+
+    def iter_deliveries(self) -> Iterator[dict]:
+        for (data,) in self.db.execute("SELECT data FROM deliveries ORDER BY id"):
+            yield json.loads(data)
+
+    def close(self):
+        self.db.close()
+
+def make_backend(kind: Optional[str] = None, paths: Optional[Dict[str, str]] = None, sqlite_path: Optional[str] = None):
+    kind = (kind or os.getenv("STORAGE_BACKEND", "json")).strip().lower()
+    if kind == "json":
+        return JsonBackend({**DEFAULT_PATHS, **(paths or {})})
+    if kind == "sqlite":
+        return SqliteBackend(sqlite_path or os.getenv("SQLITE_PATH", "bot.db"))
+    raise ValueError(f"unknown STORAGE_BACKEND {kind!r} (expected json or sqlite)")
+
+class StateStore:
+    """In-memory view of tickets / blacklist / links / kv collections with write-behind flushing."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.dirty: Dict[str, Set[str]] = {}
+        self.tickets: Dict[str, dict] = {}
+        self._by_channel: Dict[int, str] = {}
+        self._by_opener: Dict[int, Set[str]] = {}
+        self.blacklist: Dict[str, List[str]] = {}
+        self.links: Dict[str, dict] = {}
+        self.kv: Dict[str, Dict[str, Any]] = {}
+        self._archive_pending: List[dict] = []
+        self._delivery_pending: List[dict] = []
+        self._inflight: Dict[str, List[dict]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.worker = PersistWorker()
+        self.load()
+
+    # ---------------------------------------------------------------- load / flush
+    def load(self):
+        data = self.backend.load()
+        self.tickets.clear(); self._by_channel.clear(); self._by_opener.clear()
+        for t in data["tickets"].values():
+            self._index_ticket(t)
+        self.blacklist = data["blacklist"]
+        self.links = data["links"]
+        self.kv = {name: data.get(name, {}) for name in KV_COLLECTIONS}
+        self.dirty.clear()
+
+    def _current(self) -> Dict[str, Dict[str, Any]]:
+        return {"tickets": self.tickets, "blacklist": self.blacklist, "links": self.links, **self.kv}
+
+    def pending(self) -> bool:
+        return bool(self.dirty or self._delivery_pending or self._archive_pending)
+
+    @staticmethod
+    def _copy(v):
+        return dict(v) if isinstance(v, dict) else list(v) if isinstance(v, list) else v
+
+    def _prepare(self) -> Dict[str, Any]:
+        """Detach everything pending and copy dirty rows (runs on the loop; cheap, no I/O)."""
+        deliveries, self._delivery_pending = self._delivery_pending, []
+        archive, self._archive_pending = [dict(t) for t in self._archive_pending], []
+        dirty, self.dirty = self.dirty, {}
+        cur = self._current()
+        batch = {name: {k: self._copy(cur[name].get(k)) for k in keys} for name, keys in dirty.items()}
+        full = None
+        if self.backend.needs_full:
+            full = {name: {k: self._copy(v) for k, v in cur[name].items()} for name in dirty if name not in self.backend.sharded}
+        self._inflight = {"deliveries": deliveries, "archive": archive}
+        return {"deliveries": deliveries, "archive": archive, "batch": batch, "full": full}
+
+    def _write(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Blocking half of a flush (runs on the writer thread). Returns whatever failed."""
+        failed: Dict[str, Any] = {}
+        if job["deliveries"]:
+            try:
+                self.backend.append_deliveries(job["deliveries"])
+            except Exception as e:
+                failed["deliveries"] = job["deliveries"]
+                print(f"[store] delivery append failed: {e}")
+        batch = job["batch"]
+        if job["archive"]:
+            # archive before rewriting the live set, so a crash in between never loses a ticket
+            try:
+                self.backend.archive_tickets(job["archive"])
+            except Exception as e:
+                failed["archive"] = job["archive"]
+                if "tickets" in batch:
+                    batch = {k: v for k, v in batch.items() if k != "tickets"}
+                    failed["batch"] = {"tickets": job["batch"]["tickets"]}
+                print(f"[store] archive failed: {e}")
+        if batch:
+            try:
+                self.backend.commit(batch, job["full"])
+            except Exception as e:
+                failed["batch"] = {**failed.get("batch", {}), **batch}
+                print(f"[store] flush failed: {e}")
+        return failed
+
+    def _restore(self, failed: Dict[str, Any]):
+        """Put failed work back so the next flush retries it (runs on the loop)."""
+        self._inflight = {}
+        self._delivery_pending = failed.get("deliveries", []) + self._delivery_pending
+        self._archive_pending = failed.get("archive", []) + self._archive_pending
+        for name, rows in failed.get("batch", {}).items():
+            self.dirty.setdefault(name, set()).update(rows)
+
+    def flush(self) -> int:
+        """Synchronous flush, for shutdown paths where the loop is gone (atexit)."""
+        job = self._prepare()
+        self._restore(self._write(job))
+        return len(job["batch"])
+
+    async def flush_async(self):
+        job = self._prepare()
+        try:
+            failed = await self.worker.call(self._write, job)
+        except BaseException:
+            self._restore({"deliveries": job["deliveries"], "archive": job["archive"], "batch": job["batch"]})
+            raise
+        self._restore(failed)
+
+    def mark(self, name: str, key):
+        self.dirty.setdefault(name, set()).add(str(key))
+
+    def schedule_flush(self):
+        self.worker.submit("store", self.flush_async)
+
+    async def sync(self):
+        """Awaitable flush point: everything mutated before this call is on disk when it returns."""
+        if self.pending(): self.schedule_flush()
+        await self.worker.flush()
+
+    def start_flusher(self, interval: float = 2.0):
+        self.worker.start()
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval)
+                if self.pending(): self.schedule_flush()
+        if not self._flusher or self._flusher.done():
+            self._flusher = asyncio.create_task(_loop())
+
+    async def aclose(self):
+        if self._flusher: self._flusher.cancel()
+        await self.sync()
+        await self.worker.aclose()
+
+    # ---------------------------------------------------------------- tickets
+    def _index_ticket(self, t: dict):
+        tid = str(t["id"])
+        old = self.tickets.get(tid)
+        if old is not None and old is not t:
+            self._unindex_ticket(old)
+        self.tickets[tid] = t
+        self._by_channel[int(t["channel_id"])] = tid
+        self._by_opener.setdefault(int(t["opener_id"]), set()).add(tid)
+
+    def _unindex_ticket(self, t: dict):
+        tid = str(t["id"])
+        if self._by_channel.get(int(t["channel_id"])) == tid:
+            self._by_channel.pop(int(t["channel_id"]), None)
+        ids = self._by_opener.get(int(t["opener_id"]))
+        if ids:
+            ids.discard(tid)
+            if not ids: self._by_opener.pop(int(t["opener_id"]), None)
+
+    def ticket(self, tid: str) -> Optional[dict]:
+        return self.tickets.get(str(tid))
+
+    def ticket_by_channel(self, cid: int) -> Optional[dict]:
+        tid = self._by_channel.get(int(cid))
+        return self.tickets.get(tid) if tid else None
+
+    def tickets_by_opener(self, uid: int) -> List[dict]:
+        return [self.tickets[i] for i in self._by_opener.get(int(uid), ())]
+
+    def open_tickets(self) -> List[dict]:
+        return [t for t in self.tickets.values() if t.get("status") == "open"]
+
+    def put_ticket(self, t: dict):
+        self._index_ticket(t)
+        self.mark("tickets", t["id"])
+
+    def archive_ticket(self, t: dict):
+        """Move a closed ticket out of the live set; it is written to the archive on the next flush."""
+        live = self.tickets.pop(str(t["id"]), None)
+        if live is not None: self._unindex_ticket(live)
+        t.setdefault("closed_at", datetime.now(timezone.utc).isoformat())
+        self._archive_pending.append(t)
+        self.mark("tickets", t["id"])
+
+    def find_ticket(self, tid: str) -> Optional[dict]:
+        """Live ticket first, then pending archive writes, then the archive."""
+        t = self.ticket(tid)
+        if t: return t
+        pending = self._archive_pending + self._inflight.get("archive", [])
+        t = next((p for p in pending if str(p["id"]) == str(tid)), None)
+        return t or self.backend.archived(tid)
+
+    def ticket_history(self, uid: int) -> List[dict]:
+        """Blocking (reads the archive): call through `await store.worker.call(...)` from handlers."""
+        pending = [p for p in self._archive_pending + self._inflight.get("archive", []) if int(p["opener_id"]) == int(uid)]
+        return self.tickets_by_opener(uid) + pending + self.backend.archived_by_opener(uid)
+
+    # ---------------------------------------------------------------- blacklist
+    def bl_types(self, uid: int) -> List[str]:
+        return self.blacklist.get(str(uid), [])
+
+    def bl_set(self, uid: int, types: Iterable[str]):
+        self.blacklist[str(uid)] = sorted(set(types))
+        self.mark("blacklist", uid)
+
+    # ---------------------------------------------------------------- counters
+    def next_counter(self, key: str) -> int:
+        # no await between read and write, so this is atomic on the event loop
+        counters = self.kv["counters"]
+        n = int(counters.get(key, 1))
+        counters[key] = n + 1
+        self.mark("counters", key)
+        return n
+
+    # ---------------------------------------------------------------- links
+    def link(self, uid: int) -> Optional[dict]:
+        return self.links.get(str(uid))
+
+    def set_link(self, uid: int, rec: dict):
+        self.links[str(uid)] = rec
+        self.mark("links", uid)
+
+    def drop_link(self, uid: int) -> bool:
+        if self.links.pop(str(uid), None) is None: return False
+        self.mark("links", uid)
+        return True
+
+    # ---------------------------------------------------------------- deliveries
+    def add_delivery(self, rec: dict):
+        self._delivery_pending.append(rec)
+
+    def iter_deliveries(self) -> Iterator[dict]:
+        """Stream every delivery ever logged (backend history, then unflushed). Blocking: run off the loop."""
+        yield from self.backend.iter_deliveries()
+        yield from list(self._inflight.get("deliveries", [])) + list(self._delivery_pending)
+
+    # ---------------------------------------------------------------- kv
+    def kv_get(self, name: str, key: str, default=None):
+        return self.kv[name].get(str(key), default)
+
+    def kv_set(self, name: str, key: str, value):
+        self.kv[name][str(key)] = value
+        self.mark(name, key)
+
+    def kv_del(self, name: str, key: str):
+        if self.kv[name].pop(str(key), None) is not None:
+            self.mark(name, key)
+
+    def panel_get(self, key: str, default=None):
+        return self.kv_get("panel", key, default)
+
+    def panel_set(self, key: str, value):
+        self.kv_set("panel", key, value)
+
+# --------------------------------------------------------------------------------------
+# CLI: JSON -> SQLite migration
+# --------------------------------------------------------------------------------------
+def migrate_json_to_sqlite(root: str, db_path: str, force: bool = False) -> Dict[str, int]:
+    """Copy the JSON files into SQLite. Read-only on the source: nothing is renamed, archived or rewritten."""
+    paths = {k: os.path.join(root, v) for k, v in DEFAULT_PATHS.items()}
+    dst = SqliteBackend(db_path)
+    if not force and dst.db.execute("SELECT EXISTS (SELECT 1 FROM deliveries UNION ALL SELECT 1 FROM tickets)").fetchone()[0]:
+        raise SystemExit(f"{db_path} already has data; pass --force to import anyway (deliveries would be duplicated)")
+    tickets = load_json(paths["tickets"], [])
+    data = {
+        "tickets": {str(t["id"]): t for t in tickets if t.get("status") == "open"},
+        "blacklist": load_json(paths["blacklist"], {}),
+        "links": {str(l["user"]): l for l in load_json(paths["links"], []) if "user" in l},
+    }
+    for name in KV_COLLECTIONS:
+        data[name] = load_shards(paths[name]) if name in SHARDED_COLLECTIONS else load_json(paths[name], {})
+    dst.commit({name: dict(rows) for name, rows in data.items()}, data)
+    counts = {name: len(rows) for name, rows in data.items()}
+    # closed tickets still in an older tickets.json go straight to the archive table
+    archived = list(TicketArchive(paths["archive"])) + [t for t in tickets if t.get("status") != "open"]
+    dst.archive_tickets(archived)
+    counts["archived_tickets"] = len(archived)
+    journal = DeliveryJournal(paths["deliveries"], paths["deliveries_snapshot"])
+    n, chunk = 0, []
+    for rec in itertools.chain(load_json(paths["deliveries_legacy"], []), journal):
+        chunk.append(rec)
+        if len(chunk) >= 5000:
+            dst.append_deliveries(chunk); n += len(chunk); chunk = []
+    dst.append_deliveries(chunk); n += len(chunk)
+    counts["deliveries"] = n
+    dst.close()
+    return counts
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="storage.py", description="Bot storage tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="copy the JSON files into a SQLite database")
+    m.add_argument("--root", default=".", help="directory holding the JSON files (default: .)")
+    m.add_argument("--db", default=os.getenv("SQLITE_PATH", "bot.db"), help="SQLite file (default: $SQLITE_PATH or bot.db)")
+    m.add_argument("--force", action="store_true", help="import even if the database already has rows")
+    args = ap.parse_args(argv)
+    if args.cmd == "migrate":
+        counts = migrate_json_to_sqlite(args.root, args.db, args.force)
+        for k, v in counts.items(): print(f"{k:>18}: {v}")
+        print(f"done -> {args.db}  (run the bot with STORAGE_BACKEND=sqlite SQLITE_PATH={args.db})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Ticket transcripts.
+
+- TranscriptSpool: bounded-memory sink that transcripts are written into (spooled temp
+  file, optionally gzip) with a small preview for transcripts that fit in an embed.
+- TicketLog: per-ticket local event log (transcripts/live/<channel_id>.jsonl) appended
+  from on_message / edit / delete as they happen, so closing a ticket only replays a
+  file that is already on disk instead of paging the channel history from Discord.
+- TranscriptArchive: every closed ticket's messages, gzip-compressed and stored under
+  their SHA-256 (transcripts/archive/), plus a SQLite full-text index over them for
+  /transcript_search. The index can always be rebuilt from the archive:
+
+    python transcripts.py reindex
+    python transcripts.py search "refund*" --user 1234 --type mc --since 2025-06-01
+"""
+
+import os, re, sys, json, gzip, time, sqlite3, hashlib, argparse, tempfile
+from typing import Optional, Dict, Any, List, Tuple, IO, Iterator
+
+from storage import PersistWorker, StateStore
+from attachments import describe
+
+CURSORS = "transcript_cursors"  # store kv collection: {channel_id: highest message id logged}
+
+def format_record(rec: Dict[str, Any], files: Optional[Dict[str, Dict[str, Any]]] = None) -> List[str]:
+    """Render one logged message the same way the history-based transcript does (files: url -> archived copy)."""
+    t = rec.get("ts") or "?"
+    author = f"{rec.get('author')} ({rec.get('author_id')})"
+    content = (rec.get("content") or "").replace("\r", "")
+    if rec.get("edited"): content += " (edited)"
+    if rec.get("deleted"): author += " [deleted]"
+    out = []
+    if content.strip(): out.append(f"[{t}] {author}: {content}")
+    for url in rec.get("attachments", []): out.append(f"[{t}] {author} [attachment]: {url}{describe(files.get(url)) if files else ''}")
+    for e in rec.get("embeds", []): out.append(f"[{t}] {author} [embed]: {e}".strip())
+    return out
+
+class TranscriptSpool:
+    """Blocking once it spills to disk, so the bot calls write() / emit() / finish() on the persist worker."""
+
+    def __init__(self, compress: bool = False, spool_bytes: int = 1024 * 1024, preview_max: int = 1800,
+                 archive: Optional["ArchiveWriter"] = None, files: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+b")
+        self.out = gzip.GzipFile(fileobj=self.spool, mode="wb") if compress else self.spool
+        self.compress = compress
+        self.preview_max = preview_max
+        self.preview: Optional[List[str]] = []
+        self.size = 0
+        self.archive = archive
+        self.files = files  # attachment url -> archived copy (attachments.AttachmentArchive.fetch_all)
+
+    def lines(self, rec: Dict[str, Any]) -> List[str]:
+        """format_record(rec), copying the record into the archive on the way if there is one."""
+        if self.archive is not None:
+            found = {u: self.files[u] for u in rec.get("attachments") or () if self.files and u in self.files}
+            self.archive.add({**rec, "files": found} if found else rec)
+        return format_record(rec, self.files)
+
+    def write(self, recs: List[Dict[str, Any]], header: Optional[List[str]] = None):
+        """One buffered page of records (after `header`, if given), archived and rendered."""
+        if header: self.emit(header)
+        self.emit([line for rec in recs for line in self.lines(rec)])
+
+    def emit(self, lines: List[str]):
+        if not lines: return
+        chunk = "\n".join(lines) + "\n"
+        self.out.write(chunk.encode("utf-8"))
+        self.size += len(chunk)
+        if self.preview is not None:
+            self.preview.extend(lines)
+            if self.size > self.preview_max: self.preview = None
+
+    def finish(self) -> Tuple[IO[bytes], Optional[str]]:
+        """Returns (file rewound to 0, full text if it fits in preview_max else None)."""
+        if self.compress: self.out.close()  # writes the gzip trailer; spool itself stays open
+        self.spool.seek(0)
+        return self.spool, ("\n".join(self.preview) if self.preview is not None else None)
+
+class TicketLog:
+    """
+    transcripts/live/<channel_id>.jsonl, one event per line:
+      {"op": "create", "id", "ts", "author", "author_id", "content", "attachments", "embeds"}
+      {"op": "edit", "id", "content"}   {"op": "delete", "id"}
+
+    Events are buffered and appended by the persist worker. A channel is "tracked" once
+    it has a cursor in the store: its log is complete up to the cursor, so callers only
+    fetch history after it to cover downtime (mark_synced() after such a backfill).
+    The cursor only moves once the lines it covers are on disk. Untracked channels still
+    log live events, but their transcript comes from history.
+    """
+
+    def __init__(self, root: str, worker: PersistWorker, store: StateStore):
+        self.root = root
+        self.worker = worker
+        self.store = store
+        self._buf: Dict[int, List[str]] = {}
+        self._cursors: Dict[int, int] = {}  # cursor each channel reaches once _buf is written
+
+    def path(self, cid: int) -> str:
+        return os.path.join(self.root, f"{int(cid)}.jsonl")
+
+    def tracked(self, cid: int) -> bool:
+        return self.store.kv_get(CURSORS, cid) is not None
+
+    def cursor(self, cid: int) -> Optional[int]:
+        c = self.store.kv_get(CURSORS, cid)
+        return int(c) if c else None
+
+    def begin(self, cid: int):
+        """Start tracking a channel whose complete history will arrive through append()."""
+        if not self.tracked(cid): self.store.kv_set(CURSORS, cid, 0)
+
+    def _advance(self, cid: int, mid: int):
+        if mid > self._cursors.get(cid, 0): self._cursors[cid] = mid
+
+    def append(self, cid: int, rec: Dict[str, Any]):
+        self._buf.setdefault(int(cid), []).append(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+        if rec.get("op") == "create" and self.tracked(cid): self._advance(int(cid), int(rec["id"]))
+        self.worker.submit("ticket_log", self._flush)
+
+    def mark_synced(self, cid: int, last_id: Optional[int]):
+        """Everything up to last_id has been appended (after a backfill); tracked from now on."""
+        self.begin(cid)
+        self._advance(int(cid), int(last_id or 0))
+        self.worker.submit("ticket_log", self._flush)
+
+    async def _flush(self):
+        bufs, self._buf = self._buf, {}
+        cursors, self._cursors = self._cursors, {}
+        if bufs: await self.worker.call(self._write, bufs)
+        # after the write: a crash before it leaves the cursor behind, so those messages are fetched again
+        for cid, mid in cursors.items():
+            if self.tracked(cid) and mid > (self.cursor(cid) or 0): self.store.kv_set(CURSORS, cid, mid)
+
+    def _write(self, bufs: Dict[int, List[str]]):
+        os.makedirs(self.root, exist_ok=True)
+        for cid, lines in bufs.items():
+            with open(self.path(cid), "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+
+    def _events(self, cid: int) -> Iterator[Dict[str, Any]]:
+        path = self.path(cid)
+        if not os.path.exists(path): return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+
+    def _render(self, cid: int, header: List[str], spool: TranscriptSpool) -> Tuple[IO[bytes], Optional[str]]:
+        # pass 1: only edits / deletes and the create order are kept in memory
+        edits: Dict[str, str] = {}
+        deleted = set()
+        ids: List[int] = []
+        for ev in self._events(cid):
+            op = ev.get("op")
+            if op == "edit": edits[str(ev["id"])] = ev.get("content", "")
+            elif op == "delete": deleted.add(str(ev["id"]))
+            elif op == "create": ids.append(int(ev["id"]))
+        spool.emit(header)
+        # backfill can append older messages after newer live ones; only then sort in memory
+        in_order = all(a < b for a, b in zip(ids, ids[1:]))
+        creates = self._creates(cid) if in_order else iter(sorted(
+            {int(r["id"]): r for r in self._creates(cid)}.values(), key=lambda r: int(r["id"])))
+        page: List[str] = []
+        for rec in creates:
+            mid = str(rec["id"])
+            if mid in edits: rec = {**rec, "content": edits[mid], "edited": True}
+            if mid in deleted: rec = {**rec, "deleted": True}
+            page.extend(spool.lines(rec))
+            if len(page) >= 100:
+                spool.emit(page); page = []
+        spool.emit(page)
+        return spool.finish()
+
+    def _creates(self, cid: int) -> Iterator[Dict[str, Any]]:
+        return (ev for ev in self._events(cid) if ev.get("op") == "create")
+
+    async def finalize(self, cid: int, header: List[str], spool: TranscriptSpool) -> Tuple[IO[bytes], Optional[str]]:
+        """Write out buffered events, then replay the log into `spool` on the writer thread."""
+        if self._buf: self.worker.submit("ticket_log", self._flush)
+        await self.worker.flush()
+        return await self.worker.call(self._render, cid, header, spool)
+
+    async def attachments(self, cid: int) -> List[Tuple[int, str]]:
+        """(message id, url) for every attachment logged in the channel, deleted messages included."""
+        if self._buf: self.worker.submit("ticket_log", self._flush)
+        await self.worker.flush()
+        return await self.worker.call(
+            lambda: [(int(ev["id"]), u) for ev in self._creates(cid) for u in ev.get("attachments") or ()])
+
+    def drop(self, cid: int):
+        self.store.kv_del(CURSORS, cid)
+        self._buf.pop(int(cid), None)
+        self._cursors.pop(int(cid), None)
+        path = self.path(cid)
+        async def _rm():
+            await self.worker.call(lambda: os.path.exists(path) and os.remove(path))
+        self.worker.submit(f"ticket_log_drop:{int(cid)}", _rm)
+
+# --------------------------------------------------------------------------------------
+# Archive + search index
+# --------------------------------------------------------------------------------------
+def _dumps(obj) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")) + "\n").encode("utf-8")
+
+class ArchiveWriter:
+    """
+    One transcript on its way into the archive: a {"ticket": meta} line, then one message
+    record per line, gzipped into a temp file while the uncompressed bytes are hashed.
+    TranscriptArchive.commit() moves it to its content address. Blocking, like the rest
+    of the archive: create, fill and abort it on the persist worker.
+    """
+
+    def __init__(self, root: str, meta: Dict[str, Any]):
+        os.makedirs(root, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=root, suffix=".tmp")
+        self._raw = os.fdopen(fd, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb", mtime=0)  # mtime=0: same content, same bytes
+        self._hash = hashlib.sha256()
+        self.messages = 0
+        self._write({"ticket": meta})
+
+    def _write(self, obj):
+        b = _dumps(obj)
+        self._hash.update(b)
+        self._gz.write(b)
+
+    def add(self, rec: Dict[str, Any]):
+        self._write(rec)
+        self.messages += 1
+
+    def close(self) -> str:
+        if not self._raw.closed:
+            self._gz.close()
+            self._raw.close()
+        return self._hash.hexdigest()
+
+    def abort(self):
+        self.close()
+        try: os.remove(self.tmp)
+        except FileNotFoundError: pass
+
+_TOKEN_RE = re.compile(r"\w+\*?")
+
+class TranscriptArchive:
+    """
+    transcripts/archive/<sha[:2]>/<sha>.jsonl.gz, written once and never modified (a
+    transcript identical to one already stored is not written again), and index.db:
+
+      docs     one row per ticket (latest transcript): type, number, close day, lines' rowid range
+      authors  (author_id, ticket_id) -> messages, for "everything user X said"
+      lines    FTS5 table, one row per message: text, embeds, attachment names and hashes
+               (plain table + LIKE if FTS5 is missing)
+
+    All methods are blocking; the bot runs them on the persist worker thread, which also
+    owns the SQLite connection.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        ticket_id TEXT PRIMARY KEY, sha TEXT NOT NULL, type TEXT, number INTEGER, opener_id INTEGER,
+        closed_at TEXT, day TEXT, messages INTEGER, first_row INTEGER, last_row INTEGER);
+    CREATE INDEX IF NOT EXISTS ix_docs_day ON docs(day);
+    CREATE TABLE IF NOT EXISTS authors (
+        author_id INTEGER, ticket_id TEXT, messages INTEGER, PRIMARY KEY (author_id, ticket_id)) WITHOUT ROWID;
+    """
+    FTS = ("CREATE VIRTUAL TABLE IF NOT EXISTS lines USING fts5(content, author UNINDEXED, author_id UNINDEXED, "
+           "ticket_id UNINDEXED, ts UNINDEXED, tokenize='unicode61 remove_diacritics 2')")
+    PLAIN = "CREATE TABLE IF NOT EXISTS lines (content TEXT, author TEXT, author_id INTEGER, ticket_id TEXT, ts TEXT)"
+
+    def __init__(self, root: str, index_path: Optional[str] = None):
+        self.root = root
+        self.index_path = index_path or os.path.join(os.path.dirname(root.rstrip("/\\")) or ".", "index.db")
+        self._conn: Optional[sqlite3.Connection] = None
+        self.fts = True
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], f"{sha}.jsonl.gz")
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+            try:
+                db.execute(self.FTS)
+            except sqlite3.OperationalError:  # sqlite built without FTS5
+                db.execute(self.PLAIN)
+                self.fts = False
+            self._conn = db
+        return self._conn
+
+    def close(self):
+        if self._conn is not None: self._conn.close(); self._conn = None
+
+    def writer(self, meta: Dict[str, Any]) -> ArchiveWriter:
+        return ArchiveWriter(self.root, meta)
+
+    def commit(self, w: ArchiveWriter) -> str:
+        """Store the finished transcript under its hash and index it. Returns the hash."""
+        sha = w.close()
+        path = self.path(sha)
+        if os.path.exists(path):
+            os.remove(w.tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(w.tmp, path)
+        self.index(sha)
+        return sha
+
+    def read(self, sha: str) -> Iterator[Dict[str, Any]]:
+        """The {"ticket": meta} line, then the message records."""
+        with gzip.open(self.path(sha), "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+
+    def index(self, sha: str) -> bool:
+        """(Re)index one archived transcript; a ticket's older transcript is replaced, a newer one kept."""
+        recs = self.read(sha)
+        meta = next(recs)["ticket"]
+        tid = str(meta["ticket_id"])
+        closed_at = meta.get("closed_at") or ""
+        db = self._db()
+        row = db.execute("SELECT sha, closed_at, first_row, last_row FROM docs WHERE ticket_id = ?", (tid,)).fetchone()
+        if row and (row[0] == sha or (row[1] or "") > closed_at): return False
+        db.execute("BEGIN")
+        try:
+            if row:
+                db.execute("DELETE FROM lines WHERE rowid BETWEEN ? AND ?", (row[2], row[3]))
+                db.execute("DELETE FROM authors WHERE ticket_id = ?", (tid,))
+            first = last = None
+            counts: Dict[int, int] = {}
+            for rec in recs:
+                text = " ".join([rec.get("content") or ""] + list(rec.get("embeds") or []) +
+                                [u.rsplit("/", 1)[-1].split("?", 1)[0] for u in rec.get("attachments") or []] +
+                                [f["sha256"] for f in (rec.get("files") or {}).values() if "sha256" in f]).strip()
+                aid = int(rec.get("author_id") or 0)
+                counts[aid] = counts.get(aid, 0) + 1
+                if not text: continue
+                cur = db.execute("INSERT INTO lines (content, author, author_id, ticket_id, ts) VALUES (?, ?, ?, ?, ?)",
+                                 (text, rec.get("author"), aid, tid, rec.get("ts")))
+                last = cur.lastrowid
+                if first is None: first = last
+            db.executemany("INSERT INTO authors (author_id, ticket_id, messages) VALUES (?, ?, ?)",
+                           [(a, tid, n) for a, n in counts.items()])
+            db.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (tid, sha, meta.get("type"), meta.get("number"), meta.get("opener_id"), closed_at,
+                        closed_at[:10], sum(counts.values()), first or 0, last or -1))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return True
+
+    def rebuild(self) -> int:
+        """Drop the index and re-read every transcript in the archive."""
+        db = self._db()
+        for table in ("docs", "authors", "lines"): db.execute(f"DELETE FROM {table}")
+        n = 0
+        for d, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".jsonl.gz"):
+                    self.index(name[:-len(".jsonl.gz")]); n += 1
+        return n
+
+    def indexed(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query: str = "", author_id: Optional[int] = None, ttype: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Tickets with messages matching every word of `query` (word* for a prefix), most
+        matching messages first, with one snippet each; without a query, the latest
+        tickets `author_id` wrote in. since / until are YYYY-MM-DD close days (until exclusive).
+        """
+        db = self._db()
+        words = _TOKEN_RE.findall(query or "")
+        where, args = [], []
+        if ttype: where.append("d.type = ?"); args.append(ttype)
+        if since: where.append("d.day >= ?"); args.append(since)
+        if until: where.append("d.day < ?"); args.append(until)
+        cols = "d.ticket_id, d.type, d.number, d.closed_at, d.messages"
+        if not words:
+            if author_id is None: return []
+            sql = (f"SELECT {cols}, a.messages FROM authors a JOIN docs d ON d.ticket_id = a.ticket_id "
+                   f"WHERE {' AND '.join(['a.author_id = ?'] + where)} ORDER BY d.closed_at DESC LIMIT ?")
+            return [{"ticket_id": r[0], "type": r[1], "number": r[2], "closed_at": r[3], "messages": r[4],
+                     "hits": r[5], "snippet": None} for r in db.execute(sql, [author_id] + args + [limit])]
+        if self.fts:
+            match = " ".join('"%s"%s' % (w.rstrip("*"), "*" if w.endswith("*") else "") for w in words)
+            cond, params, snip = ["lines MATCH ?"], [match], "snippet(lines, 0, '**', '**', '…', 16)"
+        else:
+            cond, params, snip = ["l.content LIKE ?"] * len(words), ["%" + w.rstrip("*") + "%" for w in words], "substr(l.content, 1, 160)"
+        if author_id is not None: cond.append("l.author_id = ?"); params.append(author_id)
+        # rank tickets inside SQLite; snippets only for the tickets returned
+        sql = (f"SELECT {cols}, COUNT(*), d.first_row, d.last_row FROM lines l JOIN docs d ON d.ticket_id = l.ticket_id "
+               f"WHERE {' AND '.join(cond + where)} GROUP BY d.ticket_id ORDER BY COUNT(*) DESC, d.closed_at DESC LIMIT ?")
+        snip_sql = f"SELECT {snip}, l.author FROM lines l WHERE {' AND '.join(cond)} AND l.rowid BETWEEN ? AND ? LIMIT 1"
+        out = []
+        for r in db.execute(sql, params + args + [limit]).fetchall():
+            s = db.execute(snip_sql, params + [r[6], r[7]]).fetchone()
+            out.append({"ticket_id": r[0], "type": r[1], "number": r[2], "closed_at": r[3], "messages": r[4],
+                        "hits": r[5], "snippet": f"{s[1]}: {s[0]}" if s else None})
+        return out
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="transcripts.py", description="Transcript archive tools.")
+    ap.add_argument("--dir", default="transcripts/archive", help="archive directory (default: transcripts/archive)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("reindex", help="rebuild index.db from the archived transcripts")
+    q = sub.add_parser("search", help="find tickets by words / author / type / close day")
+    q.add_argument("query", nargs="?", default="")
+    q.add_argument("--user", type=int, help="author id")
+    q.add_argument("--type", choices=("gs", "mc", "shr"))
+    q.add_argument("--since", help="YYYY-MM-DD, inclusive")
+    q.add_argument("--until", help="YYYY-MM-DD, exclusive")
+    q.add_argument("--limit", type=int, default=20)
+    args = ap.parse_args(argv)
+    arc = TranscriptArchive(args.dir)
+    t0 = time.perf_counter()
+    if args.cmd == "reindex":
+        n = arc.rebuild()
+        print(f"{n} transcripts indexed -> {arc.index_path} in {time.perf_counter() - t0:.2f}s")
+        return 0
+    hits = arc.search(args.query, args.user, args.type, args.since, args.until, args.limit)
+    for h in hits:
+        print(f"{h['ticket_id']}  {(h['type'] or '?').upper()} #{h['number']}  {(h['closed_at'] or '')[:10]}  "
+              f"{h['hits']} hit(s)" + (f"  {h['snippet']}" if h["snippet"] else ""))
+    print(f"({len(hits)} tickets, {(time.perf_counter() - t0) * 1000:.1f}ms)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())